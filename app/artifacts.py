@@ -0,0 +1,172 @@
+"""
+Files of the reviews of the web interface.
+
+Every review gets a directory for its uploaded PDF, the converted markdown and the exported reports. A janitor
+thread removes the directories of reviews that were not used for a while, and the least recently used ones
+once the store grows beyond its size limit. Reviews that are still queued or running are never removed.
+"""
+import os
+import re
+import shutil
+import threading
+import time
+from logging import getLogger
+from typing import Callable, Collection, List, Optional, Tuple
+
+logger = getLogger(__name__)
+
+UPLOAD_NAME = "upload.pdf"
+MARKDOWN_NAME = "proposal.md"
+
+REVIEW_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+class ArtifactStore:
+    """
+    Directory with one subdirectory per review, bounded by max_bytes and by ttl seconds since the last change.
+
+    Files are written atomically, so the janitor and readers never see partial files.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        self.removed_reviews = 0
+        self.removed_bytes = 0
+        self.cleanups = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def review_dir(self, review_id: str) -> str:
+        if not REVIEW_ID_PATTERN.match(review_id):
+            raise ValueError(f"Invalid review ID: {review_id!r}")
+        return os.path.join(self.directory, review_id)
+
+    def path(self, review_id: str, name: str) -> str:
+        """Return the path of the file of the review, creating the directory of the review."""
+        review_dir = self.review_dir(review_id)
+        os.makedirs(review_dir, exist_ok=True)
+        return os.path.join(review_dir, name)
+
+    def write(self, review_id: str, name: str, content: str) -> str:
+        """Write a text file of the review and return its path."""
+        path = self.path(review_id, name)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.replace(temp_path, path)
+        return path
+
+    def copy(self, review_id: str, name: str, source: str) -> str:
+        """Copy a file into the directory of the review and return its path."""
+        path = self.path(review_id, name)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, path)
+        return path
+
+    def remove(self, review_id: str, name: str):
+        try:
+            os.remove(os.path.join(self.review_dir(review_id), name))
+        except FileNotFoundError:
+            pass
+
+    def remove_review(self, review_id: str):
+        """Remove the directory of the review with all its files."""
+        with self._lock:
+            shutil.rmtree(self.review_dir(review_id), ignore_errors=True)
+
+    def _reviews(self) -> List[Tuple[float, int, int, str]]:
+        """Return the last change, size in bytes, number of files and ID of each review."""
+        reviews = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            try:
+                changed_at = entry.stat().st_mtime
+                size = files = 0
+                for file in os.scandir(entry.path):
+                    stat = file.stat()
+                    changed_at = max(changed_at, stat.st_mtime)
+                    size += stat.st_size
+                    files += 1
+            except FileNotFoundError:
+                continue
+            reviews.append((changed_at, size, files, entry.name))
+        return reviews
+
+    def cleanup(self, active: Collection[str] = ()) -> int:
+        """
+        Remove the reviews unchanged for ttl seconds, then the least recently changed ones until the store is
+        below max_bytes. Reviews in active are kept. Returns the number of bytes removed.
+        """
+        with self._lock:
+            reviews = sorted(self._reviews())
+            total_size = sum(size for _, size, _, _ in reviews)
+            expired_before = time.time() - self.ttl
+            removed_bytes = 0
+            for changed_at, size, _, review_id in reviews:
+                if changed_at >= expired_before and total_size <= self.max_bytes:
+                    break
+                if review_id in active:
+                    continue
+                shutil.rmtree(os.path.join(self.directory, review_id), ignore_errors=True)
+                total_size -= size
+                removed_bytes += size
+                self.removed_reviews += 1
+                logger.debug(f"Removed the files of review {review_id}")
+            self.removed_bytes += removed_bytes
+            self.cleanups += 1
+        return removed_bytes
+
+    def stats(self) -> dict:
+        """Disk usage of the store and the totals removed by the janitor."""
+        reviews = self._reviews()
+        with self._lock:
+            return {
+                "reviews": len(reviews),
+                "files": sum(files for _, _, files, _ in reviews),
+                "bytes": sum(size for _, size, _, _ in reviews),
+                "max_bytes": self.max_bytes,
+                "removed_reviews": self.removed_reviews,
+                "removed_bytes": self.removed_bytes,
+                "cleanups": self.cleanups,
+            }
+
+    def start_janitor(
+        self,
+        interval: float,
+        active: Optional[Callable[[], Collection[str]]] = None,
+        prune: Optional[Callable[[float], int]] = None,
+    ):
+        """
+        Run cleanup now and every interval seconds in a background thread, keeping the reviews returned by active.
+
+        prune is called with the ttl before each cleanup to remove the records of expired reviews kept elsewhere,
+        i.e. finished jobs.
+        """
+        def run():
+            # The first cleanup removes what expired while the app was not running
+            while True:
+                try:
+                    if prune is not None:
+                        prune(self.ttl)
+                    self.cleanup(active() if active is not None else ())
+                    logger.info(f"Artifacts: {self.stats()}")
+                except Exception:
+                    logger.exception("Cleaning up the artifacts failed")
+                if self._stopped.wait(interval):
+                    return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=run, name="artifact-janitor", daemon=True)
+        self._thread.start()
+
+    def stop_janitor(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
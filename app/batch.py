@@ -0,0 +1,280 @@
+"""
+Headless batch review of many proposals, i.e. at the end of a semester.
+
+Usage:
+    poetry run review-batch proposals/ --output-dir reports/
+    poetry run review-batch "submissions/**/*.pdf" --workers 4 --concurrency 8
+    poetry run review-batch proposals/ --batch-api --poll-interval 300
+
+PDFs are converted in a process pool and reviewed with at most --concurrency proposals in flight. With
+--batch-api, all reviewer requests are instead submitted as one OpenAI Batch API job, which trades latency
+for throughput and cost. Each proposal gets a JSON and a text report in the output directory, at the path of
+the PDF relative to the directory containing all inputs, so proposals with the same file name in different
+directories keep their own reports. Finished proposals are recorded in a progress file in the output
+directory, so rerunning the same command after a crash only processes the remaining proposals.
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+from typing import List
+
+from app.batch_api import review_with_batch_api
+from app.models import share_rate_limits, validate_models
+from app.models.scheduler import llm_call_context, set_default_priority
+from app.pdf_converter import convert_pdf_to_clean_markdown
+from app.report import collect_issues, format_feedback_for_text
+from app.reviewers import REVIEWERS, review_cache, review_chain, run_local_reviewers
+from app.settings import settings
+
+logger = getLogger(__name__)
+
+PROGRESS_FILE_NAME = "progress.jsonl"
+BATCH_STATE_FILE_NAME = "batch_job.json"
+
+
+def find_pdfs(inputs: List[str]) -> List[str]:
+    """Expand directories and glob patterns to a sorted list of PDF paths without duplicates."""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.update(glob.glob(os.path.join(item, "**", "*.pdf"), recursive=True))
+        else:
+            paths.update(path for path in glob.glob(item, recursive=True) if path.lower().endswith(".pdf"))
+    return sorted(paths)
+
+
+def _init_worker(processes: int):
+    set_default_priority("batch")
+    share_rate_limits(processes)
+
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def load_progress(output_dir: str) -> dict:
+    """Return the content hashes of all proposals already reviewed into output_dir."""
+    finished = {}
+    try:
+        with open(os.path.join(output_dir, PROGRESS_FILE_NAME), encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a partially written last line
+                    continue
+                finished[record["pdf"]] = record["sha256"]
+    except FileNotFoundError:
+        pass
+    return finished
+
+
+def _write_atomic(path: str, content: str):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(content)
+    os.replace(temp_path, path)
+
+
+class BatchReviewer:
+    """Reviews a batch of PDFs and writes one JSON and one text report per proposal."""
+
+    def __init__(
+        self, output_dir: str, workers: int, concurrency: int, batch_api: bool = False, poll_interval: float = 60
+    ):
+        self.output_dir = output_dir
+        self.workers = workers
+        self.concurrency = concurrency
+        self.batch_api = batch_api
+        self.poll_interval = poll_interval
+        self.progress_lock = asyncio.Lock()
+        self.results = []
+        # Deepest directory containing all PDFs, reports mirror the directories below it
+        self.input_root = None
+
+    async def run(self, pdf_paths: List[str]):
+        os.makedirs(self.output_dir, exist_ok=True)
+        finished = load_progress(self.output_dir)
+        if pdf_paths:
+            self.input_root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in pdf_paths])
+        loop = asyncio.get_running_loop()
+
+        pending = []
+        for path in pdf_paths:
+            sha256 = await loop.run_in_executor(None, file_sha256, path)
+            if finished.get(os.path.abspath(path)) == sha256:
+                self.results.append({"pdf": path, "status": "skipped"})
+            else:
+                pending.append((path, sha256))
+        logger.info(f"Reviewing {len(pending)} proposals, skipping {len(pdf_paths) - len(pending)} finished ones")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        # Spawn instead of fork, the parent process already runs threads (i.e. for Langfuse)
+        context = multiprocessing.get_context("spawn")
+        # The conversion workers call the image and format models while this process calls the review models,
+        # each process gets an equal share of the rate limits of the providers
+        processes = self.workers + 1
+        share_rate_limits(processes)
+        with ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context, initializer=_init_worker, initargs=(processes,)
+        ) as pool:
+            if self.batch_api:
+                await self._review_with_batch_api(pool, pending)
+            else:
+                await asyncio.gather(*(self._review(pool, semaphore, path, sha256) for path, sha256 in pending))
+
+    async def _review(self, pool: ProcessPoolExecutor, semaphore: asyncio.Semaphore, path: str, sha256: str):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            proposal = await loop.run_in_executor(pool, convert_pdf_to_clean_markdown, path)
+            converted = time.perf_counter()
+            async with semaphore:
+                with llm_call_context(priority="batch", review_id=path):
+                    result = await review_chain.ainvoke({"proposal": proposal})
+            issues = collect_issues(result)
+            self._write_reports(path, issues)
+        except Exception as e:
+            logger.exception(f"Failed to review {path}")
+            self.results.append({"pdf": path, "status": "failed", "error": str(e)})
+            return
+
+        await self._record_finished(path, sha256, len(issues), converted - start, time.perf_counter() - start)
+
+    async def _review_with_batch_api(self, pool: ProcessPoolExecutor, pending: List[tuple]):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+
+        async def convert(path):
+            try:
+                return await loop.run_in_executor(pool, convert_pdf_to_clean_markdown, path)
+            except Exception as e:
+                logger.exception(f"Failed to convert {path}")
+                self.results.append({"pdf": path, "status": "failed", "error": str(e)})
+                return None
+
+        paths = [path for path, _ in pending]
+        converted_proposals = await asyncio.gather(*(convert(path) for path in paths))
+        proposals = {path: proposal for path, proposal in zip(paths, converted_proposals) if proposal is not None}
+        converted = time.perf_counter()
+
+        state_path = os.path.join(self.output_dir, BATCH_STATE_FILE_NAME)
+        results = await loop.run_in_executor(None, review_with_batch_api, proposals, state_path, self.poll_interval)
+
+        for path, sha256 in pending:
+            if path not in proposals:
+                continue
+            missing = [name for name in REVIEWERS if name not in results[path]]
+            if missing:
+                self.results.append({"pdf": path, "status": "failed", "error": f"No results for reviewers {missing}"})
+                continue
+            # The Batch API only runs the model reviewers
+            issues = collect_issues({**run_local_reviewers(proposals[path]), **results[path]})
+            self._write_reports(path, issues)
+            await self._record_finished(path, sha256, len(issues), converted - start, time.perf_counter() - start)
+
+    def _write_reports(self, path: str, issues: List[dict]):
+        report_name = os.path.splitext(os.path.relpath(os.path.abspath(path), self.input_root))[0]
+        report_path = os.path.join(self.output_dir, report_name)
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        _write_atomic(f"{report_path}.txt", format_feedback_for_text(issues))
+        _write_atomic(f"{report_path}.json", json.dumps(issues, indent=2))
+
+    async def _record_finished(
+        self, path: str, sha256: str, issue_count: int, conversion_seconds: float, total_seconds: float
+    ):
+        record = {
+            "pdf": os.path.abspath(path),
+            "sha256": sha256,
+            "issues": issue_count,
+            "conversion_seconds": round(conversion_seconds, 2),
+            "total_seconds": round(total_seconds, 2),
+        }
+        async with self.progress_lock:
+            with open(os.path.join(self.output_dir, PROGRESS_FILE_NAME), "a", encoding="utf-8") as file:
+                file.write(json.dumps(record) + "\n")
+        self.results.append({**record, "pdf": path, "status": "done"})
+        logger.info(f"Reviewed {path}: {issue_count} issues in {record['total_seconds']}s")
+
+
+def format_summary(results: List[dict], wall_seconds: float) -> str:
+    """Format the throughput summary of a batch run."""
+    done = [result for result in results if result["status"] == "done"]
+    failed = [result for result in results if result["status"] == "failed"]
+    skipped = [result for result in results if result["status"] == "skipped"]
+
+    lines = [
+        "BATCH REVIEW SUMMARY",
+        "=" * 50,
+        f"Reviewed: {len(done)}  Skipped: {len(skipped)}  Failed: {len(failed)}",
+        f"Wall time: {wall_seconds:.1f}s",
+    ]
+    if done:
+        lines.append(f"Throughput: {len(done) / wall_seconds * 60:.2f} proposals/min")
+        lines.append(
+            f"Average latency: {sum(result['total_seconds'] for result in done) / len(done):.1f}s per proposal "
+            f"({sum(result['conversion_seconds'] for result in done) / len(done):.1f}s conversion)"
+        )
+        lines.append(f"Issues found: {sum(result['issues'] for result in done)}")
+    for result in failed:
+        lines.append(f"FAILED {result['pdf']}: {result['error']}")
+    return "\n".join(lines)
+
+
+def main():
+    """Entry point of the review-batch command."""
+    parser = argparse.ArgumentParser(description="Review a batch of proposal PDFs without the web interface.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("--output-dir", default="reports", help="Directory for the reports (default: reports)")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Processes converting PDFs (default: CPU count)"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Proposals reviewed by the LLM at the same time (default: 4)"
+    )
+    parser.add_argument(
+        "--batch-api",
+        action="store_true",
+        help="Submit all reviewer requests as one OpenAI Batch API job instead of reviewing interactively",
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=60, help="Seconds between Batch API status checks (default: 60)"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s [%(name)s]: %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
+
+    pdf_paths = find_pdfs(args.inputs)
+    if not pdf_paths:
+        parser.error("No PDF files found")
+    try:
+        validate_models([settings.MODEL_NAME, settings.IMAGE_MODEL_NAME, settings.FORMAT_MODEL_NAME])
+    except EnvironmentError as e:
+        parser.error(str(e))
+
+    reviewer = BatchReviewer(args.output_dir, args.workers, args.concurrency, args.batch_api, args.poll_interval)
+    start = time.perf_counter()
+    asyncio.run(reviewer.run(pdf_paths))
+    print(format_summary(reviewer.results, time.perf_counter() - start))
+    if review_cache is not None:
+        logger.info(f"Review cache: {review_cache.stats()}")
+
+    if any(result["status"] == "failed" for result in reviewer.results):
+        sys.exit(1)
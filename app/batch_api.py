@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import time
+from logging import getLogger
+from typing import Dict, List, Tuple
+
+import openai
+from langchain_core.messages import convert_to_openai_messages
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from app.models.http_client import get_http_client
+from app.reviewers import (
+    REVIEWERS,
+    FeedbackIssueList,
+    review_cache,
+    route_proposal_to_reviewers,
+    review_cache_key,
+    stream_feedback_issues,
+)
+from app.settings import settings
+
+logger = getLogger(__name__)
+
+FINAL_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def create_batch_client():
+    """
+    Create the OpenAI client for the Batch API of the provider in MODEL_NAME.
+
+    If BATCH_API_BASE_URL is set, the client talks to that server instead, i.e. a local stand-in.
+    """
+    provider_name, model_name = settings.MODEL_NAME.split(":", 1)
+    if settings.BATCH_API_BASE_URL:
+        return openai.OpenAI(
+            base_url=settings.BATCH_API_BASE_URL,
+            api_key=settings.OPENAI_API_KEY or "local",
+            http_client=get_http_client(),
+        )
+    if provider_name == "openai":
+        return openai.OpenAI(api_key=settings.OPENAI_API_KEY, http_client=get_http_client())
+    if provider_name == "azure_openai":
+        return openai.AzureOpenAI(
+            api_key=settings.AZURE_OPENAI_API_KEY,
+            azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
+            api_version=settings.OPENAI_API_VERSION,
+            http_client=get_http_client(),
+        )
+    raise EnvironmentError(f"Model provider '{provider_name}' does not support the Batch API")
+
+
+def _response_format() -> dict:
+    # Same schema as the structured output of issue_model
+    function = convert_to_openai_tool(FeedbackIssueList)["function"]
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": function["name"],
+            "description": function["description"],
+            "schema": function["parameters"],
+        },
+    }
+
+
+def prepare_batch_requests(proposals: Dict[str, str]) -> Tuple[List[dict], Dict[str, tuple], Dict[str, dict]]:
+    """
+    Compile the reviewer requests of all proposals into Batch API requests.
+
+    Reviewer results already in the review cache are not requested again.
+
+    Args:
+        proposals (Dict[str, str]): Proposal id -> proposal markdown.
+
+    Returns:
+        The batch requests, custom_id -> (proposal id, reviewer name, cache key) of each request, and
+        proposal id -> reviewer name -> FeedbackIssueList of the cached results.
+    """
+    model_name = settings.MODEL_NAME.split(":", 1)[1]
+    response_format = _response_format()
+    prompts = {name: get_prompt() for name, get_prompt in REVIEWERS.items()}
+
+    requests = []
+    targets = {}
+    results = {proposal_id: {} for proposal_id in proposals}
+    for proposal_id, proposal in proposals.items():
+        for name, inputs in route_proposal_to_reviewers({"proposal": proposal}).items():
+            # Local reviewers run without a model next to the batch
+            if name not in REVIEWERS:
+                continue
+            cache_key = review_cache_key(name, prompts[name], inputs) if review_cache is not None else None
+            cached = review_cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                results[proposal_id][name] = FeedbackIssueList.model_validate_json(cached)
+                continue
+
+            custom_id = f"request-{len(requests)}"
+            targets[custom_id] = (proposal_id, name, cache_key)
+            requests.append({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model_name,
+                    "messages": convert_to_openai_messages(prompts[name].invoke(inputs).to_messages()),
+                    "response_format": response_format,
+                },
+            })
+    return requests, targets, results
+
+
+def submit_batch(client, requests: List[dict]) -> str:
+    """Upload the requests as a JSONL file and create a batch for it, returning the batch id."""
+    content = "".join(json.dumps(request) + "\n" for request in requests).encode()
+    input_file = client.files.create(file=("reviews.jsonl", content), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    logger.info(f"Submitted batch {batch.id} with {len(requests)} requests")
+    return batch.id
+
+
+def wait_for_batch(client, batch_id: str, poll_interval: float):
+    """Poll the batch until it reaches a final status and return it."""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in FINAL_BATCH_STATUSES:
+            return batch
+        counts = batch.request_counts
+        progress = f" ({counts.completed}/{counts.total} done)" if counts else ""
+        logger.info(f"Batch {batch_id} is {batch.status}{progress}")
+        time.sleep(poll_interval)
+
+
+def _parse_batch_output(content: str) -> Dict[str, FeedbackIssueList]:
+    results = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            logger.warning(f"Batch request {record.get('custom_id')} failed: {record.get('error') or response}")
+            continue
+        message_content = response["body"]["choices"][0]["message"]["content"]
+        issues = list(stream_feedback_issues([json.loads(message_content)]))
+        results[record["custom_id"]] = FeedbackIssueList(issues=issues)
+    return results
+
+
+def _requests_digest(requests: List[dict]) -> str:
+    return hashlib.sha256(json.dumps(requests, sort_keys=True).encode()).hexdigest()
+
+
+def review_with_batch_api(proposals: Dict[str, str], state_path: str, poll_interval: float = 60):
+    """
+    Review all proposals through the Batch API, blocking until the batch is done.
+
+    The batch id is stored at state_path, so rerunning with the same proposals resumes polling the
+    submitted batch instead of submitting it again.
+
+    Returns:
+        Dict[str, Dict[str, FeedbackIssueList]]: Proposal id -> reviewer name -> issues. Reviewers whose
+        request failed are missing.
+    """
+    requests, targets, results = prepare_batch_requests(proposals)
+    cached_count = sum(len(reviewer_results) for reviewer_results in results.values())
+    logger.info(f"Submitting {len(requests)} reviewer requests, {cached_count} results are cached")
+    if not requests:
+        return results
+
+    client = create_batch_client()
+    digest = _requests_digest(requests)
+    batch_id = None
+    try:
+        with open(state_path, encoding="utf-8") as file:
+            state = json.load(file)
+        if state["digest"] == digest:
+            batch_id = state["batch_id"]
+            logger.info(f"Resuming batch {batch_id}")
+    except FileNotFoundError:
+        pass
+
+    if batch_id is None:
+        batch_id = submit_batch(client, requests)
+        with open(state_path, "w", encoding="utf-8") as file:
+            json.dump({"batch_id": batch_id, "digest": digest}, file)
+
+    batch = wait_for_batch(client, batch_id, poll_interval)
+    if batch.status != "completed":
+        os.remove(state_path)
+        raise RuntimeError(f"Batch {batch_id} ended with status '{batch.status}'")
+
+    if batch.output_file_id:
+        outputs = _parse_batch_output(client.files.content(batch.output_file_id).text)
+    else:
+        outputs = {}
+    for custom_id, feedback_list in outputs.items():
+        proposal_id, name, cache_key = targets[custom_id]
+        results[proposal_id][name] = feedback_list
+        if cache_key is not None:
+            review_cache.set(cache_key, feedback_list.model_dump_json())
+
+    os.remove(state_path)
+    return results
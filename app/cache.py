@@ -0,0 +1,204 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from logging import getLogger
+from typing import Optional
+
+logger = getLogger(__name__)
+
+
+class CacheBackend(ABC):
+    """
+    Abstract base class for key-value caches of text values.
+
+    Subclasses implement the storage, the base class keeps track of hits and misses.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a value and record the lookup as a hit or miss.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Optional[str]: The cached value, or None if the key is not cached.
+        """
+        value = self._get(key)
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[str]:
+        """
+        Retrieve the value stored for key without recording statistics.
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str):
+        """
+        Store value for key, evicting other entries if the cache is full.
+        """
+        pass
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+class LRUCache(CacheBackend):
+    """
+    In-process cache keeping the max_entries most recently used values.
+    """
+
+    def __init__(self, max_entries: int):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Persistent cache stored in a single SQLite database file.
+
+    If max_entries is set, the least recently used entries are evicted once the cache grows beyond it.
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = None):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed_at REAL NOT NULL)"
+            )
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def set(self, key: str, value: str):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, accessed_at) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            if self.max_entries is not None:
+                self._connection.execute(
+                    "DELETE FROM cache WHERE key NOT IN "
+                    "(SELECT key FROM cache ORDER BY accessed_at DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+
+
+class DiskCache(CacheBackend):
+    """
+    Persistent key-value cache storing each text value in its own file.
+
+    Keys are hashed to file names, so any string can be used as a key. Writes go through a temporary
+    file and an atomic rename, which keeps the cache consistent when several threads or processes
+    write the same key concurrently.
+
+    If max_size_bytes is set, the least recently used entries are evicted once the total size of the
+    cache exceeds it. Reads refresh the modification time of an entry to mark it as recently used.
+    """
+
+    def __init__(self, directory: str, max_size_bytes: Optional[int] = None):
+        super().__init__()
+        self.directory = directory
+        self.max_size_bytes = max_size_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def _get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as file:
+                value = file.read()
+        except FileNotFoundError:
+            return None
+
+        if self.max_size_bytes is not None:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+        return value
+
+    def set(self, key: str, value: str):
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(value)
+        os.replace(temp_path, path)
+
+        if self.max_size_bytes is not None:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            logger.debug(f"Evicted cache entry {path}")
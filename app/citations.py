@@ -0,0 +1,268 @@
+import re
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+from app.feedback import FeedbackIssue
+from app.sections import NUMBERING_PATTERN, ProposalSection, format_outline, segment_proposal
+
+# Rules quoted from how-to-scientific-writing.md and the bibliography requirements
+CROSS_CHECK_RULE = (
+    "Regularly cross-check in-text citations with the bibliography to ensure all sources are listed and "
+    "correctly referenced."
+)
+STYLE_RULE = "Use a consistent citation style throughout the thesis (ideally alpha with [ABC12])."
+QUANTITY_RULE = "The bibliography should contain at least 6-8 citations."
+DUPLICATE_RULE = "Clean up your bibliography to avoid duplicate or incorrect information."
+
+MIN_REFERENCES = 6
+
+# Alpha keys ("[ABC12]", "[Doe+20a]") and numeric keys ("[3]")
+ALPHA_KEY_PATTERN = re.compile(r'^[A-Z][A-Za-z+]{0,7}\d{2}[a-z]?$')
+NUMERIC_KEY_PATTERN = re.compile(r'^\d{1,3}$')
+NUMERIC_RANGE_PATTERN = re.compile(r'^(\d{1,3})\s*[-–]\s*(\d{1,3})$')
+# Bracketed text that is not a markdown link or image, i.e. "[ABC12, DEF13]" or "[3-5]"
+BRACKET_PATTERN = re.compile(r'(?<!!)\[([^\[\]\n]{1,120})\](?!\()')
+# A reference entry starting with its key, optionally as a list item
+KEYED_ENTRY_PATTERN = re.compile(r'^\s*(?:[-*+]\s+|\d{1,3}\.\s+)?\[([^\[\]\n]{1,20})\]\s*(.*)$')
+LIST_ENTRY_PATTERN = re.compile(r'^\s*(?:[-*+]|\d{1,3}\.)\s+(.*)$')
+URL_PATTERN = re.compile(r'https?://\S+|www\.\S+')
+# Numeric ranges longer than this are more likely years or numbers than citations
+MAX_RANGE_LENGTH = 20
+
+
+class Reference(BaseModel):
+    """An entry of the reference list, key is None for entries without a citation key."""
+    key: Optional[str] = None
+    text: str
+    start: int
+
+
+class CitationLocation(BaseModel):
+    """An in-text citation of a key."""
+    start: int
+    section: str
+
+
+class CitationAnalysis(BaseModel):
+    """The reference list of the proposal, the in-text citations per key and the issues found."""
+    bibliography_found: bool
+    references: List[Reference]
+    citations: Dict[str, List[CitationLocation]]
+    issues: List[FeedbackIssue]
+
+    def citations_per_section(self) -> Dict[str, int]:
+        counts = {}
+        for locations in self.citations.values():
+            for location in locations:
+                counts[location.section] = counts.get(location.section, 0) + 1
+        return counts
+
+
+def _is_key(key: str) -> bool:
+    return bool(ALPHA_KEY_PATTERN.match(key) or NUMERIC_KEY_PATTERN.match(key))
+
+
+def _citation_keys(content: str) -> List[str]:
+    """Return the keys cited by the content of a bracket, an empty list if it is not a citation."""
+    keys = []
+    for part in re.split(r'[,;]', content):
+        part = part.strip()
+        numeric_range = NUMERIC_RANGE_PATTERN.match(part)
+        if numeric_range and 0 < int(numeric_range.group(2)) - int(numeric_range.group(1)) <= MAX_RANGE_LENGTH:
+            first, last = int(numeric_range.group(1)), int(numeric_range.group(2))
+            keys.extend(str(number) for number in range(first, last + 1))
+        elif _is_key(part):
+            keys.append(part)
+        elif not keys:
+            return []
+        # Anything after the keys is a note, i.e. the page in "[ABC12, p. 3]"
+    return keys
+
+
+def _section_title(section: Optional[ProposalSection]) -> str:
+    if section is None:
+        return "General"
+    return NUMBERING_PATTERN.sub("", section.title.replace("*", "")).strip() or section.title
+
+
+def _parse_references(text: str, offset: int) -> List[Reference]:
+    """Parse the reference list, one entry per keyed line or, without keys, per list item or paragraph."""
+    lines = []
+    position = offset
+    for line in text.split("\n"):
+        lines.append((position, line))
+        position += len(line) + 1
+    keyed = any(
+        (entry := KEYED_ENTRY_PATTERN.match(line)) and _is_key(entry.group(1).strip()) for _, line in lines
+    )
+
+    references = []
+    previous_blank = True
+    for start, line in lines:
+        if not line.strip() or line.lstrip().startswith("#"):
+            previous_blank = True
+            continue
+        entry = KEYED_ENTRY_PATTERN.match(line)
+        list_entry = LIST_ENTRY_PATTERN.match(line)
+        if entry and _is_key(entry.group(1).strip()):
+            references.append(Reference(key=entry.group(1).strip(), text=entry.group(2).strip(), start=start))
+        elif references and (keyed or not (previous_blank or list_entry)):
+            # Keyed entries span lines and paragraphs until the next key, others end at blank lines
+            references[-1].text = (references[-1].text + " " + line.strip()).strip()
+        else:
+            references.append(Reference(text=(list_entry.group(1) if list_entry else line).strip(), start=start))
+        previous_blank = False
+    return references
+
+
+def _issue(priority: str, issue: str, suggestion: str, rule: str, quote: Optional[str] = None) -> FeedbackIssue:
+    return FeedbackIssue(
+        section="Bibliography", category="Citations", priority=priority, quote=quote, issue=issue,
+        suggestion=suggestion, rule=rule,
+    )
+
+
+def _keys(keys) -> str:
+    return ", ".join(f"[{key}]" for key in keys)
+
+
+def _find_issues(analysis: CitationAnalysis) -> List[FeedbackIssue]:
+    if not analysis.bibliography_found:
+        return [_issue(
+            "Very High", "No bibliography section was found.",
+            "Add a bibliography section with the references cited in the proposal.", QUANTITY_RULE,
+        )]
+
+    issues = []
+    references = analysis.references
+    if len(references) < MIN_REFERENCES:
+        issues.append(_issue(
+            "High", f"The bibliography contains only {len(references)} references.",
+            f"Cite at least {MIN_REFERENCES} peer-reviewed publications relevant to the proposal.", QUANTITY_RULE,
+        ))
+
+    keys = [reference.key for reference in references if reference.key is not None]
+    if references and not keys:
+        issues.append(_issue(
+            "Medium", "The references have no citation keys, so in-text citations cannot be matched to them.",
+            "Use the alpha citation style, i.e. [ABC12] in the text and as the key of the reference.", STYLE_RULE,
+        ))
+    elif keys:
+        numeric = [key for key in keys if NUMERIC_KEY_PATTERN.match(key)]
+        if numeric and len(numeric) < len(keys):
+            issues.append(_issue(
+                "Medium", f"The bibliography mixes numeric keys ({_keys(numeric[:3])}) and alpha keys.",
+                "Use alpha keys such as [ABC12] for all references.", STYLE_RULE,
+            ))
+        elif numeric:
+            issues.append(_issue(
+                "Low", "The bibliography uses numeric citation keys instead of the alpha style.",
+                "Switch to the alpha citation style, i.e. [ABC12].", STYLE_RULE,
+            ))
+        unkeyed = [reference for reference in references if reference.key is None]
+        if unkeyed:
+            issues.append(_issue(
+                "Medium", f"References without a citation key: {len(unkeyed)}.",
+                "Give every reference a key in the same style as the others.", STYLE_RULE,
+                quote=unkeyed[0].text[:200],
+            ))
+
+        duplicates = sorted({key for key in keys if keys.count(key) > 1})
+        if duplicates:
+            issues.append(_issue(
+                "Medium", f"Keys used for more than one reference: {_keys(duplicates)}.",
+                "Remove duplicate references or give each reference a unique key.", DUPLICATE_RULE,
+            ))
+
+        missing = [key for key in analysis.citations if key not in keys]
+        if missing:
+            location = analysis.citations[missing[0]][0]
+            issues.append(_issue(
+                "High", f"Cited in the text but missing from the bibliography: {_keys(missing)} "
+                f"(first cited in {location.section}).",
+                "Add the missing references to the bibliography or correct the citation keys.", CROSS_CHECK_RULE,
+            ))
+        uncited = [reference for reference in references if reference.key is not None
+                   and reference.key not in analysis.citations]
+        if uncited:
+            issues.append(_issue(
+                "Medium", f"References never cited in the text: {_keys(reference.key for reference in uncited)}.",
+                "Cite each reference where it supports the text, or remove it from the bibliography.",
+                CROSS_CHECK_RULE, quote=uncited[0].text[:200],
+            ))
+    return issues
+
+
+def analyze_citations(markdown: str) -> CitationAnalysis:
+    """
+    Parse the reference list and the in-text citations of the proposal.
+
+    Builds the index from each cited key to its locations and reports the issues code can verify: a missing
+    or short bibliography, citation keys not in the alpha style, citations missing from the bibliography,
+    references that are never cited and duplicate keys.
+    """
+    sections = segment_proposal(markdown)
+    bibliography = next((section for section in sections if section.name == "bibliography"), None)
+    references = []
+    if bibliography is not None:
+        references = _parse_references(markdown[bibliography.start:bibliography.end], bibliography.start)
+
+    citations = {}
+    starts = [section.start for section in sections]
+    for match in BRACKET_PATTERN.finditer(markdown):
+        if bibliography is not None and bibliography.start <= match.start() < bibliography.end:
+            continue
+        keys = _citation_keys(match.group(1))
+        if not keys:
+            continue
+        # The innermost section starting before the citation
+        index = next((i for i in range(len(starts) - 1, -1, -1) if starts[i] <= match.start()), None)
+        section = _section_title(sections[index] if index is not None else None)
+        for key in keys:
+            citations.setdefault(key, []).append(CitationLocation(start=match.start(), section=section))
+
+    analysis = CitationAnalysis(
+        bibliography_found=bibliography is not None, references=references, citations=citations, issues=[]
+    )
+    analysis.issues = _find_issues(analysis)
+    return analysis
+
+
+def lint_citations(markdown: str) -> List[FeedbackIssue]:
+    """Return the issues of the bibliography and the in-text citations that code can verify."""
+    return analyze_citations(markdown).issues
+
+
+def format_bibliography_review_input(markdown: str) -> Optional[str]:
+    """
+    Build the input of the bibliography reviewer: the outline, the findings of the analysis and the
+    reference list, instead of the whole proposal.
+
+    Returns None if no bibliography was found, the reviewer should then get the whole proposal.
+    """
+    analysis = analyze_citations(markdown)
+    if not analysis.bibliography_found or not analysis.references:
+        return None
+
+    sections = segment_proposal(markdown)
+    findings = [f"- {issue.issue}" for issue in analysis.issues] or ["- No problems found."]
+    per_section = analysis.citations_per_section()
+    distribution = ", ".join(f"{section}: {count}" for section, count in per_section.items()) or "none"
+    uncited = {reference.key for reference in analysis.references if reference.key not in analysis.citations}
+    reference_list = "\n".join(
+        f"- {'[' + reference.key + '] ' if reference.key else ''}{reference.text}"
+        + (" (never cited)" if reference.key in uncited and reference.key is not None else "")
+        + (" (contains a URL)" if URL_PATTERN.search(reference.text) else "")
+        for reference in analysis.references
+    )
+    return (
+        "Outline of the full proposal:\n"
+        + format_outline(sections)
+        + "\n\nAutomatic analysis of the citations, already reported to the author:\n"
+        + "\n".join(findings)
+        + f"\n- {len(analysis.references)} references, {len(analysis.citations)} distinct keys cited in the text"
+        + f"\n- In-text citations per section: {distribution}"
+        + "\n\nReference list of the proposal:\n\n"
+        + reference_list
+        + "\n"
+    )
@@ -0,0 +1,76 @@
+import re
+from typing import Iterable, Optional, List
+from pydantic import BaseModel, Field
+
+
+class FeedbackIssue(BaseModel):
+    """A specific feedback issue in a proposal section."""
+    section: str = Field(default=None, description="The section this feedback relates to")
+    category: str = Field(
+        description="Category of the issue (e.g., 'Clarity', 'Structure', 'Content', 'Grammar', 'Citations')"
+    )
+    priority: str = Field(description="Priority of the issue: 'Very Low', 'Low', 'Medium', 'High', 'Very High'")
+    quote: Optional[str] = Field(
+        default=None, description="A direct quote from the text illustrating the issue, if applicable"
+    )
+    issue: str = Field(description="Description of the issue identified")
+    suggestion: str = Field(description="Specific suggestion for addressing the issue")
+    rule: Optional[str] = Field(
+        default=None, description="The academic writing rule or guideline being applied, if relevant"
+    )
+
+
+class FeedbackIssueList(BaseModel):
+    """A list of feedback issues."""
+    issues: List[FeedbackIssue] = Field(description="List of feedback issues identified in the section")
+
+
+class FeedbackIssueChunk(FeedbackIssueList):
+    """
+    Issues streamed by a reviewer, final is set on the last chunk of the reviewer.
+
+    When a revision is reviewed, status marks issues of the previous review that are "carried_over" or
+    "resolved", it is None for the issues of this review.
+    """
+    final: bool = False
+    status: Optional[str] = None
+
+    def __add__(self, other: "FeedbackIssueChunk") -> "FeedbackIssueChunk":
+        return FeedbackIssueChunk(
+            issues=self.issues + other.issues,
+            final=self.final or other.final,
+            status=self.status if self.status == other.status else None,
+        )
+
+
+# Issues without distinct quotes are duplicates if this share of the words of their descriptions is the same
+DUPLICATE_SIMILARITY = 0.6
+
+
+def _words(text: Optional[str]) -> set:
+    return set(re.findall(r'\w+', (text or "").casefold()))
+
+
+def is_duplicate_issue(issue: FeedbackIssue, other: FeedbackIssue) -> bool:
+    """
+    Whether two issues of a reviewer report the same problem, i.e. when the chunks of a long input both
+    report it. Issues quoting different text are distinct, the same problem in two places is reported twice.
+    """
+    if issue.category.casefold() != other.category.casefold():
+        return False
+    if issue.quote and other.quote:
+        quote, other_quote = " ".join(issue.quote.split()).casefold(), " ".join(other.quote.split()).casefold()
+        if quote not in other_quote and other_quote not in quote:
+            return False
+    words, other_words = _words(issue.issue), _words(other.issue)
+    return len(words & other_words) >= DUPLICATE_SIMILARITY * len(words | other_words)
+
+
+def merge_feedback_issues(issues: List[FeedbackIssue], new_issues: Iterable[FeedbackIssue]) -> List[FeedbackIssue]:
+    """Append the new issues that are not duplicates of an earlier issue to issues, returning the appended ones."""
+    merged = []
+    for issue in new_issues:
+        if not any(is_duplicate_issue(issue, other) for other in issues):
+            issues.append(issue)
+            merged.append(issue)
+    return merged
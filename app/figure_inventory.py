@@ -0,0 +1,275 @@
+import re
+from typing import Dict, List, Literal, Optional, Sequence, Tuple
+import pymupdf
+from pydantic import BaseModel
+
+INVENTORY_START = "<<< FIGURE INVENTORY START >>>"
+INVENTORY_END = "<<< FIGURE INVENTORY END >>>"
+INVENTORY_BLOCK_PATTERN = re.compile(
+    r"\n*" + re.escape(INVENTORY_START) + r"\n(.*?)\n" + re.escape(INVENTORY_END) + r"\n?", re.DOTALL
+)
+
+# "Figure 3: ...", "Fig. 2.1 ...", "Table 1 ..." at the start of a text block
+CAPTION_PATTERN = re.compile(
+    r'^(Figure|Fig\.|Table|Tab\.|Listing|Abbildung|Abb\.|Tabelle)\s*(\d+(?:\.\d+)*)\b', re.IGNORECASE
+)
+# "Figure 3", "Fig. 2.1", "Table 1" anywhere in the text
+MENTION_PATTERN = re.compile(
+    r'\b(Figures?|Figs?\.|Tables?|Tab\.|Listings?|Abbildung(?:en)?|Abb\.|Tabellen?)\s*(\d+(?:\.\d+)*)',
+    re.IGNORECASE,
+)
+LABEL_KINDS = {"fig": "Figure", "abb": "Figure", "tab": "Table", "lis": "Listing"}
+
+# Same limit as pymupdf4llm, which does not extract images with an edge below 5% of the page edge
+MIN_EDGE_RATIO = 0.05
+# Images covering less of the page, or repeated on this many pages, are logos, icons or decoration
+DECORATIVE_AREA_RATIO = 0.02
+DECORATIVE_REPEATED_PAGES = 3
+# Vector clusters need this many paths inside them, a single frame or background box is no figure
+MIN_VECTOR_PATHS = 3
+# Maximum vertical distance between a figure and its caption, in points
+CAPTION_DISTANCE = 50
+MAX_CAPTION_LENGTH = 150
+# Raster images rendered below this resolution look blurry in print
+LOW_RESOLUTION_DPI = 150
+# Tolerance when matching images to the inventory by their bounding box, in points
+SIZE_TOLERANCE = 2
+
+
+class FigureItem(BaseModel):
+    """A raster image, vector graphic or table found in the PDF, the page is 1-based."""
+    page: int
+    kind: Literal["raster", "vector", "table"]
+    bbox: Tuple[float, float, float, float]
+    pixel_width: Optional[int] = None
+    pixel_height: Optional[int] = None
+    dpi: Optional[int] = None
+    rows: Optional[int] = None
+    columns: Optional[int] = None
+    label: Optional[str] = None
+    caption: Optional[str] = None
+    decorative: bool = False
+
+    @property
+    def width(self) -> float:
+        return self.bbox[2] - self.bbox[0]
+
+    @property
+    def height(self) -> float:
+        return self.bbox[3] - self.bbox[1]
+
+
+class Caption(BaseModel):
+    page: int
+    label: str
+    text: str
+    bbox: Tuple[float, float, float, float]
+
+
+class FigureInventory(BaseModel):
+    """The figures and tables of a PDF with their captions and the pages mentioning each label."""
+    items: List[FigureItem]
+    captions: List[Caption]
+    mentions: Dict[str, List[int]]
+
+    def find(self, page: int, bbox: Sequence[float]) -> Optional[FigureItem]:
+        """Return the raster image or vector graphic with the given bounding box on the page, if any."""
+        return next(
+            (
+                item for item in self.items
+                if item.page == page and item.kind != "table"
+                and all(abs(coordinate - other) <= SIZE_TOLERANCE for coordinate, other in zip(item.bbox, bbox))
+            ),
+            None,
+        )
+
+    def format(self) -> str:
+        """Format the inventory as compact context for a reviewer."""
+        lines = []
+        for item in self.items:
+            if item.decorative:
+                continue
+            if item.kind == "raster":
+                details = f"raster image, {item.pixel_width}x{item.pixel_height}px at {item.dpi} dpi"
+                if item.dpi < LOW_RESOLUTION_DPI:
+                    details += " (low resolution)"
+            elif item.kind == "vector":
+                details = "vector graphic"
+            else:
+                details = f"table, {item.rows} rows x {item.columns} columns"
+            caption = f'caption "{item.caption}"' if item.caption else "no caption"
+            if item.label is None:
+                referenced = "unlabeled"
+            elif self.mentions.get(item.label):
+                referenced = "referenced on page " + ", ".join(str(page) for page in self.mentions[item.label])
+            else:
+                referenced = "never referenced in the text"
+            lines.append(
+                f"- {item.label or 'Unlabeled'} (page {item.page}): {details}, "
+                f"{item.width:.0f}x{item.height:.0f}pt, {caption}, {referenced}"
+            )
+
+        figures = [item for item in self.items if item.kind != "table" and not item.decorative]
+        tables = [item for item in self.items if item.kind == "table"]
+        decorative = len([item for item in self.items if item.decorative])
+        summary = (
+            f"figures: {len(figures)} ({len([item for item in figures if item.kind == 'vector'])} vector, "
+            f"{len([item for item in figures if item.kind == 'raster'])} raster), tables: {len(tables)}"
+        )
+        if decorative:
+            summary += f", decorative images left out: {decorative} (logos, icons)"
+        lines.append(f"- Total {summary}")
+
+        found = {item.label for item in self.items if item.label is not None}
+        orphan_captions = [caption for caption in self.captions if caption.label not in found]
+        if orphan_captions:
+            lines.append("- Captions without a detected figure or table: " + ", ".join(
+                f"{caption.label} (page {caption.page})" for caption in orphan_captions
+            ))
+        captioned = found | {caption.label for caption in self.captions}
+        missing = [label for label in self.mentions if label not in captioned]
+        if missing:
+            lines.append("- Referenced in the text but not found: " + ", ".join(
+                f"{label} (page {self.mentions[label][0]})" for label in missing
+            ))
+        return "\n".join(lines)
+
+
+def _label(kind: str, number: str) -> str:
+    return f"{LABEL_KINDS[kind[:3].lower()]} {number}"
+
+
+def _bbox(rect) -> Tuple[float, float, float, float]:
+    return tuple(round(value, 1) for value in rect)
+
+
+def _vertical_gap(rect: pymupdf.Rect, other: pymupdf.Rect) -> float:
+    return max(other.y0 - rect.y1, rect.y0 - other.y1, 0)
+
+
+def _raster_items(page: pymupdf.Page, number: int) -> List[Tuple[FigureItem, str]]:
+    """Return the raster images of the page with the digest of their content."""
+    items = []
+    for info in page.get_image_info(hashes=True):
+        rect = pymupdf.Rect(info["bbox"]) & page.rect
+        if rect.width < page.rect.width * MIN_EDGE_RATIO or rect.height < page.rect.height * MIN_EDGE_RATIO:
+            continue
+        # Resolution the image is rendered at, which decides how sharp it looks in print
+        dpi = round(min(info["width"] / rect.width, info["height"] / rect.height) * 72)
+        item = FigureItem(
+            page=number, kind="raster", bbox=_bbox(rect), pixel_width=info["width"], pixel_height=info["height"],
+            dpi=dpi, decorative=rect.get_area() < page.rect.get_area() * DECORATIVE_AREA_RATIO,
+        )
+        items.append((item, info["digest"].hex()))
+    return items
+
+
+def _vector_items(page: pymupdf.Page, number: int, avoid: Sequence[pymupdf.Rect]) -> List[FigureItem]:
+    """Return the clusters of vector drawings of the page that are not tables, frames or background boxes."""
+    paths = [path for path in page.get_drawings() if path["rect"] in page.rect]
+    items = []
+    for cluster in page.cluster_drawings(drawings=paths):
+        if cluster.width < page.rect.width * MIN_EDGE_RATIO or cluster.height < page.rect.height * MIN_EDGE_RATIO:
+            continue
+        if cluster.get_area() > page.rect.get_area() * 0.9:
+            continue
+        if any((cluster & rect).get_area() > cluster.get_area() * 0.5 for rect in avoid):
+            continue
+        inner = [path for path in paths if path["rect"] in cluster and path["rect"] != cluster]
+        if len(inner) < MIN_VECTOR_PATHS:
+            continue
+        items.append(FigureItem(page=number, kind="vector", bbox=_bbox(cluster)))
+    return items
+
+
+def _table_items(page: pymupdf.Page, number: int, tables: Optional[Sequence[dict]]) -> List[FigureItem]:
+    if tables is None:
+        tables = [
+            {"bbox": table.bbox, "rows": table.row_count, "columns": table.col_count}
+            for table in page.find_tables().tables
+        ]
+    return [
+        FigureItem(page=number, kind="table", bbox=_bbox(table["bbox"]), rows=table["rows"], columns=table["columns"])
+        for table in tables
+    ]
+
+
+def _assign_captions(items: Sequence[FigureItem], captions: Sequence[Caption]):
+    """Assign each caption to the nearest uncaptioned figure or table above or below it on its page."""
+    for caption in captions:
+        caption_rect = pymupdf.Rect(caption.bbox)
+        candidates = [
+            item for item in items
+            if item.page == caption.page and item.caption is None and not item.decorative
+            and caption_rect.x0 < item.bbox[2] and caption_rect.x1 > item.bbox[0]
+            and _vertical_gap(caption_rect, pymupdf.Rect(item.bbox)) <= CAPTION_DISTANCE
+        ]
+        # Prefer a table for a table caption and a figure for a figure caption
+        candidates.sort(key=lambda item: (
+            (item.kind == "table") != caption.label.startswith("Table"),
+            _vertical_gap(caption_rect, pymupdf.Rect(item.bbox)),
+        ))
+        if candidates:
+            candidates[0].caption = caption.text
+            candidates[0].label = caption.label
+
+
+def build_figure_inventory(
+    document: pymupdf.Document, tables: Optional[Sequence[Sequence[dict]]] = None
+) -> FigureInventory:
+    """
+    List the raster images, vector graphics and tables of the PDF with their captions and text mentions.
+
+    Tables are taken from the bbox, rows and columns of the tables per page if given, i.e. from the page
+    chunks of pymupdf4llm, which already ran the table detection. Images that are tiny or repeated on
+    several pages are marked decorative.
+    """
+    items = []
+    captions = []
+    mentions = {}
+    raster_items = []
+    for page in document:
+        number = page.number + 1
+        page_tables = _table_items(page, number, tables[page.number] if tables is not None else None)
+        raster = _raster_items(page, number)
+        raster_items.extend(raster)
+        avoid = [pymupdf.Rect(item.bbox) for item in page_tables] + [pymupdf.Rect(item.bbox) for item, _ in raster]
+        items.extend([item for item, _ in raster] + _vector_items(page, number, avoid) + page_tables)
+
+        for block in page.get_text("blocks"):
+            text = " ".join(block[4].split())
+            caption = CAPTION_PATTERN.match(text)
+            if caption:
+                captions.append(Caption(
+                    page=number, label=_label(caption.group(1), caption.group(2)),
+                    text=text[:MAX_CAPTION_LENGTH], bbox=_bbox(block[:4]),
+                ))
+                continue
+            for mention in MENTION_PATTERN.finditer(text):
+                pages = mentions.setdefault(_label(mention.group(1), mention.group(2)), [])
+                if number not in pages:
+                    pages.append(number)
+
+    # Logos and other images placed on many pages, i.e. in the header or on the title page of each chapter
+    pages_per_digest = {}
+    for item, digest in raster_items:
+        pages_per_digest.setdefault(digest, set()).add(item.page)
+    for item, digest in raster_items:
+        if len(pages_per_digest[digest]) >= DECORATIVE_REPEATED_PAGES:
+            item.decorative = True
+
+    _assign_captions(items, captions)
+    return FigureInventory(items=items, captions=captions, mentions=mentions)
+
+
+def append_figure_inventory(markdown: str, inventory: FigureInventory) -> str:
+    """Append the formatted inventory to the markdown of the proposal as a marked block."""
+    return markdown.rstrip("\n") + "\n\n" + INVENTORY_START + "\n" + inventory.format() + "\n" + INVENTORY_END + "\n"
+
+
+def split_figure_inventory(markdown: str) -> Tuple[str, Optional[str]]:
+    """Remove the inventory block from the markdown, returning the markdown and the inventory, if any."""
+    match = INVENTORY_BLOCK_PATTERN.search(markdown)
+    if match is None:
+        return markdown, None
+    return markdown[:match.start()] + "\n" + markdown[match.end():], match.group(1)
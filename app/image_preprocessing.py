@@ -0,0 +1,150 @@
+import hashlib
+import math
+import os
+from collections import Counter
+from typing import Dict, Optional, Sequence
+import pymupdf
+from pydantic import BaseModel
+
+# Edge length of the grayscale thumbnail the entropy is computed on
+ENTROPY_SIZE = 64
+JPEG_QUALITY = 80
+
+
+class PreparedImage(BaseModel):
+    """An image of the PDF and its preprocessing, path is None until the image is encoded for the model."""
+    source: str
+    width: int
+    height: int
+    digest: str
+    entropy: float
+    source_bytes: int
+    path: Optional[str] = None
+    prepared_bytes: int = 0
+    prepared_tokens: int = 0
+
+
+class ImagePreparation(BaseModel):
+    """Source image path -> image to describe instead, None for dropped images, with the savings."""
+    images: Dict[str, Optional[str]]
+    source_bytes: int
+    prepared_bytes: int
+    source_tokens: int
+    prepared_tokens: int
+    dropped: int
+
+    def summary(self) -> str:
+        described = len(set(path for path in self.images.values() if path is not None))
+        return (
+            f"{len(self.images)} images, {described} described, {self.dropped} dropped, "
+            f"{len(self.images) - described - self.dropped} repeated, "
+            f"{self.source_bytes / 1024:.0f} KiB -> {self.prepared_bytes / 1024:.0f} KiB, "
+            f"~{self.source_tokens} -> ~{self.prepared_tokens} image tokens"
+        )
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Estimate the input tokens of an image with high detail, as documented for the OpenAI vision models.
+
+    The image is scaled to fit 2048x2048 and its shorter edge to at most 768 pixels, then every 512 pixel
+    tile costs 170 tokens on top of 85 base tokens.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+    return 85 + 170 * tiles
+
+
+def _rows(pixmap: pymupdf.Pixmap) -> bytes:
+    return b"".join(
+        pixmap.samples[row * pixmap.stride:row * pixmap.stride + pixmap.width * pixmap.n]
+        for row in range(pixmap.height)
+    )
+
+
+def _digest(pixmap: pymupdf.Pixmap) -> str:
+    # Digest of the decoded pixels, so only exact repeats match, regardless of how the files were encoded.
+    # Perceptual hashes also match different diagrams with the same layout, which must be described each.
+    digest = hashlib.sha1(f"{pixmap.width}x{pixmap.height}x{pixmap.n}".encode())
+    digest.update(_rows(pixmap))
+    return digest.hexdigest()
+
+
+def _entropy(gray: pymupdf.Pixmap) -> float:
+    # Shannon entropy of the gray levels in bits, near 0 for blank or single-colored images
+    thumbnail = pymupdf.Pixmap(gray, min(gray.width, ENTROPY_SIZE), min(gray.height, ENTROPY_SIZE), None)
+    samples = _rows(thumbnail)
+    total = len(samples)
+    return 0.0 - sum(count / total * math.log2(count / total) for count in Counter(samples).values())
+
+
+def _load(source: str) -> pymupdf.Pixmap:
+    pixmap = pymupdf.Pixmap(source)
+    if pixmap.colorspace is None or pixmap.colorspace.n not in (1, 3):
+        pixmap = pymupdf.Pixmap(pymupdf.csRGB, pixmap)
+    if pixmap.alpha:
+        pixmap = pymupdf.Pixmap(pixmap, 0)
+    return pixmap
+
+
+def _analyze_image(source: str) -> PreparedImage:
+    pixmap = _load(source)
+    gray = pixmap if pixmap.n == 1 else pymupdf.Pixmap(pymupdf.csGRAY, pixmap)
+    return PreparedImage(
+        source=source, width=pixmap.width, height=pixmap.height, digest=_digest(pixmap),
+        entropy=_entropy(gray), source_bytes=os.path.getsize(source),
+    )
+
+
+def _encode_image(image: PreparedImage, max_size: int):
+    """Downscale the image and write it next to its source in the smaller of PNG and JPEG."""
+    pixmap = _load(image.source)
+    if max(pixmap.width, pixmap.height) > max_size:
+        scale = max_size / max(pixmap.width, pixmap.height)
+        pixmap = pymupdf.Pixmap(pixmap, max(1, round(pixmap.width * scale)), max(1, round(pixmap.height * scale)), None)
+    # Diagrams with flat colors are smallest as PNG, photos and screenshots as JPEG
+    encodings = {"png": pixmap.tobytes("png"), "jpeg": pixmap.tobytes("jpeg", jpg_quality=JPEG_QUALITY)}
+    extension, data = min(encodings.items(), key=lambda encoding: len(encoding[1]))
+    image.path = f"{os.path.splitext(image.source)[0]}-prepared.{extension}"
+    with open(image.path, "wb") as image_file:
+        image_file.write(data)
+    image.prepared_bytes = len(data)
+    image.prepared_tokens = estimate_image_tokens(pixmap.width, pixmap.height)
+
+
+def prepare_images(
+    image_paths: Sequence[str], max_size: int, min_size: int, min_entropy: float
+) -> ImagePreparation:
+    """
+    Prepare the images of a PDF for the image model.
+
+    Images with a longer edge below min_size pixels or a gray level entropy below min_entropy bits are
+    dropped. Exact repeats of an image, such as a logo on every page, are grouped by the digest of their
+    pixels and only the first image of each group is prepared: downscaled to at most max_size pixels,
+    re-encoded as PNG or JPEG, whichever is smaller, and written next to its source image.
+    """
+    analyzed = [_analyze_image(path) for path in dict.fromkeys(image_paths)]
+    kept = [
+        image for image in analyzed
+        if max(image.width, image.height) >= min_size and image.entropy >= min_entropy
+    ]
+
+    # Pixel digest -> image prepared for all repeats of it
+    representatives: Dict[str, PreparedImage] = {}
+    images = {image.source: None for image in analyzed}
+    for image in kept:
+        representative = representatives.get(image.digest)
+        if representative is None:
+            _encode_image(image, max_size)
+            representative = representatives[image.digest] = image
+        images[image.source] = representative.path
+
+    return ImagePreparation(
+        images=images,
+        source_bytes=sum(image.source_bytes for image in analyzed),
+        prepared_bytes=sum(image.prepared_bytes for image in representatives.values()),
+        source_tokens=sum(estimate_image_tokens(image.width, image.height) for image in analyzed),
+        prepared_tokens=sum(image.prepared_tokens for image in representatives.values()),
+        dropped=len(analyzed) - len(kept),
+    )
@@ -0,0 +1,274 @@
+"""
+Persistent review job queue behind the Gradio interface.
+
+Uploads are enqueued as jobs in an SQLite database and processed by a fixed pool of worker threads, so the
+number of concurrent reviews is bounded and a job survives browser refreshes and restarts. Workers persist
+the issues and pending reviewers of a job while it runs, the interface only polls the job.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from logging import getLogger
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from app.artifacts import UPLOAD_NAME, ArtifactStore
+
+logger = getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+# Assumed duration of a job until the first jobs finished
+DEFAULT_JOB_SECONDS = 120
+# Number of recently finished jobs the duration estimate is based on
+DURATION_SAMPLE_SIZE = 20
+
+
+class Job(BaseModel):
+    id: str
+    file_name: str
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    pending: List[str] = []
+    issues: List[dict] = []
+    error: Optional[str] = None
+    previous_id: Optional[str] = None
+
+
+class QueueFullError(Exception):
+    """Raised when a job is rejected because the queue is full."""
+
+    def __init__(self, depth: int, estimated_wait: float):
+        self.depth = depth
+        self.estimated_wait = estimated_wait
+        super().__init__(
+            f"The review queue is full ({depth} jobs waiting). "
+            f"Please try again in about {format_duration(estimated_wait)}."
+        )
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration as a rounded number of seconds or minutes."""
+    if seconds < 60:
+        return f"{max(1, round(seconds))} s"
+    return f"{math.ceil(seconds / 60)} min"
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of review jobs.
+
+    The uploaded PDF of each job is copied to the directory of the job in the artifact store, so it is still
+    available when the job runs after a restart, and removed when the job is done. Jobs that were running when
+    the process stopped are queued again on startup.
+    """
+
+    def __init__(self, path: str, artifacts: ArtifactStore, max_depth: int, workers: int):
+        self.path = path
+        self.artifacts = artifacts
+        self.max_depth = max_depth
+        self.workers = workers
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._job_available = threading.Condition(self._lock)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, file_name TEXT NOT NULL, status TEXT NOT NULL, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+                "pending TEXT NOT NULL DEFAULT '[]', issues TEXT NOT NULL DEFAULT '[]', error TEXT, previous_id TEXT)"
+            )
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")}
+            if "previous_id" not in columns:
+                self._connection.execute("ALTER TABLE jobs ADD COLUMN previous_id TEXT")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            recovered = self._connection.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'"
+            ).rowcount
+        if recovered:
+            logger.info(f"Requeued {recovered} jobs interrupted by a restart")
+
+    def pdf_path(self, job_id: str) -> str:
+        return os.path.join(self.artifacts.review_dir(job_id), UPLOAD_NAME)
+
+    def enqueue(self, file_path: str, previous_id: Optional[str] = None) -> Job:
+        """
+        Add a review job for the PDF at file_path, previous_id is the job of the review of an earlier revision.
+
+        Raises:
+            QueueFullError: If max_depth jobs are already waiting.
+        """
+        job = Job(
+            id=uuid.uuid4().hex, file_name=os.path.basename(file_path), status="queued", created_at=time.time(),
+            previous_id=previous_id,
+        )
+        self.artifacts.copy(job.id, UPLOAD_NAME, file_path)
+        # Count and insert in one step, so concurrent uploads cannot all pass the check
+        with self._job_available, self._connection:
+            depth = self._connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if depth < self.max_depth:
+                self._connection.execute(
+                    "INSERT INTO jobs (id, file_name, status, created_at, previous_id) VALUES (?, ?, ?, ?, ?)",
+                    (job.id, job.file_name, job.status, job.created_at, job.previous_id),
+                )
+                self._job_available.notify()
+        if depth >= self.max_depth:
+            self.artifacts.remove_review(job.id)
+            raise QueueFullError(depth, self.estimated_wait(depth))
+        logger.info(f"Enqueued job {job.id} for {job.file_name}, {depth + 1} jobs waiting")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, file_name, status, created_at, started_at, finished_at, pending, issues, error, "
+                "previous_id FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return Job(
+            id=row[0], file_name=row[1], status=row[2], created_at=row[3], started_at=row[4],
+            finished_at=row[5], pending=json.loads(row[6]), issues=json.loads(row[7]), error=row[8],
+            previous_id=row[9],
+        )
+
+    def active_ids(self) -> List[str]:
+        """IDs of the queued and running jobs."""
+        with self._lock:
+            rows = self._connection.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        return [row[0] for row in rows]
+
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def position(self, job: Job) -> int:
+        """Number of queued jobs ahead of the job."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (job.created_at,)
+            ).fetchone()[0]
+
+    def average_duration(self) -> float:
+        """Average duration of the recently finished jobs in seconds."""
+        with self._lock:
+            average = self._connection.execute(
+                "SELECT AVG(finished_at - started_at) FROM (SELECT finished_at, started_at FROM jobs "
+                "WHERE status = 'done' ORDER BY finished_at DESC LIMIT ?)",
+                (DURATION_SAMPLE_SIZE,),
+            ).fetchone()[0]
+        return average if average is not None else DEFAULT_JOB_SECONDS
+
+    def estimated_wait(self, jobs_ahead: int) -> float:
+        """Estimate the seconds until a job with jobs_ahead queued jobs in front of it starts."""
+        with self._lock:
+            running = self._connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+        # All workers have to get through the running jobs and the ones ahead before it is this job's turn
+        rounds = (running + jobs_ahead) // self.workers
+        return rounds * self.average_duration()
+
+    def claim(self, timeout: float) -> Optional[Job]:
+        """Mark the oldest queued job as running and return it, waiting up to timeout seconds for one."""
+        with self._job_available:
+            row = None
+            deadline = time.monotonic() + timeout
+            while row is None:
+                row = self._connection.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                remaining = deadline - time.monotonic()
+                if row is None and (remaining <= 0 or not self._job_available.wait(remaining)):
+                    return None
+            with self._connection:
+                self._connection.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), row[0])
+                )
+        return self.get(row[0])
+
+    def update_progress(self, job_id: str, issues: List[dict], pending: List[str]):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET issues = ?, pending = ? WHERE id = ?",
+                (json.dumps(issues), json.dumps(pending), job_id),
+            )
+
+    def finish(self, job_id: str, error: Optional[str] = None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                ("failed" if error else "done", time.time(), error, job_id),
+            )
+        self.artifacts.remove(job_id, UPLOAD_NAME)
+
+    def prune(self, max_age: float) -> int:
+        """Delete the done and failed jobs finished more than max_age seconds ago with their files."""
+        with self._lock, self._connection:
+            job_ids = [row[0] for row in self._connection.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (time.time() - max_age,)
+            )]
+            self._connection.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+        for job_id in job_ids:
+            self.artifacts.remove_review(job_id)
+        if job_ids:
+            logger.info(f"Pruned {len(job_ids)} jobs finished more than {format_duration(max_age)} ago")
+        return len(job_ids)
+
+
+class JobWorkerPool:
+    """
+    Worker threads processing the jobs of a queue.
+
+    process_job is called with the job and the path of its PDF and yields tuples of (issues so far, pending
+    reviewer names), which are persisted as the job's progress.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        process_job: Callable[[Job, str], Iterator[Tuple[List[dict], List[str]]]],
+        workers: int,
+    ):
+        self.queue = queue
+        self.process_job = process_job
+        self.workers = workers
+        self._threads = []
+        self._stopped = threading.Event()
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} job workers")
+
+    def stop(self):
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        while not self._stopped.is_set():
+            job = self.queue.claim(timeout=1)
+            if job is None:
+                continue
+            logger.info(f"Processing job {job.id} ({job.file_name})")
+            try:
+                for issues, pending in self.process_job(job, self.queue.pdf_path(job.id)):
+                    self.queue.update_progress(job.id, issues, pending)
+            except Exception as e:
+                logger.exception(f"Job {job.id} failed")
+                self.queue.finish(job.id, error=str(e))
+            else:
+                self.queue.finish(job.id)
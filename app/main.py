@@ -1,25 +1,21 @@
-from typing import Optional, List
-from pydantic import BaseModel, Field
+import base64
+import html
 import logging
+import mimetypes
+import os
 import sys
-import json
+import threading
+import time
 import gradio as gr
-from langfuse.callback import CallbackHandler
-from langchain_core.runnables import RunnableParallel
-
-from app.prompts.abstract import get_abstract_prompt
-from app.prompts.introduction import get_introduction_prompt
-from app.prompts.problem import get_problem_prompt
-from app.prompts.motivation import get_motivation_prompt
-from app.prompts.objectives import get_objectives_prompt
-from app.prompts.bibliography import get_bibliography_prompt
-from app.prompts.schedule import get_schedule_prompt
-from app.prompts.transparency import get_transparency_prompt
-from app.prompts.general_writing import get_general_writing_prompt
-from app.prompts.figures_diagrams import get_figures_diagrams_prompt
-
-from app.models import get_model
+
+from app.artifacts import MARKDOWN_NAME, ArtifactStore
+from app.jobs import JobQueue, JobWorkerPool, QueueFullError, format_duration
+from app.models import validate_models
+from app.models.scheduler import llm_call_context
 from app.pdf_converter import convert_pdf_to_clean_markdown
+from app.report import EXPORT_NAME, REPORT_FORMATS, ReportCache
+from app.reviewers import REVIEWER_NAMES, review_cache, review_chain
+from app.revisions import RESOLVED, RevisionStore, review_revision
 from app.settings import settings
 
 logging.basicConfig(
@@ -28,184 +24,177 @@ logging.basicConfig(
     handlers=[logging.StreamHandler(sys.stdout)],
 )
 
-callbacks = []
-if settings.langfuse_enabled:
-    langfuse_handler = CallbackHandler()
-    langfuse_handler.auth_check()
-    callbacks.append(langfuse_handler)
-
-
-class FeedbackIssue(BaseModel):
-    """A specific feedback issue in a proposal section."""
-    section: str = Field(default=None, description="The section this feedback relates to")
-    category: str = Field(description="Category of the issue (e.g., 'Clarity', 'Structure', 'Content', 'Grammar', 'Citations')")
-    priority: str = Field(description="Priority of the issue: 'Very Low', 'Low', 'Medium', 'High', 'Very High'")
-    quote: Optional[str] = Field(default=None, description="A direct quote from the text illustrating the issue, if applicable")
-    issue: str = Field(description="Description of the issue identified")
-    suggestion: str = Field(description="Specific suggestion for addressing the issue")
-    rule: Optional[str] = Field(default=None, description="The academic writing rule or guideline being applied, if relevant")
-
-class FeedbackIssueList(BaseModel):
-    """A list of feedback issues."""
-    issues: List[FeedbackIssue] = Field(description="List of feedback issues identified in the section")
-
-
-ChatModel = get_model(settings.MODEL_NAME)
-issue_model = ChatModel().with_structured_output(FeedbackIssueList)
-
-
-def format_feedback_for_display(issues):
-    """Format the feedback issues for nice display in Gradio."""
-    if not issues:
-        return "No issues found in the proposal. Great work!"
-
-    # Group issues by section and priority
-    sections = {}
-    for issue in issues:
-        section = issue.get('section', 'General')
-        if section not in sections:
-            sections[section] = {'Very High': [], 'High': [], 'Medium': [], 'Low': [], 'Very Low': []}
-        priority = issue.get('priority', 'Medium')
-        sections[section][priority].append(issue)
-    
-    # Create formatted markdown output
-    markdown_output = "# 📝 Proposal Feedback Report\n\n"
-    
-    priority_order = ['Very High', 'High', 'Medium', 'Low', 'Very Low']
-    priority_emojis = {'Very High': '🔴', 'High': '🟠', 'Medium': '🟡', 'Low': '🔵', 'Very Low': '⚪'}
-    
-    for section, section_issues in sections.items():
-        has_issues = any(section_issues[p] for p in priority_order)
-        if not has_issues:
-            continue
-            
-        markdown_output += f"## 📂 {section}\n\n"
-        
-        for priority in priority_order:
-            if section_issues[priority]:
-                markdown_output += f"### {priority_emojis[priority]} {priority} Priority\n\n"
-                
-                for i, issue in enumerate(section_issues[priority], 1):
-                    markdown_output += f"**{i}. {issue['category']}**\n\n"
-                    
-                    if issue.get('quote'):
-                        markdown_output += f"> *\"{issue['quote']}\"*\n\n"
-                    
-                    markdown_output += f"**📋 Issue:** {issue['issue']}\n\n"
-                    markdown_output += f"**💡 Suggestion:** {issue['suggestion']}\n\n"
-                    
-                    if issue.get('rule'):
-                        markdown_output += f"**📖 Rule:** {issue['rule']}\n\n"
-                    
-                    markdown_output += "---\n\n"
-    
-    return markdown_output
-
-
-def format_feedback_for_text(issues):
-    """Format the feedback issues for human-readable text download."""
-    if not issues:
-        return "PROPOSAL FEEDBACK REPORT\n" + "="*50 + "\n\nNo issues found in the proposal. Great work!"
-
-    # Group issues by section and priority
-    sections = {}
-    for issue in issues:
-        section = issue.get('section', 'General')
-        if section not in sections:
-            sections[section] = {'Very High': [], 'High': [], 'Medium': [], 'Low': [], 'Very Low': []}
-        priority = issue.get('priority', 'Medium')
-        sections[section][priority].append(issue)
-    
-    # Create formatted text output
-    text_output = "PROPOSAL FEEDBACK REPORT\n"
-    text_output += "="*50 + "\n\n"
-    
-    priority_order = ['Very High', 'High', 'Medium', 'Low', 'Very Low']
-    priority_symbols = {'Very High': '!!!', 'High': '!!', 'Medium': '!', 'Low': '-', 'Very Low': '.'}
-    
-    total_issues = sum(len(issues) for section_issues in sections.values() for issues in section_issues.values())
-    text_output += f"Total Issues Found: {total_issues}\n\n"
-    
-    for section, section_issues in sections.items():
-        has_issues = any(section_issues[p] for p in priority_order)
-        if not has_issues:
-            continue
-            
-        text_output += f"SECTION: {section.upper()}\n"
-        text_output += "-" * (len(section) + 9) + "\n\n"
-        
-        for priority in priority_order:
-            if section_issues[priority]:
-                text_output += f"{priority_symbols[priority]} {priority.upper()} PRIORITY\n\n"
-                
-                for i, issue in enumerate(section_issues[priority], 1):
-                    text_output += f"{i}. {issue['category'].upper()}\n"
-                    text_output += "   " + "="*len(issue['category']) + "\n\n"
-                    
-                    if issue.get('quote'):
-                        text_output += "   QUOTE:\n"
-                        text_output += f'   "{issue["quote"]}"\n\n'
-                    
-                    text_output += "   ISSUE:\n"
-                    text_output += f"   {issue['issue']}\n\n"
-                    
-                    text_output += "   SUGGESTION:\n"
-                    text_output += f"   {issue['suggestion']}\n\n"
-                    
-                    if issue.get('rule'):
-                        text_output += "   WRITING RULE:\n"
-                        text_output += f"   {issue['rule']}\n\n"
-                    
-                    text_output += "   " + "-"*60 + "\n\n"
-                
-                text_output += "\n"
-        
-        text_output += "\n"
-    
-    return text_output
-
-
-def upload_file(file):
-    proposal = convert_pdf_to_clean_markdown(file.name)
+logger = logging.getLogger(__name__)
+
+# Seconds between status checks of a review job in the interface
+JOB_POLL_SECONDS = 0.5
+# Number of most recently shown reviews whose reports and exported files are kept
+REPORT_CACHE_SIZE = 100
+
+
+def review_upload(job, pdf_path):
+    """
+    Review the proposal PDF at pdf_path, yielding whenever an issue is streamed or a reviewer finishes.
+
+    If the proposal is a revision of an earlier review, given by the job or found by its similarity, only the
+    reviewers of the changed sections run again. Yields tuples of (issues so far, pending reviewer names).
+    """
+    # Uploads go before batch reviews, calls are spread fairly across the uploads reviewed at the same time
+    with llm_call_context(priority="interactive", review_id=job.id):
+        yield from _review_upload(job, pdf_path)
+
+
+def _review_upload(job, pdf_path):
+    proposal = convert_pdf_to_clean_markdown(pdf_path)
     print(f"Converted proposal: {proposal}")
-    chain = RunnableParallel({
-        "general_writing": get_general_writing_prompt() | issue_model,
-        "figures_diagrams": get_figures_diagrams_prompt() | issue_model,
-        "abstract": get_abstract_prompt() | issue_model,
-        "introduction": get_introduction_prompt() | issue_model,
-        "problem": get_problem_prompt() | issue_model,
-        "motivation": get_motivation_prompt() | issue_model,
-        "objectives": get_objectives_prompt() | issue_model,
-        "bibliography": get_bibliography_prompt() | issue_model,
-        "schedule": get_schedule_prompt() | issue_model,
-        "transparency": get_transparency_prompt() | issue_model,
-    }).with_config(callbacks=callbacks)
-    result = chain.invoke({ "proposal": proposal })
+    artifacts.write(job.id, MARKDOWN_NAME, proposal)
 
+    pending = list(REVIEWER_NAMES)
     issues = []
-    for feedback_list in result.values():
-        for feedback in feedback_list.issues:
-            issues.append(feedback.model_dump())
-    
-    # Format for display and downloads
-    formatted_output = format_feedback_for_display(issues)
-    json_content = json.dumps(issues, indent=2)
-    text_content = format_feedback_for_text(issues)
-    
-    return formatted_output, json_content, text_content
-
-with gr.Blocks(title="Proposal Assistance Tool", theme=gr.themes.Soft()) as playground:
+    reviewer_issues = {name: [] for name in REVIEWER_NAMES}
+    yield issues, pending
+
+    previous = revision_store.find_previous(proposal, job.previous_id, settings.REVISION_MATCH_THRESHOLD)
+    if previous is not None:
+        chunks = review_revision(proposal, previous)
+    else:
+        chunks = review_chain.stream({"proposal": proposal})
+    for chunk in chunks:
+        for name, feedback_chunk in chunk.items():
+            for feedback in feedback_chunk.issues:
+                issue = feedback.model_dump()
+                if feedback_chunk.status is not None:
+                    issue["status"] = feedback_chunk.status
+                issues.append(issue)
+                if feedback_chunk.status != RESOLVED:
+                    reviewer_issues[name].append(feedback)
+            if feedback_chunk.final:
+                pending.remove(name)
+        yield issues, pending
+
+    # Stored for the review of the next revision
+    revision_store.save(job.id, proposal, reviewer_issues)
+    if review_cache is not None:
+        logger.info(f"Review cache: {review_cache.stats()}")
+
+
+artifacts = ArtifactStore(
+    os.path.join(settings.JOB_DIR, "reviews"), max_bytes=settings.ARTIFACT_MAX_BYTES, ttl=settings.ARTIFACT_TTL
+)
+job_queue = JobQueue(
+    os.path.join(settings.JOB_DIR, "jobs.sqlite3"),
+    artifacts,
+    max_depth=settings.JOB_QUEUE_MAX_DEPTH,
+    workers=settings.JOB_WORKERS,
+)
+job_workers = JobWorkerPool(job_queue, review_upload, settings.JOB_WORKERS)
+revision_store = RevisionStore(
+    os.path.join(settings.JOB_DIR, "revisions.sqlite3"), max_entries=settings.REVISION_STORE_MAX_ENTRIES
+)
+report_cache = ReportCache(artifacts, max_reviews=REPORT_CACHE_SIZE)
+
+
+def format_progress(pending):
+    """Format the list of reviewers that are still running."""
+    if not pending:
+        return ""
+    finished = len(REVIEWER_NAMES) - len(pending)
+    return f"⏳ **Reviewing ({finished}/{len(REVIEWER_NAMES)} done)**, waiting for: {', '.join(pending)}\n\n"
+
+
+def format_queue_status(job):
+    """Format the position and estimated wait of a queued job."""
+    position = job_queue.position(job)
+    wait = job_queue.estimated_wait(position)
+    if position == 0:
+        return f"⏳ **Queued**, your review starts as soon as a worker is free (about {format_duration(wait)})."
+    return (
+        f"⏳ **Queued**, {position} reviews ahead of yours, "
+        f"estimated wait about {format_duration(wait)}."
+    )
+
+
+def follow_job(job_id):
+    """
+    Poll the job until it is done, yielding its formatted feedback whenever it changes.
+
+    Yields tuples of (formatted markdown, whether reviewer results exist).
+    """
+    last_output = None
+
+    while True:
+        job = job_queue.get(job_id)
+        if job is None:
+            yield f"Unknown review job `{job_id}`.", False
+            return
+        if job.status == "failed":
+            yield f"Error processing file: {job.error}", False
+            return
+
+        has_results = False
+        if job.status == "queued":
+            output = format_queue_status(job)
+        elif job.status == "running" and not job.pending and not job.issues:
+            output = "⏳ Converting proposal..."
+        else:
+            pending = job.pending if job.status == "running" else []
+            has_results = len(pending) < len(REVIEWER_NAMES)
+            # Only claim there are no issues once all reviewers are done
+            formatted_feedback = report_cache.render(job_id, job.issues) if job.issues or not pending else ""
+            output = format_progress(pending) + formatted_feedback
+
+        if output != last_output:
+            last_output = output
+            yield output, has_results
+        if job.status == "done":
+            return
+        time.sleep(JOB_POLL_SECONDS)
+
+
+def export_report(job_id, format_name):
+    """
+    Export the report of the job in the format, returning a tuple of (content, path) with one of them set.
+
+    Reports of at most DOWNLOAD_INLINE_MAX_BYTES are returned as content to be sent from memory, larger reports
+    are written to the directory of the job once per change and returned as path.
+    """
+    job = job_queue.get(job_id) if job_id else None
+    if job is None:
+        return None, None
+    content = report_cache.render(job_id, job.issues, format_name)
+    if len(content.encode()) <= settings.DOWNLOAD_INLINE_MAX_BYTES:
+        return content, None
+    return None, report_cache.export(job_id, job.issues, format_name)
+
+
+def format_download_link(content, format_name):
+    """Format a link downloading the content from a data URL, without a file on the server."""
+    _, extension = REPORT_FORMATS[format_name]
+    mime_type = mimetypes.guess_type(f"{EXPORT_NAME}{extension}")[0] or "text/plain"
+    data = base64.b64encode(content.encode()).decode()
+    return (
+        f'<a download="{EXPORT_NAME}{extension}" href="data:{mime_type};charset=utf-8;base64,{data}">'
+        f'💾 Download {html.escape(format_name)} Report</a>'
+    )
+
+
+# Temporary files of Gradio, i.e. uploads and downloaded reports, are removed like the files of the reviews
+with gr.Blocks(
+    title="Proposal Assistance Tool",
+    theme=gr.themes.Soft(),
+    delete_cache=(settings.ARTIFACT_CLEANUP_INTERVAL, settings.ARTIFACT_TTL)
+) as playground:
     gr.Markdown("# 🎓 Proposal Assistance Tool")
     gr.Markdown("Upload your research proposal PDF to get detailed feedback and suggestions for improvement.")
-    
+
     with gr.Row():
         with gr.Column(scale=1):
             upload_button = gr.UploadButton(
-                "📄 Click to Upload a Proposal", 
+                "📄 Click to Upload a Proposal",
                 file_types=[".pdf"],
                 size="lg"
             )
-        
+
     with gr.Row():
         with gr.Column():
             feedback_output = gr.Markdown(
@@ -213,75 +202,123 @@ with gr.Blocks(title="Proposal Assistance Tool", theme=gr.themes.Soft()) as play
                 value="Upload a proposal to see feedback here...",
                 show_copy_button=True
             )
-    
-    with gr.Row():
+
+    with gr.Row(visible=False) as export_row:
+        with gr.Column(scale=2):
+            export_format = gr.Radio(
+                list(REPORT_FORMATS),
+                value="Text",
+                label="Report Format",
+                show_label=False
+            )
         with gr.Column(scale=1):
-            download_json_button = gr.DownloadButton(
-                "💾 Download JSON Report",
-                visible=False,
+            export_button = gr.Button(
+                "📄 Export Report",
                 size="sm",
                 variant="secondary"
             )
         with gr.Column(scale=1):
-            download_text_button = gr.DownloadButton(
-                "📄 Download Text Report",
+            download_button = gr.DownloadButton(
+                "💾 Download Report",
                 visible=False,
                 size="sm",
                 variant="secondary"
             )
-    
-    def process_upload(file):
-        if file is None:
-            return (
-                "Please upload a file first.", 
-                None, None,
-                gr.update(visible=False), 
-                gr.update(visible=False)
+            download_link = gr.HTML(visible=False)
+
+    with gr.Row():
+        with gr.Column(scale=1):
+            job_id_box = gr.Textbox(
+                label="Review Job ID",
+                info="Paste the ID of an earlier review and press Enter to see its results again.",
+                max_lines=1
             )
-        
-        try:
-            formatted_feedback, json_content, text_content = upload_file(file)
-            
-            # Save files to temporary locations for download
-            import tempfile
-            import os
-            
-            # Create JSON file
-            json_temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
-            json_temp_file.write(json_content)
-            json_temp_file.close()
-            
-            # Create text file
-            text_temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False)
-            text_temp_file.write(text_content)
-            text_temp_file.close()
-            
-            return (
-                formatted_feedback, 
-                json_temp_file.name,
-                text_temp_file.name,
-                gr.update(visible=True),
-                gr.update(visible=True)
+            revision_checkbox = gr.Checkbox(
+                label="Review the next upload as a revision of the review shown",
+                info="Only what changed is reviewed again. Uploads similar to a recent review are "
+                "recognized as its revision anyway.",
+                value=False
             )
-        except Exception as e:
-            return (
-                f"Error processing file: {str(e)}", 
-                None, None,
-                gr.update(visible=False), 
-                gr.update(visible=False)
+
+    # The last job of this browser, so a refresh continues showing it
+    last_job_id = gr.BrowserState(None, storage_key="proposal_review_job", secret="proposal-review-job")
+
+    def no_update():
+        return (gr.update(),) * 6
+
+    def hide_downloads():
+        return gr.update(value=None, visible=False), gr.update(value="", visible=False)
+
+    def show_job(job_id):
+        for output, has_results in follow_job(job_id):
+            # An exported report of another job or of fewer issues is outdated and must be exported again
+            yield output, job_id, job_id, gr.update(visible=has_results), *hide_downloads()
+
+    def process_upload(file, job_id, is_revision):
+        if file is None:
+            yield "Please upload a file first.", gr.update(), gr.update(), gr.update(visible=False), *no_update()[:2]
+            return
+
+        try:
+            # The ID box is filled with the review shown, it only links the upload when asked to
+            previous_id = ((job_id or "").strip() or None) if is_revision else None
+            job = job_queue.enqueue(file.name, previous_id=previous_id)
+        except QueueFullError as e:
+            yield f"⚠️ {e}", gr.update(), gr.update(), gr.update(visible=False), *no_update()[:2]
+            return
+        finally:
+            # The job has its own copy of the PDF
+            os.remove(file.name)
+
+        yield from show_job(job.id)
+
+    def export_job_report(job_id, format_name):
+        # Small reports never touch the disk, larger ones are only written when they are exported
+        content, path = export_report(job_id, format_name)
+        if content is not None:
+            return gr.update(value=None, visible=False), gr.update(
+                value=format_download_link(content, format_name), visible=True
             )
-    
+        return gr.update(
+            value=path, visible=path is not None, label=f"💾 Download {format_name} Report"
+        ), gr.update(value="", visible=False)
+
+    def resume_job(job_id):
+        job_id = (job_id or "").strip()
+        if not job_id:
+            yield no_update()
+            return
+        yield from show_job(job_id)
+
+    job_outputs = [
+        feedback_output,
+        job_id_box,
+        last_job_id,
+        export_row,
+        download_button,
+        download_link
+    ]
+    # Handlers only poll the job queue, the number of concurrent reviews is limited by the job workers
     upload_button.upload(
-        process_upload, 
-        inputs=[upload_button], 
-        outputs=[
-            feedback_output, 
-            download_json_button, 
-            download_text_button,
-            download_json_button,
-            download_text_button
-        ]
+        process_upload,
+        inputs=[upload_button, job_id_box, revision_checkbox],
+        outputs=job_outputs,
+        concurrency_limit=None
+    )
+    job_id_box.submit(resume_job, inputs=[job_id_box], outputs=job_outputs, concurrency_limit=None)
+    playground.load(resume_job, inputs=[last_job_id], outputs=job_outputs, concurrency_limit=None)
+    export_button.click(
+        export_job_report, inputs=[last_job_id, export_format], outputs=[download_button, download_link]
     )
+    export_format.change(hide_downloads, outputs=[download_button, download_link])
+
+
+def validate_configured_models():
+    try:
+        validate_models([settings.MODEL_NAME, settings.IMAGE_MODEL_NAME, settings.FORMAT_MODEL_NAME])
+    except EnvironmentError as e:
+        logger.error(str(e))
+
 
 playground_auth = (
     (settings.PLAYGROUND_USERNAME, settings.PLAYGROUND_PASSWORD)
@@ -289,11 +326,16 @@ playground_auth = (
     else None
 )
 
+
 def app():
     """Main function to run the app."""
+    # Check the configured models without delaying the startup, errors only show up in the logs
+    threading.Thread(target=validate_configured_models, name="model-validation", daemon=True).start()
+    job_workers.start()
+    artifacts.start_janitor(settings.ARTIFACT_CLEANUP_INTERVAL, job_queue.active_ids, job_queue.prune)
     # Run the Gradio app
     playground.launch(
         auth=playground_auth,
         server_name="0.0.0.0",
         server_port=7860
-    )
\ No newline at end of file
+    )
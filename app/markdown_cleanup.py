@@ -0,0 +1,482 @@
+import re
+from collections import Counter
+from typing import List, Literal, Optional, Sequence, Tuple
+from pydantic import BaseModel, Field
+
+OCR_START = "<<< OCR IMAGE DESCRIPTION START >>>"
+OCR_END = "<<< OCR IMAGE DESCRIPTION END >>>"
+
+# OCR image descriptions are passed through untouched
+OCR_BLOCK_PATTERN = re.compile(re.escape(OCR_START) + r".*?" + re.escape(OCR_END) + r"\n?", re.DOTALL)
+
+HEADING_LINE_PATTERN = re.compile(r'^(#{1,6})[ \t]+(.*?)[ \t#]*$')
+HEADING_NUMBERING_PATTERN = re.compile(r'^(\d+(?:\.\d+)*)\.?\s')
+# Bullets as extracted by pymupdf4llm ("*•* item") or typed, and numbered items ("1." or "1)")
+LIST_ITEM_PATTERN = re.compile(r'^([ \t]*)(?:\*[•▪◦●■‣∙·]\*|[-*+•▪◦●■‣∙·–]|(\d{1,3})[.)])[ \t]+')
+# Table of contents entries end in dot leaders and a page number, i.e. "2.1 Syntax . . . . 2"
+TOC_ENTRY_PATTERN = re.compile(r'(?:\.\s*){4,}[*_]*\s*\d+$')
+TABLE_ROW_PATTERN = re.compile(r'^\s*\|')
+FENCE_PATTERN = re.compile(r'^\s*(```|~~~)')
+# Numbered lines of code listings, i.e. "3: end"
+CODE_LINE_PATTERN = re.compile(r'^\d+:\s')
+# Lines that stand on their own without a full stop: bold or italic pseudo-headings, numbered headings such as
+# "**4.1** Design" and figure captions
+STANDALONE_LINE_PATTERN = re.compile(
+    r'^(?:\*\*[^*]+\*\*|__[^_]+__|\*[^*]+\*|_[^_]+_|(?:Figure|Fig\.|Table|Tab\.|Listing)\s*\d.*'
+    r'|[*_]*\d+(?:\.\d+)*\.?[*_]*\s.*)$'
+)
+
+# Page numbers as they appear in headers and footers, i.e. "3", "- 3 -", "Page 3 of 10" or "iv"
+PAGE_NUMBER_PATTERN = re.compile(
+    r'^[\s*_-]*(?:page\s+)?(?:\d{1,4}(?:\s*(?:/|of)\s*\d{1,4})?|[ivxlc]{1,6})[\s*_-]*$', re.IGNORECASE
+)
+TRAILING_NUMBER_PATTERN = re.compile(r'(?:^|\s)(\d{1,4})[\s*_-]*$')
+# Number of lines at the top and bottom of a page considered for running headers and footers
+EDGE_LINES = 3
+# Number of pages a line has to appear on to be a running header or footer
+MIN_RUNNING_PAGES = 3
+
+# A word broken across lines, the markup around the break is kept, i.e. "*Pro-*" + "*ceedings*"
+HYPHENATED_PATTERN = re.compile(r'(\S*[^\W\d_])-([*_]*)$')
+CONTINUATION_PATTERN = re.compile(r'^([*_]*)([^\W\d_]\S*)')
+# Emphasis and code split per word by the extraction, i.e. "*of* *the*" or "`SET` `OF`"
+SPLIT_BOLD_PATTERN = re.compile(r'(?<=\S)\*\*[ \t]+\*\*(?=\S)')
+SPLIT_EMPHASIS_PATTERN = re.compile(r'(?<![*\s])\*[ \t]+\*(?![*\s])')
+SPLIT_CODE_PATTERN = re.compile(r'(?<=[^`\s])`[ \t]+`(?=[^`\s])')
+
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]')
+# Characters ending a sentence or a paragraph, markup and closing brackets are skipped before checking
+TERMINAL_CHARACTERS = set('.!?:;。．！？：；')
+
+
+class Block:
+    """A paragraph, heading, list, or protected block of a page, with its lines."""
+
+    def __init__(self, kind: str, lines: List[str]):
+        self.kind = kind
+        self.lines = lines
+
+    def render(self) -> str:
+        if self.kind == "protected":
+            return "\n".join(self.lines).strip("\n")
+        return "\n".join(self.lines)
+
+
+def _is_cjk(character: str) -> bool:
+    return bool(CJK_PATTERN.match(character))
+
+
+def _join(left: str, right: str) -> str:
+    """Join two fragments of a paragraph, undoing hyphenation and line breaks."""
+    if not left:
+        return right
+    if not right:
+        return left
+
+    hyphenated = HYPHENATED_PATTERN.search(left)
+    continuation = CONTINUATION_PATTERN.match(right)
+    if (
+        hyphenated and continuation and continuation.group(2)[0].islower()
+        and hyphenated.group(2) == continuation.group(1)
+    ):
+        joined = left[:hyphenated.start(1)] + hyphenated.group(1)
+        # Keep the hyphen of compounds such as "state-of-the-art", the break was likely at a real hyphen
+        if "-" in hyphenated.group(1):
+            joined += "-"
+        return joined + right[continuation.start(2):]
+
+    if _is_cjk(left[-1]) and _is_cjk(right[0]):
+        return left + right
+    return left + " " + right
+
+
+def _ends_paragraph(text: str) -> bool:
+    text = text.rstrip().rstrip("*_`)]}\"'”’」』）")
+    return not text or text[-1] in TERMINAL_CHARACTERS
+
+
+def _starts_continuation(text: str) -> bool:
+    text = text.lstrip("*_`")
+    return bool(text) and (text[0].islower() or _is_cjk(text[0]))
+
+
+def _continues_paragraph(previous: Block, block: Block) -> bool:
+    """Whether the paragraph block continues the previous block, split from it by a spurious blank line."""
+    if block.kind != "paragraph" or previous.kind not in ("paragraph", "list"):
+        return False
+    last_line = previous.lines[-1]
+    if _ends_paragraph(last_line) or TOC_ENTRY_PATTERN.search(last_line):
+        return False
+    if _starts_continuation(block.lines[0]):
+        return True
+    # pymupdf4llm separates visual lines by blank lines, so a paragraph without a full stop also continues
+    # with a capitalized word, a number or a citation. List items are only continued in lowercase.
+    return (
+        previous.kind == "paragraph"
+        and not STANDALONE_LINE_PATTERN.match(last_line.strip())
+        and not CODE_LINE_PATTERN.match(last_line.strip())
+        and not CODE_LINE_PATTERN.match(block.lines[0])
+    )
+
+
+def _normalize_inline(text: str) -> str:
+    text = SPLIT_BOLD_PATTERN.sub(" ", text)
+    text = SPLIT_EMPHASIS_PATTERN.sub(" ", text)
+    return SPLIT_CODE_PATTERN.sub(" ", text)
+
+
+def _normalize_list_item(line: str) -> str:
+    match = LIST_ITEM_PATTERN.match(line)
+    indent, number = match.groups()
+    marker = f"{number}." if number else "-"
+    return f"{indent}{marker} {line[match.end():].strip()}"
+
+
+def _normalize_heading(line: str) -> str:
+    hashes, title = HEADING_LINE_PATTERN.match(line).groups()
+    title = title.strip()
+    # Headings are often bold as a whole, i.e. "## **1 Introduction**"
+    if title.startswith("**") and title.endswith("**") and "**" not in title[2:-2]:
+        title = title[2:-2].strip()
+    return f"{hashes} {_normalize_inline(title)}"
+
+
+def _tokenize(text: str) -> List[Block]:
+    """Split the text of a page into blocks, keeping code, tables and OCR descriptions as they are."""
+    blocks = []
+    position = 0
+    for match in OCR_BLOCK_PATTERN.finditer(text):
+        blocks.extend(_tokenize_lines(text[position:match.start()].split("\n")))
+        blocks.append(Block("protected", [match.group(0)]))
+        position = match.end()
+    blocks.extend(_tokenize_lines(text[position:].split("\n")))
+    return blocks
+
+
+def _tokenize_lines(lines: Sequence[str]) -> List[Block]:
+    blocks = []
+    current = None
+    fence = None
+    for line in lines:
+        if fence is not None:
+            current.lines.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+                current = None
+            continue
+
+        fence_match = FENCE_PATTERN.match(line)
+        if fence_match:
+            fence = fence_match.group(1)
+            current = Block("protected", [line])
+            blocks.append(current)
+        elif not line.strip():
+            current = None
+        elif HEADING_LINE_PATTERN.match(line):
+            blocks.append(Block("heading", [_normalize_heading(line)]))
+            current = None
+        elif TABLE_ROW_PATTERN.match(line):
+            if current is None or current.kind != "table":
+                current = Block("table", [])
+                blocks.append(current)
+            current.lines.append(line.rstrip())
+        elif LIST_ITEM_PATTERN.match(line):
+            if current is None or current.kind != "list":
+                current = Block("list", [])
+                blocks.append(current)
+            current.lines.append(_normalize_list_item(line))
+        elif current is not None and current.kind in ("paragraph", "list") and not TOC_ENTRY_PATTERN.search(
+            current.lines[-1]
+        ):
+            # Line breaks inside paragraphs and list items only come from the page layout
+            current.lines[-1] = _join(current.lines[-1], line.strip())
+        else:
+            current = Block("paragraph", [line.strip()])
+            blocks.append(current)
+    return blocks
+
+
+def _merge_blocks(blocks: Sequence[Block]) -> List[Block]:
+    """Merge paragraphs split by spurious blank lines and lists split into one block per item."""
+    merged = []
+    for block in blocks:
+        previous = merged[-1] if merged else None
+        if previous is not None and block.kind == "list" and previous.kind == "list":
+            previous.lines.extend(block.lines)
+            continue
+        if previous is not None and _continues_paragraph(previous, block):
+            previous.lines[-1] = _join(previous.lines[-1], block.lines[0])
+            continue
+        merged.append(block)
+
+    for block in merged:
+        if block.kind in ("paragraph", "list"):
+            block.lines = [_normalize_inline(line) for line in block.lines]
+    return merged
+
+
+def clean_page(text: str) -> str:
+    """
+    Clean up the markdown of a single page.
+
+    Undoes hyphenation and line breaks inside paragraphs, merges paragraphs split by spurious blank lines,
+    normalizes list markers and headings, and collapses emphasis and code split per word. Code blocks, tables
+    and OCR image descriptions are kept as they are.
+    """
+    return "\n\n".join(block.render() for block in _merge_blocks(_tokenize(text)))
+
+
+def _edge_key(line: str) -> str:
+    # Running headers usually only differ in the page number, i.e. "Chapter 2: Structure 3"
+    line = re.sub(r'[*_#`]', "", line)
+    return re.sub(r'\d+', "#", " ".join(line.split())).lower()
+
+
+def _edge_lines(lines: Sequence[str]) -> List[int]:
+    content = [index for index, line in enumerate(lines) if line.strip()]
+    return sorted(set(content[:EDGE_LINES] + content[-EDGE_LINES:]))
+
+
+def _is_running_candidate(line: str) -> bool:
+    # Code fences, table rows, list items, images and sentences repeat at page edges without being headers
+    # or footers
+    return not (
+        FENCE_PATTERN.match(line)
+        or TABLE_ROW_PATTERN.match(line)
+        or LIST_ITEM_PATTERN.match(line)
+        or line.startswith(("<<<", "!["))
+        or (len(line.split()) > 6 and _ends_paragraph(line))
+    )
+
+
+def _page_number(line: str):
+    match = TRAILING_NUMBER_PATTERN.search(line)
+    if match and len(line) <= 100 and _is_running_candidate(line):
+        return int(match.group(1))
+    return None
+
+
+def _numbered_edge_lines(pages_lines: Sequence[Sequence[str]]) -> List[set]:
+    """
+    Find the first or last lines of the pages ending in the printed page number, i.e. "Chapter 2: Syntax 3".
+
+    The printed page numbers are those with the most common offset from the page index.
+    """
+    candidates = []
+    offsets = Counter()
+    for page_index, lines in enumerate(pages_lines):
+        content = [index for index, line in enumerate(lines) if line.strip()]
+        numbers = {index: _page_number(lines[index]) for index in ({content[0], content[-1]} if content else ())}
+        numbers = {index: number for index, number in numbers.items() if number is not None}
+        candidates.append(numbers)
+        offsets.update({number - page_index for number in numbers.values()})
+
+    if not offsets or offsets.most_common(1)[0][1] < MIN_RUNNING_PAGES:
+        return [set() for _ in pages_lines]
+    offset = offsets.most_common(1)[0][0]
+    return [
+        {index for index, number in numbers.items() if number - page_index == offset}
+        for page_index, numbers in enumerate(candidates)
+    ]
+
+
+def remove_headers_and_footers(pages: Sequence[str]) -> List[str]:
+    """
+    Remove page numbers and running headers and footers from the markdown of the pages.
+
+    A line at the top or bottom of a page is a running header or footer if it appears, ignoring numbers, at
+    the edge of at least MIN_RUNNING_PAGES pages, or if it ends in the printed page number.
+    """
+    pages_lines = [page.split("\n") for page in pages]
+    counts = Counter()
+    for lines in pages_lines:
+        counts.update({
+            _edge_key(lines[index]) for index in _edge_lines(lines) if _is_running_candidate(lines[index])
+        })
+    running = {
+        key for key, count in counts.items() if count >= MIN_RUNNING_PAGES and key.strip("# ")
+    }
+
+    cleaned = []
+    for lines, numbered in zip(pages_lines, _numbered_edge_lines(pages_lines)):
+        removed = numbered | {
+            index for index in _edge_lines(lines)
+            if PAGE_NUMBER_PATTERN.match(lines[index])
+            or (_is_running_candidate(lines[index]) and _edge_key(lines[index]) in running)
+        }
+        cleaned.append("\n".join(line for index, line in enumerate(lines) if index not in removed))
+    return cleaned
+
+
+def join_pages(pages: Sequence[str]) -> str:
+    """Join cleaned pages, continuing paragraphs that were split by a page break."""
+    md_text = ""
+    for page in pages:
+        page = page.strip("\n")
+        if not page:
+            continue
+        last_paragraph = md_text.rsplit("\n\n", 1)[-1]
+        continues = (
+            md_text
+            and "\n" not in last_paragraph
+            and not HEADING_LINE_PATTERN.match(last_paragraph)
+            and not TABLE_ROW_PATTERN.match(last_paragraph)
+            and not last_paragraph.rstrip().endswith(OCR_END)
+            and not _ends_paragraph(last_paragraph)
+            and _starts_continuation(page)
+        )
+        if continues:
+            md_text = _join(md_text, page)
+        elif md_text:
+            md_text += "\n\n" + page
+        else:
+            md_text = page
+    return md_text + "\n"
+
+
+def normalize_heading_levels(md_text: str) -> str:
+    """
+    Make the levels of numbered headings consistent with their numbering.
+
+    The extraction derives heading levels from font sizes, so "2.1" may end up on the same level as "2".
+    Numbered headings get the level of their numbering depth, offset by the most common offset in the text.
+    """
+    lines = md_text.split("\n")
+    numbered = []
+    in_fence = False
+    for index, line in enumerate(lines):
+        if FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+        heading = not in_fence and HEADING_LINE_PATTERN.match(line)
+        numbering = heading and HEADING_NUMBERING_PATTERN.match(heading.group(2) + " ")
+        if numbering:
+            numbered.append((index, len(heading.group(1)), numbering.group(1).count(".") + 1))
+    if not numbered:
+        return md_text
+
+    offset = Counter(level - depth for _, level, depth in numbered).most_common(1)[0][0]
+    for index, _, depth in numbered:
+        level = min(max(depth + offset, 1), 6)
+        lines[index] = "#" * level + " " + HEADING_LINE_PATTERN.match(lines[index]).group(2)
+    return "\n".join(lines)
+
+
+def quality_problems(text: str) -> List[str]:
+    """
+    Return the reasons the cleaned markdown of a page still looks broken, empty if it looks fine.
+
+    Checks for unmapped glyphs, letter-spaced text and text scattered into many short fragments, which the
+    local cleanup cannot repair.
+    """
+    blocks = _tokenize(text)
+    prose = "\n".join(block.render() for block in blocks if block.kind not in ("protected", "table"))
+    problems = []
+    if not prose.strip():
+        return problems
+
+    unmapped = prose.count("\ufffd") + prose.count("(cid:")
+    if unmapped > max(2, 0.01 * len(prose)):
+        problems.append(f"{unmapped} unmapped glyphs")
+
+    words = prose.split()
+    single_letters = sum(1 for word in words if len(word) == 1 and word.isalpha())
+    if len(words) >= 20 and single_letters > 0.3 * len(words):
+        problems.append(f"{single_letters} of {len(words)} words are single letters")
+
+    paragraphs = [block for block in blocks if block.kind == "paragraph"]
+    fragments = sum(1 for block in paragraphs if len(block.lines[0]) < 20 and not _ends_paragraph(block.lines[0]))
+    if len(paragraphs) >= 6 and fragments > 0.5 * len(paragraphs):
+        problems.append(f"{fragments} of {len(paragraphs)} paragraphs are short fragments")
+    return problems
+
+
+class MarkdownEdit(BaseModel):
+    """An edit of the numbered lines of a markdown chunk."""
+    operation: Literal["join", "replace"] = Field(
+        description="'join' joins the lines start to end into one line, undoing hyphenation, "
+        "'replace' replaces the lines start to end with text"
+    )
+    start: int = Field(description="Number of the first line of the edit")
+    end: Optional[int] = Field(
+        default=None,
+        description="Number of the last line of the edit, defaults to start + 1 for 'join' and start for 'replace'",
+    )
+    text: str = Field(default="", description="Replacement text for 'replace', may span lines, empty to delete")
+
+
+class MarkdownEditList(BaseModel):
+    """Edits fixing the line breaks and formatting of a markdown chunk."""
+    edits: List[MarkdownEdit] = Field(description="Edits of the chunk, an empty list if it needs no changes")
+
+
+def split_into_chunks(text: str, max_lines: int) -> List[Tuple[str, bool]]:
+    """
+    Split markdown into chunks of at most max_lines lines at blank lines outside of code blocks.
+
+    Returns tuples of (chunk, editable), OCR image descriptions are separate chunks that are not editable.
+    Joining the chunks with blank lines restores the text.
+    """
+    chunks = []
+    position = 0
+    for match in OCR_BLOCK_PATTERN.finditer(text):
+        chunks.extend(_split_lines(text[position:match.start()], max_lines))
+        chunks.append((match.group(0).strip("\n"), False))
+        position = match.end()
+    chunks.extend(_split_lines(text[position:], max_lines))
+    return chunks
+
+
+def _split_lines(text: str, max_lines: int) -> List[Tuple[str, bool]]:
+    chunks = []
+    current = []
+    fence = None
+    for line in text.strip("\n").split("\n"):
+        fence_match = FENCE_PATTERN.match(line)
+        if fence is not None and line.strip().startswith(fence):
+            fence = None
+        elif fence is None and fence_match:
+            fence = fence_match.group(1)
+        elif fence is None and not line.strip() and len(current) >= max_lines:
+            chunks.append(("\n".join(current).strip("\n"), True))
+            current = []
+            continue
+        current.append(line)
+    if "".join(current).strip():
+        chunks.append(("\n".join(current).strip("\n"), True))
+    return chunks
+
+
+def number_lines(text: str) -> str:
+    """Prefix the lines of text with their 1-based numbers, as referenced by MarkdownEdit."""
+    return "\n".join(f"{number}| {line}" for number, line in enumerate(text.split("\n"), start=1))
+
+
+def apply_edits(text: str, edits: Sequence[MarkdownEdit]) -> Tuple[str, int]:
+    """
+    Apply the edits to the numbered lines of text.
+
+    Edits out of range or overlapping an earlier edit are skipped. Returns the edited text and the number of
+    skipped edits.
+    """
+    lines = text.split("\n")
+    accepted = []
+    skipped = 0
+    for edit in sorted(edits, key=lambda edit: edit.start):
+        end = edit.end if edit.end is not None else edit.start + (1 if edit.operation == "join" else 0)
+        valid = 1 <= edit.start <= end <= len(lines) and (edit.operation != "join" or end > edit.start)
+        if not valid or (accepted and edit.start <= accepted[-1][1]):
+            skipped += 1
+            continue
+        accepted.append((edit.start, end, edit))
+
+    # Apply from the bottom so the line numbers of the remaining edits stay valid
+    for start, end, edit in reversed(accepted):
+        if edit.operation == "join":
+            joined = ""
+            for line in lines[start - 1:end]:
+                joined = _join(joined, line.strip())
+            replacement = [joined]
+        else:
+            replacement = edit.text.split("\n") if edit.text else []
+        lines[start - 1:end] = replacement
+    return "\n".join(lines), skipped
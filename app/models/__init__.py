@@ -1,31 +1,80 @@
-from typing import List
+import importlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from typing import Dict, Iterable, Tuple
+from langchain_core.language_models.chat_models import BaseChatModel
+from app.settings import settings
 from app.models.model_provider import ModelProvider
-from app.models.openai import openai_provider
-from app.models.azure_openai import azure_openai_provider
-from app.models.ollama import ollama_provider
-from app.models.fake import fake_provider
+from app.models.scheduler import LLMScheduler, with_scheduler
 
+logger = getLogger(__name__)
 
-model_providers: List[ModelProvider] = [
-    openai_provider,
-    azure_openai_provider,
-    ollama_provider,
-    fake_provider,
-]
+# Provider name -> module defining "<provider name>_provider". Modules are imported when their provider is
+# first used, so the libraries of unused providers are never loaded.
+provider_modules: Dict[str, str] = {
+    "openai": "app.models.openai",
+    "azure_openai": "app.models.azure_openai",
+    "ollama": "app.models.ollama",
+    "fake": "app.models.fake",
+}
 
+# Provider name -> (requests per minute, tokens per minute), 0 means unlimited
+rate_limits = {
+    "openai": (settings.OPENAI_REQUESTS_PER_MINUTE, settings.OPENAI_TOKENS_PER_MINUTE),
+    "azure_openai": (settings.AZURE_OPENAI_REQUESTS_PER_MINUTE, settings.AZURE_OPENAI_TOKENS_PER_MINUTE),
+    "ollama": (settings.OLLAMA_REQUESTS_PER_MINUTE, settings.OLLAMA_TOKENS_PER_MINUTE),
+}
 
-def get_model(model_name: str):
+# Number of processes calling the providers at the same time, each one gets an equal share of the limits
+rate_limit_processes = 1
+
+# Provider name -> scheduler shared by all models of the provider
+schedulers: Dict[str, LLMScheduler] = {}
+
+
+def _process_rate_limits(provider_name: str) -> Tuple[int, int]:
+    # A limit never drops to 0, which would mean unlimited
+    return tuple(
+        max(1, limit // rate_limit_processes) if limit > 0 else 0 for limit in rate_limits.get(provider_name, (0, 0))
+    )
+
+
+def get_scheduler(provider_name: str) -> LLMScheduler:
+    """Return the shared scheduler of the provider, creating it on first use."""
+    if provider_name not in schedulers:
+        schedulers[provider_name] = LLMScheduler(provider_name, *_process_rate_limits(provider_name))
+    return schedulers[provider_name]
+
+
+def share_rate_limits(processes: int):
     """
-    Loads and returns the chat model based on the given model_name.
+    Limit this process to an equal share of the requests and tokens per minute of each provider, for the given
+    number of processes calling the providers at the same time. Schedulers only see the calls of their process.
+    """
+    global rate_limit_processes
+    rate_limit_processes = max(1, processes)
+    for provider_name, scheduler in schedulers.items():
+        scheduler.set_limits(*_process_rate_limits(provider_name))
 
-    The model_name should be in the format "provider:model", where:
-      - provider: Identifier for the model provider (e.g., "openai", "azure_openai", etc.)
-      - model: The specific model name within that provider
+
+def get_provider(provider_name: str) -> ModelProvider:
+    """
+    Imports and returns the model provider with the given name.
 
     Raises:
-        EnvironmentError: If model_name is empty or the provider is not found.
-        ValueError: If model_name is not in the correct format.
+        EnvironmentError: If the provider is not found.
     """
+    if provider_name not in provider_modules:
+        raise EnvironmentError(
+            f"Model provider '{provider_name}' not found in {list(provider_modules)}"
+        )
+    module = importlib.import_module(provider_modules[provider_name])
+    return getattr(module, f"{provider_name}_provider")
+
+
+def _split_model_name(model_name: str) -> Tuple[str, str]:
     if not model_name:
         raise ValueError("model_name is not set")
 
@@ -33,18 +82,77 @@ def get_model(model_name: str):
         provider_name, actual_model_name = model_name.split(":", 1)
     except ValueError:
         raise ValueError("model_name must be in the format 'provider:model'")
+    return provider_name, actual_model_name
 
-    for provider in model_providers:
-        if provider.get_name() == provider_name:
-            break
-    else:
-        model_provider_names = [provider.get_name() for provider in model_providers]
-        raise EnvironmentError(
-            f"Model provider '{provider_name}' not found in {model_provider_names}"
-        )
 
+def get_model(model_name: str):
+    """
+    Loads and returns the chat model based on the given model_name.
+
+    Only the configuration of the provider is checked, whether the model exists is checked by
+    validate_models, so loading a model makes no network requests.
+
+    If rate limits are configured for the provider, the chat model waits for the provider's scheduler
+    before each call.
+
+    The model_name should be in the format "provider:model", where:
+      - provider: Identifier for the model provider (e.g., "openai", "azure_openai", etc.)
+      - model: The specific model name within that provider
+
+    Raises:
+        EnvironmentError: If model_name is empty or the provider is not found.
+        ValueError: If model_name is not in the correct format.
+    """
+    provider_name, actual_model_name = _split_model_name(model_name)
+    provider = get_provider(provider_name)
     provider.validate_provider()
-    provider.validate_model_name(actual_model_name)
 
     ChatModel = provider.get_model(actual_model_name)
+    if any(rate_limits.get(provider_name, (0, 0))):
+        ChatModel = with_scheduler(ChatModel, get_scheduler(provider_name))
     return ChatModel
+
+
+def validate_models(model_names: Iterable[str]):
+    """
+    Check that all models exist at their providers, validating the providers concurrently.
+
+    Raises:
+        EnvironmentError: Listing every model that failed validation.
+    """
+    def validate(model_name: str):
+        provider_name, actual_model_name = _split_model_name(model_name)
+        provider = get_provider(provider_name)
+        provider.validate_provider()
+        provider.validate_model_name(actual_model_name)
+
+    start = time.perf_counter()
+    model_names = sorted(set(model_names))
+    errors = []
+    with ThreadPoolExecutor(max_workers=len(model_names) or 1) as executor:
+        futures = {model_name: executor.submit(validate, model_name) for model_name in model_names}
+        for model_name, future in futures.items():
+            try:
+                future.result()
+            except (EnvironmentError, ValueError) as e:
+                errors.append(f"{model_name}: {e}")
+    logger.info(f"Validated models {model_names} in {time.perf_counter() - start:.2f}s")
+    if errors:
+        raise EnvironmentError("Invalid model configuration:\n" + "\n".join(errors))
+
+
+# Model name -> chat model instance shared by all users of the model
+chat_models: Dict[str, BaseChatModel] = {}
+chat_models_lock = threading.Lock()
+
+
+def get_chat_model(model_name: str) -> BaseChatModel:
+    """
+    Returns the shared instance of the chat model for the given model_name, see get_model.
+
+    Instances are created once per process, so all users of a model share its configuration and clients.
+    """
+    with chat_models_lock:
+        if model_name not in chat_models:
+            chat_models[model_name] = get_model(model_name)()
+        return chat_models[model_name]
@@ -1,21 +1,24 @@
 from logging import getLogger
 import requests
 from functools import partialmethod
-from typing import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 from langchain_openai.chat_models import AzureChatOpenAI
 
 from app.settings import settings
+from app.models.http_client import get_async_http_client, get_http_client
 from app.models.model_provider import ModelProvider
 
 logger = getLogger(__name__)
 
 
 class AzureOpenAIProvider(ModelProvider):
-    deployments: Sequence[str] = []
-
     def get_name(self) -> str:
         return "azure_openai"
 
+    def get_catalog_key(self) -> str:
+        return f"azure_openai:{settings.AZURE_OPENAI_ENDPOINT}"
+
     def validate_provider(self):
         if not settings.AZURE_OPENAI_API_KEY:
             raise EnvironmentError("Azure OpenAI API key not found")
@@ -26,22 +29,27 @@ class AzureOpenAIProvider(ModelProvider):
                 "OpenAI API version not found, required for Azure OpenAI"
             )
 
+    def fetch_models(self) -> List[str]:
         # If this breaks in the future we have to use azure-mgmt-cognitiveservices which needs 6 additional
         # environment variables
         base_url = f"{settings.AZURE_OPENAI_ENDPOINT}/openai"
         headers = {"api-key": settings.AZURE_OPENAI_API_KEY}
-        models_response = requests.get(
-            f"{base_url}/models?api-version=2023-03-15-preview",
-            headers=headers,
-            timeout=30,
-        )
-        models_data = models_response.json()["data"]
-        deployments_response = requests.get(
-            f"{base_url}/deployments?api-version=2023-03-15-preview",
-            headers=headers,
-            timeout=30,
-        )
-        deployments_data = deployments_response.json()["data"]
+        # Both lists are independent, fetch them concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            models_future = executor.submit(
+                requests.get,
+                f"{base_url}/models?api-version=2023-03-15-preview",
+                headers=headers,
+                timeout=30,
+            )
+            deployments_future = executor.submit(
+                requests.get,
+                f"{base_url}/deployments?api-version=2023-03-15-preview",
+                headers=headers,
+                timeout=30,
+            )
+            models_data = models_future.result().json()["data"]
+            deployments_data = deployments_future.result().json()["data"]
 
         # Check if deployment["model"] is a substring of model["id"], i.e. "gpt-4o" is substring "gpt-4o-2024-05-13"
         chat_completion_models = ",".join(
@@ -49,19 +57,17 @@ class AzureOpenAIProvider(ModelProvider):
             for model in models_data
             if model["capabilities"]["chat_completion"]
         )
-        self.deployments = [
+        return [
             deployment["id"]
             for deployment in deployments_data
             if deployment["model"] in chat_completion_models
         ]
-        logger.info(f"Available Azure-OpenAI model deployments: {self.deployments}")
 
     def validate_model_name(self, model_name: str):
-        if not self.deployments:
-            self.validate_provider()
-        if model_name not in self.deployments:
+        deployments = self.get_available_models()
+        if model_name not in deployments:
             raise EnvironmentError(
-                f"Model deployment '{model_name}' not found. Available deployments: {self.deployments}"
+                f"Model deployment '{model_name}' not found. Available deployments: {deployments}"
             )
 
     def get_model(self, model_name: str):
@@ -69,6 +75,11 @@ class AzureOpenAIProvider(ModelProvider):
             __init__ = partialmethod(
                 AzureChatOpenAI.__init__,
                 azure_deployment=model_name,
+                # Report token usage, including cached prompt tokens, when streaming
+                stream_usage=True,
+                # Share keep-alive connections with the other models
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client(),
             )
 
         return ChatModel
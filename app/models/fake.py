@@ -1,3 +1,4 @@
+from typing import List
 from langchain_core.language_models.fake_chat_models import FakeChatModel
 from app.models.model_provider import ModelProvider
 
@@ -9,6 +10,9 @@ class FakeProvider(ModelProvider):
     def validate_provider(self):
         pass
 
+    def fetch_models(self) -> List[str]:
+        return []
+
     def validate_model_name(self, model_name: str):
         pass
 
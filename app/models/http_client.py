@@ -0,0 +1,43 @@
+"""
+HTTP clients shared by the chat models of all providers.
+
+Sharing one client per process lets the main, image and format models reuse the same keep-alive
+connections instead of each model opening its own pool.
+"""
+import threading
+
+import httpx
+
+from app.settings import settings
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def http_client_kwargs() -> dict:
+    """Connection pool limits and timeouts for HTTP clients created by provider libraries themselves."""
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+    }
+
+
+def _get_client(client_class):
+    with _clients_lock:
+        if client_class not in _clients:
+            _clients[client_class] = client_class(**http_client_kwargs())
+        return _clients[client_class]
+
+
+def get_http_client() -> httpx.Client:
+    """Return the shared synchronous HTTP client."""
+    return _get_client(httpx.Client)
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Return the shared asynchronous HTTP client."""
+    return _get_client(httpx.AsyncClient)
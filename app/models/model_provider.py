@@ -1,15 +1,35 @@
+import json
+import os
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Type
+from logging import getLogger
+from typing import List, Optional, Type
 from langchain_core.language_models.chat_models import BaseLanguageModel
 
+from app.cache import DiskCache
+from app.settings import settings
+
+logger = getLogger(__name__)
+
+# Model lists of all providers, shared across processes and restarts
+model_catalog = DiskCache(os.path.join(settings.CACHE_DIR, "model_catalog"))
+
 
 class ModelProvider(ABC):
     """
     Abstract base class for model providers.
 
     This class defines the interface that any model provider must implement.
+
+    The models available at a provider are cached on disk for MODEL_CATALOG_TTL seconds, so validating a
+    model usually needs no network request. If the provider cannot be reached, an expired list is used.
     """
 
+    def __init__(self):
+        self._models: Optional[List[str]] = None
+        self._models_lock = threading.Lock()
+
     @abstractmethod
     def get_name(self) -> str:
         """
@@ -26,13 +46,63 @@ class ModelProvider(ABC):
         Validate the configuration and integrity of the provider.
 
         This method should perform any necessary checks to ensure that the provider is properly configured
-        and ready to be used.
+        and ready to be used. It is called whenever a model is loaded, so it must not make network requests.
 
         Raises:
             ValueError: If the provider configuration is invalid.
         """
         pass
 
+    @abstractmethod
+    def fetch_models(self) -> List[str]:
+        """
+        Fetch the names of the models available at the provider.
+
+        Returns:
+            List[str]: The model names that validate_model_name accepts.
+        """
+        pass
+
+    def get_catalog_key(self) -> str:
+        """
+        Identify the model list in the catalog, providers with configurable endpoints include the endpoint.
+
+        Returns:
+            str: The catalog key of the provider.
+        """
+        return self.get_name()
+
+    def get_available_models(self) -> List[str]:
+        """
+        Return the models available at the provider, from the catalog if it is fresh.
+
+        Raises:
+            EnvironmentError: If the models cannot be fetched and the catalog has no list to fall back to.
+        """
+        with self._models_lock:
+            if self._models is not None:
+                return self._models
+
+            cached = model_catalog.get(self.get_catalog_key())
+            entry = json.loads(cached) if cached is not None else None
+            if entry is not None and time.time() - entry["fetched_at"] < settings.MODEL_CATALOG_TTL:
+                self._models = entry["models"]
+                return self._models
+
+            try:
+                models = self.fetch_models()
+            except Exception as e:
+                if entry is None:
+                    raise EnvironmentError(f"Failed to list the models of provider '{self.get_name()}': {e}") from e
+                logger.warning(f"Failed to list the models of provider '{self.get_name()}', using the cached list: {e}")
+                self._models = entry["models"]
+                return self._models
+
+            logger.info(f"Available {self.get_name()} models: {models}")
+            model_catalog.set(self.get_catalog_key(), json.dumps({"fetched_at": time.time(), "models": models}))
+            self._models = models
+            return self._models
+
     @abstractmethod
     def validate_model_name(self, model_name: str):
         """
@@ -1,31 +1,35 @@
 from functools import partialmethod
 from logging import getLogger
-from typing import Sequence
+from typing import List
 from requests.auth import _basic_auth_str as basic_auth_str
 from ollama import Client
 from langchain_ollama.chat_models import ChatOllama
 
 from app.settings import settings
+from app.models.http_client import http_client_kwargs
 from app.models.model_provider import ModelProvider
 
 logger = getLogger(__name__)
 
-client = Client(
-    host=settings.OLLAMA_HOST,
-    headers={
-        "Authorization": basic_auth_str(
-            settings.OLLAMA_BASIC_AUTH_USERNAME, settings.OLLAMA_BASIC_AUTH_PASSWORD
-        )
-    },
-)
 
+def _create_client() -> Client:
+    return Client(
+        host=settings.OLLAMA_HOST,
+        headers={
+            "Authorization": basic_auth_str(
+                settings.OLLAMA_BASIC_AUTH_USERNAME, settings.OLLAMA_BASIC_AUTH_PASSWORD
+            )
+        },
+    )
 
-class OllamaProvider(ModelProvider):
-    models: Sequence[str] = []
 
+class OllamaProvider(ModelProvider):
     def get_name(self) -> str:
         return "ollama"
 
+    def get_catalog_key(self) -> str:
+        return f"ollama:{settings.OLLAMA_HOST}"
+
     def validate_provider(self):
         if (
             not settings.OLLAMA_BASIC_AUTH_USERNAME
@@ -35,6 +39,8 @@ class OllamaProvider(ModelProvider):
         if not settings.OLLAMA_HOST:
             raise EnvironmentError("Ollama host not found")
 
+    def fetch_models(self) -> List[str]:
+        client = _create_client()
         data = client._request(
             dict,
             "GET",
@@ -45,15 +51,13 @@ class OllamaProvider(ModelProvider):
                 "Ollama version not found, check the Ollama configuration"
             )
         logger.info(f"Ollama version: {data['version']}")
+        return [model.model for model in client.list().models]
 
     def validate_model_name(self, model_name: str):
-        if not self.models:
-            models = client.list().models
-            self.models = [model.model for model in models]
-            logger.info(f"Available Ollama models: {self.models}")
-        if model_name not in self.models:
+        models = self.get_available_models()
+        if model_name not in models:
             raise EnvironmentError(
-                f"Model '{model_name}' not found. Available models: {self.models}"
+                f"Model '{model_name}' not found. Available models: {models}"
             )
 
     def get_model(self, model_name: str):
@@ -62,13 +66,17 @@ class OllamaProvider(ModelProvider):
                 ChatOllama.__init__,
                 model=model_name,
                 base_url=settings.OLLAMA_HOST,
+                # Without it Ollama silently truncates prompts longer than its small default window
+                num_ctx=settings.OLLAMA_CONTEXT_WINDOW,
+                # The ollama client creates its own HTTP client, configured like the shared ones
                 client_kwargs={
                     "headers": {
                         "Authorization": basic_auth_str(
                             settings.OLLAMA_BASIC_AUTH_USERNAME,
                             settings.OLLAMA_BASIC_AUTH_PASSWORD,
                         )
-                    }
+                    },
+                    **http_client_kwargs(),
                 },
             )
 
@@ -1,17 +1,17 @@
 from functools import partialmethod
 from logging import getLogger
-from typing import Sequence
+from typing import List
 import openai
 from langchain_openai.chat_models import ChatOpenAI
 
 from app.settings import settings
+from app.models.http_client import get_async_http_client, get_http_client
 from app.models.model_provider import ModelProvider
 
 logger = getLogger(__name__)
 
-class OpenAIProvider(ModelProvider):
-    models: Sequence[str] = []
 
+class OpenAIProvider(ModelProvider):
     def get_name(self) -> str:
         return "openai"
 
@@ -19,19 +19,15 @@ class OpenAIProvider(ModelProvider):
         if not settings.OPENAI_API_KEY:
             raise EnvironmentError("OpenAI API key not found")
 
-        openai.api_type = "openai"
-        models = openai.models.list().data
-        self.models = [model.id for model in models]
+    def fetch_models(self) -> List[str]:
+        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY, http_client=get_http_client())
+        return [model.id for model in client.models.list().data]
 
     def validate_model_name(self, model_name: str):
-        if not self.models:
-            openai.api_type = "openai"
-            models = openai.models.list().data
-            self.models = [model.id for model in models]
-            logger.info(f"Available OpenAI models: {self.models}")
-        if model_name not in self.models:
+        models = self.get_available_models()
+        if model_name not in models:
             raise EnvironmentError(
-                f"Model '{model_name}' not found. Available models: {self.models}"
+                f"Model '{model_name}' not found. Available models: {models}"
             )
 
     def get_model(self, model_name: str):
@@ -39,6 +35,11 @@ class OpenAIProvider(ModelProvider):
             __init__ = partialmethod(
                 ChatOpenAI.__init__,
                 model=model_name,
+                # Report token usage, including cached prompt tokens, when streaming
+                stream_usage=True,
+                # Share keep-alive connections with the other models
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client(),
             )
 
         return ChatModel
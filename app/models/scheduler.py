@@ -0,0 +1,356 @@
+"""
+Shared scheduler for the LLM calls of a provider.
+
+All chat models returned by `get_model` acquire a slot from the scheduler of their provider before each
+call. The scheduler enforces the requests and tokens per minute of the provider with token buckets, lets
+interactive reviews go before batch reviews and, within a priority, prefers the review with the fewest
+calls in flight, so one large review cannot starve the others.
+
+The buckets live in the memory of a process. Processes calling the same provider at the same time, i.e. the
+conversion workers of a batch review, must each be given their share of the limits with
+`app.models.share_rate_limits`. Priorities only order the calls within a process, the web interface and a
+batch review running next to it do not know of each other.
+"""
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from logging import getLogger
+from typing import Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+
+logger = getLogger(__name__)
+
+# Lower rank is scheduled first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# Tokens reserved for the completion of a call, corrected by the actual usage once the call finished
+ESTIMATED_COMPLETION_TOKENS = 1000
+# Tokens assumed per image part of a message
+ESTIMATED_IMAGE_TOKENS = 1000
+# Number of reviews whose last admitted call is remembered for fairness
+MAX_TRACKED_REVIEWS = 1000
+# Queueing delays below this many seconds are only logged at debug level
+REPORTED_DELAY_SECONDS = 0.1
+
+# (priority, review id) of the LLM calls made in the current context
+_call_context = contextvars.ContextVar("llm_call_context", default=None)
+_default_priority = "interactive"
+# Whether the current call was already admitted by a wrapped method delegating to another one
+_scheduled = contextvars.ContextVar("llm_call_scheduled", default=False)
+
+
+@contextmanager
+def llm_call_context(priority: str = "interactive", review_id: Optional[str] = None):
+    """
+    Schedule the LLM calls made within the context with the given priority and attribute them to review_id.
+
+    LangChain copies the context into the threads and tasks it runs runnables in, so the context also
+    applies to the reviewers running in parallel.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Priority must be one of {list(PRIORITIES)}")
+    token = _call_context.set((priority, review_id))
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def set_default_priority(priority: str):
+    """Set the priority of LLM calls made outside of an llm_call_context, i.e. in batch worker processes."""
+    global _default_priority
+    if priority not in PRIORITIES:
+        raise ValueError(f"Priority must be one of {list(PRIORITIES)}")
+    _default_priority = priority
+
+
+def estimate_tokens(messages: Sequence[BaseMessage]) -> int:
+    """Roughly estimate the prompt tokens of the messages plus the tokens of the completion."""
+    tokens = ESTIMATED_COMPLETION_TOKENS
+    for message in messages:
+        if isinstance(message.content, str):
+            tokens += len(message.content) // 4
+            continue
+        for part in message.content:
+            if isinstance(part, str):
+                tokens += len(part) // 4
+            elif part.get("type") == "text":
+                tokens += len(part.get("text", "")) // 4
+            else:
+                tokens += ESTIMATED_IMAGE_TOKENS
+    return tokens
+
+
+class TokenBucket:
+    """Token bucket refilling per_minute tokens per minute, holding at most one minute worth of tokens."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.rate = per_minute / 60
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: int, now: float) -> float:
+        """Seconds until amount tokens are available. Amounts above the capacity only need a full bucket."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        # The level may become negative when the actual usage exceeds the estimate
+        self.level -= amount
+
+    def drain(self):
+        self.level = min(self.level, 0.0)
+
+
+class _Ticket:
+    def __init__(self, rank: int, sequence: int, review_id: Optional[str]):
+        self.rank = rank
+        self.sequence = sequence
+        self.review_id = review_id
+
+
+class ScheduledCall:
+    """A granted LLM call, reporting its actual token usage back to the scheduler when released."""
+
+    def __init__(self, priority: str, review_id: Optional[str], estimated_tokens: int, queued_seconds: float):
+        self.priority = priority
+        self.review_id = review_id
+        self.estimated_tokens = estimated_tokens
+        self.queued_seconds = queued_seconds
+        self.used_tokens: Optional[int] = None
+        self.rate_limited = False
+
+    def add_usage(self, message):
+        """Add the usage of a streamed chunk, if it reports any."""
+        tokens = _usage_tokens(message)
+        if tokens is not None:
+            self.used_tokens = (self.used_tokens or 0) + tokens
+
+    def check_rate_limit(self, error: Exception):
+        """Remember whether the call failed because the provider rate limited it."""
+        self.rate_limited = getattr(error, "status_code", None) == 429
+
+
+class LLMScheduler:
+    """
+    Admits the LLM calls of one provider within its requests and tokens per minute.
+
+    A limit of 0 disables the corresponding bucket. Calls wait in a single queue ordered by priority, then
+    by the number of calls in flight of their review and by how long ago their review was last admitted,
+    then by arrival.
+    """
+
+    def __init__(self, name: str, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.name = name
+        self._condition = threading.Condition()
+        self.set_limits(requests_per_minute, tokens_per_minute)
+        self._waiting = []
+        self._in_flight = Counter()
+        # Review id -> time of its last admitted call, to take turns between reviews
+        self._last_admitted = {}
+        self._sequence = itertools.count()
+        self._stats = {priority: {"calls": 0, "queued_seconds": 0.0, "max_queued_seconds": 0.0}
+                       for priority in PRIORITIES}
+
+    def set_limits(self, requests_per_minute: int, tokens_per_minute: int):
+        """Replace the budgets with full buckets of the given limits, 0 disables a bucket."""
+        with self._condition:
+            self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+            self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+            self._condition.notify_all()
+
+    def _next_ticket(self) -> _Ticket:
+        return min(self._waiting, key=lambda ticket: (
+            ticket.rank,
+            self._in_flight[ticket.review_id],
+            self._last_admitted.get(ticket.review_id, 0.0),
+            ticket.sequence,
+        ))
+
+    def _wait_time(self, estimated_tokens: int) -> float:
+        now = time.monotonic()
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.wait_time(1, now))
+        if self.token_bucket is not None:
+            wait = max(wait, self.token_bucket.wait_time(estimated_tokens, now))
+        return wait
+
+    def acquire(self, estimated_tokens: int) -> ScheduledCall:
+        """Block until the call is next in line and fits into the budgets of the provider."""
+        priority, review_id = _call_context.get() or (_default_priority, None)
+        start = time.monotonic()
+        ticket = _Ticket(PRIORITIES[priority], next(self._sequence), review_id)
+        with self._condition:
+            self._waiting.append(ticket)
+            while True:
+                if self._next_ticket() is ticket:
+                    wait = self._wait_time(estimated_tokens)
+                    if wait <= 0:
+                        break
+                    self._condition.wait(wait)
+                else:
+                    self._condition.wait()
+
+            self._waiting.remove(ticket)
+            if self.request_bucket is not None:
+                self.request_bucket.take(1)
+            if self.token_bucket is not None:
+                self.token_bucket.take(estimated_tokens)
+            self._in_flight[review_id] += 1
+            self._last_admitted[review_id] = time.monotonic()
+            if len(self._last_admitted) > MAX_TRACKED_REVIEWS:
+                oldest = sorted(self._last_admitted, key=self._last_admitted.get)[:MAX_TRACKED_REVIEWS // 2]
+                for old_review_id in oldest:
+                    del self._last_admitted[old_review_id]
+
+            queued_seconds = time.monotonic() - start
+            stats = self._stats[priority]
+            stats["calls"] += 1
+            stats["queued_seconds"] += queued_seconds
+            stats["max_queued_seconds"] = max(stats["max_queued_seconds"], queued_seconds)
+            # Let the next ticket check whether it can go
+            self._condition.notify_all()
+
+        log = logger.info if queued_seconds >= REPORTED_DELAY_SECONDS else logger.debug
+        log(
+            f"{self.name} call of review {review_id} ({priority}) queued for {queued_seconds:.2f}s, "
+            f"~{estimated_tokens} tokens, {len(self._waiting)} calls waiting"
+        )
+        return ScheduledCall(priority, review_id, estimated_tokens, queued_seconds)
+
+    def release(self, call: ScheduledCall):
+        """Correct the token budget by the actual usage of the call and let waiting calls proceed."""
+        with self._condition:
+            self._in_flight[call.review_id] -= 1
+            if self._in_flight[call.review_id] <= 0:
+                del self._in_flight[call.review_id]
+            if self.token_bucket is not None and call.used_tokens is not None:
+                self.token_bucket.take(call.used_tokens - call.estimated_tokens)
+            if call.rate_limited:
+                # The provider disagrees with our budget, back off until the buckets refill
+                logger.warning(f"{self.name} rate limit hit, pausing calls until the budgets refill")
+                if self.request_bucket is not None:
+                    self.request_bucket.drain()
+                if self.token_bucket is not None:
+                    self.token_bucket.drain()
+            self._condition.notify_all()
+
+    @contextmanager
+    def scheduled(self, messages: Sequence[BaseMessage]):
+        call = self.acquire(estimate_tokens(messages))
+        try:
+            yield call
+        except Exception as e:
+            call.check_rate_limit(e)
+            raise
+        finally:
+            self.release(call)
+
+    def stats(self) -> dict:
+        """Number of calls and their total and maximum queueing delay in seconds per priority."""
+        with self._condition:
+            return {priority: dict(stats) for priority, stats in self._stats.items()}
+
+
+def _usage_tokens(message) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+def _result_tokens(result) -> Optional[int]:
+    return _usage_tokens(result.generations[0].message) if result.generations else None
+
+
+def with_scheduler(chat_model_class, scheduler: LLMScheduler):
+    """
+    Subclass the chat model so that every call is admitted by the scheduler.
+
+    Only the call methods implemented by the chat model itself are wrapped, wrapping the streaming defaults
+    of BaseChatModel would make LangChain stream models that cannot. Calls that a wrapped method delegates
+    to another wrapped method, i.e. _agenerate running _generate in a thread, are admitted only once.
+    """
+    namespace = {"__module__": chat_model_class.__module__}
+
+    if chat_model_class._generate is not BaseChatModel._generate:
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            if _scheduled.get():
+                return super(model_class, self)._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            with scheduler.scheduled(messages) as call:
+                token = _scheduled.set(True)
+                try:
+                    result = super(model_class, self)._generate(
+                        messages, stop=stop, run_manager=run_manager, **kwargs
+                    )
+                finally:
+                    _scheduled.reset(token)
+                call.used_tokens = _result_tokens(result)
+                return result
+        namespace["_generate"] = _generate
+
+    if chat_model_class._stream is not BaseChatModel._stream:
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            if _scheduled.get():
+                yield from super(model_class, self)._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+                return
+            with scheduler.scheduled(messages) as call:
+                for chunk in super(model_class, self)._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    call.add_usage(chunk.message)
+                    yield chunk
+        namespace["_stream"] = _stream
+
+    if chat_model_class._agenerate is not BaseChatModel._agenerate:
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            if _scheduled.get():
+                return await super(model_class, self)._agenerate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                )
+            call = await asyncio.to_thread(scheduler.acquire, estimate_tokens(messages))
+            token = _scheduled.set(True)
+            try:
+                result = await super(model_class, self)._agenerate(
+                    messages, stop=stop, run_manager=run_manager, **kwargs
+                )
+                call.used_tokens = _result_tokens(result)
+                return result
+            except Exception as e:
+                call.check_rate_limit(e)
+                raise
+            finally:
+                _scheduled.reset(token)
+                scheduler.release(call)
+        namespace["_agenerate"] = _agenerate
+
+    if chat_model_class._astream is not BaseChatModel._astream:
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            stream = super(model_class, self)._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            if _scheduled.get():
+                async for chunk in stream:
+                    yield chunk
+                return
+            call = await asyncio.to_thread(scheduler.acquire, estimate_tokens(messages))
+            try:
+                async for chunk in stream:
+                    call.add_usage(chunk.message)
+                    yield chunk
+            except Exception as e:
+                call.check_rate_limit(e)
+                raise
+            finally:
+                scheduler.release(call)
+        namespace["_astream"] = _astream
+
+    model_class = type(chat_model_class.__name__, (chat_model_class,), namespace)
+    return model_class
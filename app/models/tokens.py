@@ -0,0 +1,84 @@
+"""
+Local estimates of the tokens and context windows of the configured models.
+
+The tokenizers of the providers are not available offline, so tokens are estimated the way byte pair
+encodings split text: every word costs at least one token and long words one token per word_length
+characters, runs of punctuation about one token per two characters and line breaks one token each. Spaces
+between words are merged into the following word. Estimates are slightly above the actual counts for
+English and German text, which is the safe side for budgets.
+"""
+import math
+import re
+from typing import Tuple
+
+from app.settings import settings
+
+# Words, runs of punctuation and runs of whitespace, like the pre-tokenizers of byte pair encodings
+PIECE_PATTERN = re.compile(r'\w+|[^\w\s]+|\s+')
+
+# Provider name -> average characters per token within a word. Llama, Qwen and Mistral models served by
+# Ollama have smaller vocabularies than the OpenAI models and split words more often.
+WORD_LENGTHS = {"openai": 6.0, "azure_openai": 6.0, "ollama": 4.0}
+DEFAULT_WORD_LENGTH = 4.0
+
+# Model name prefix -> context window in tokens, the longest matching prefix wins
+OPENAI_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16_385,
+    "gpt-4-turbo": 128_000,
+    "gpt-4o": 128_000,
+    "gpt-4.1": 1_047_576,
+    "gpt-5": 400_000,
+    "o1": 200_000,
+    "o3": 200_000,
+    "o4": 200_000,
+}
+# Context window of unknown OpenAI models and Azure deployments, whose names need not match the model
+DEFAULT_CONTEXT_WINDOW = 128_000
+
+
+class TokenEstimator:
+    """Estimates the tokens of a text for a tokenizer averaging word_length characters per token in words."""
+
+    def __init__(self, word_length: float):
+        self.word_length = word_length
+
+    def count(self, text: str) -> int:
+        tokens = 0
+        for piece in PIECE_PATTERN.findall(text):
+            if piece[0].isspace():
+                # A single space belongs to the next word, other whitespace to its own tokens
+                tokens += piece.count("\n") or (len(piece) > 1)
+            elif piece[0].isalnum() or piece[0] == "_":
+                tokens += math.ceil(len(piece) / self.word_length)
+            else:
+                tokens += math.ceil(len(piece) / 2)
+        return tokens
+
+
+def _split_model_name(model_name: str) -> Tuple[str, str]:
+    provider_name, _, actual_model_name = model_name.partition(":")
+    return provider_name, actual_model_name
+
+
+def get_token_estimator(model_name: str) -> TokenEstimator:
+    """Return the token estimator for the model, given as "provider:model"."""
+    provider_name, _ = _split_model_name(model_name)
+    return TokenEstimator(WORD_LENGTHS.get(provider_name, DEFAULT_WORD_LENGTH))
+
+
+def get_context_window(model_name: str) -> int:
+    """
+    Return the context window of the model in tokens, given as "provider:model".
+
+    MODEL_CONTEXT_WINDOW overrides the window of MODEL_NAME. Ollama models are run with a context window of
+    OLLAMA_CONTEXT_WINDOW tokens, OpenAI models have the window of their model family.
+    """
+    if model_name == settings.MODEL_NAME and settings.MODEL_CONTEXT_WINDOW:
+        return settings.MODEL_CONTEXT_WINDOW
+    provider_name, actual_model_name = _split_model_name(model_name)
+    if provider_name == "ollama":
+        return settings.OLLAMA_CONTEXT_WINDOW
+    prefixes = [prefix for prefix in OPENAI_CONTEXT_WINDOWS if actual_model_name.startswith(prefix)]
+    if not prefixes:
+        return DEFAULT_CONTEXT_WINDOW
+    return OPENAI_CONTEXT_WINDOWS[max(prefixes, key=len)]
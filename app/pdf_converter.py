@@ -1,10 +1,36 @@
+import base64
+import hashlib
+import os
 import re
+import tempfile
+import time
+from logging import getLogger
+import pymupdf
 import pymupdf4llm
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
 from langfuse.callback import CallbackHandler
 
+from app.cache import DiskCache
+from app.figure_inventory import SIZE_TOLERANCE, FigureInventory, append_figure_inventory, build_figure_inventory
+from app.image_preprocessing import prepare_images
+from app.markdown_cleanup import (
+    OCR_END,
+    OCR_START,
+    MarkdownEditList,
+    apply_edits,
+    clean_page,
+    join_pages,
+    normalize_heading_levels,
+    number_lines,
+    quality_problems,
+    remove_headers_and_footers,
+    split_into_chunks,
+)
 from app.settings import settings
-from app.models import get_model
+from app.models import get_chat_model
 
+logger = getLogger(__name__)
 
 callbacks = []
 if settings.langfuse_enabled:
@@ -13,48 +39,292 @@ if settings.langfuse_enabled:
     callbacks.append(langfuse_handler)
 
 
-ImageModel = get_model(settings.IMAGE_MODEL_NAME)
-image_model = ImageModel().with_config(callbacks=callbacks)
+image_model = get_chat_model(settings.IMAGE_MODEL_NAME).with_config(callbacks=callbacks)
+format_model = None
 
-FormatModel = get_model(settings.FORMAT_MODEL_NAME)
-format_model = FormatModel().with_config(callbacks=callbacks)
+FORMAT_INSTRUCTIONS = """Fix the line breaks and formatting of the following markdown text extracted from a PDF page.
+Each line is prefixed with its number. Do not rewrite the text, only return edits of the numbered lines:
+- "join" the lines start to end into one line, i.e. a paragraph or a word broken across lines
+- "replace" the lines start to end with new text, i.e. to fix headings, lists or letter-spaced words
+
+Only fix the formatting, keep the wording. Return no edits if the text is fine."""
+
+image_description_cache = DiskCache(os.path.join(settings.CACHE_DIR, "image_descriptions"))
+
+# Bump whenever the conversion pipeline changes its output to invalidate cached conversions
+CONVERTER_VERSION = "8"
+
+conversion_cache = DiskCache(
+    os.path.join(settings.CACHE_DIR, "conversions"),
+    max_size_bytes=settings.CONVERSION_CACHE_MAX_BYTES,
+)
+
+# pymupdf4llm writes image links as "![](path)" on their own line
+IMAGE_LINK_PATTERN = re.compile(r'!\[\]\(([^)\n]*)\n?\)')
+# Resolution pymupdf4llm renders images at, which maps their pixel size back to their size on the page
+IMAGE_DPI = 150
+
+
+def _image_cache_key(image_path: str):
+    # Key on the image bytes so identical images share one description per image model
+    with open(image_path, "rb") as image_file:
+        digest = hashlib.sha256(image_file.read()).hexdigest()
+    return f"{settings.IMAGE_MODEL_NAME}:{digest}"
+
+
+def _describe_image(image_path: str, config):
+    # Only encode the image once its request is in flight to keep at most a few base64 copies in memory
+    extension = os.path.splitext(image_path)[1].lstrip(".") or "png"
+    with open(image_path, "rb") as image_file:
+        data = base64.b64encode(image_file.read()).decode()
+    message = {
+        "role": "user",
+        "content": [
+            {
+                "type": "text",
+                "text": "Accurately describe the image in detail so a blind person can understand it perfectly:",
+            },
+            {
+                "type": "image_url",
+                "image_url": {"url": f"data:image/{extension};base64,{data}"},
+            },
+        ],
+    }
+    return image_model.invoke([message], config).content
+
+
+def describe_images(image_paths):
+    """
+    Describe the given image files, returning a mapping from image path to description.
+
+    Cached descriptions are reused, all remaining unique images are described concurrently with at most
+    IMAGE_DESCRIPTION_CONCURRENCY requests in flight.
+    """
+    keys = {image_path: _image_cache_key(image_path) for image_path in image_paths}
+
+    descriptions = {}
+    missing = {}
+    for image_path, key in keys.items():
+        cached = image_description_cache.get(key)
+        if cached is not None:
+            descriptions[key] = cached
+        else:
+            missing.setdefault(key, image_path)
+
+    if missing:
+        new_descriptions = RunnableLambda(_describe_image).batch(
+            list(missing.values()),
+            config={"max_concurrency": settings.IMAGE_DESCRIPTION_CONCURRENCY},
+        )
+        for key, description in zip(missing, new_descriptions):
+            image_description_cache.set(key, description)
+            descriptions[key] = description
+
+    return {image_path: descriptions[key] for image_path, key in keys.items()}
+
+
+def split_image_links(md_text: str):
+    """
+    Tokenize the markdown in a single pass into text segments and image references.
+
+    Returns the segments, where image links are replaced by integer ids, and the id-indexed list of image
+    paths.
+    """
+    segments = []
+    image_paths = []
+    position = 0
+    for match in IMAGE_LINK_PATTERN.finditer(md_text):
+        segments.append(md_text[position:match.start()])
+        segments.append(len(image_paths))
+        image_paths.append(match.group(1))
+        position = match.end()
+    segments.append(md_text[position:])
+    return segments, image_paths
+
+
+def _decorative_rects(chunk: dict, page: int, inventory: FigureInventory):
+    """Return the bounding boxes of the images pymupdf4llm found on the page that the inventory marks decorative."""
+    rects = []
+    for image in chunk["images"]:
+        item = inventory.find(page, tuple(image["bbox"]))
+        if item is not None and item.decorative:
+            rects.append(pymupdf.Rect(image["bbox"]))
+    return rects
+
+
+def _is_decorative(image_path: str, decorative_rects):
+    # Images are rendered from their bounding box on the page at IMAGE_DPI
+    if not decorative_rects:
+        return False
+    pixmap = pymupdf.Pixmap(image_path)
+    width, height = pixmap.width * 72 / IMAGE_DPI, pixmap.height * 72 / IMAGE_DPI
+    return any(
+        abs(rect.width - width) <= SIZE_TOLERANCE and abs(rect.height - height) <= SIZE_TOLERANCE
+        for rect in decorative_rects
+    )
+
+
+def _ocr_description_block(description: str):
+    return OCR_START + "\n" + description + "\n" + OCR_END + "\n"
+
+
+def _conversion_cache_key(path: str):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as pdf_file:
+        for chunk in iter(lambda: pdf_file.read(1 << 20), b""):
+            sha256.update(chunk)
+    return ":".join([
+        sha256.hexdigest(), settings.IMAGE_MODEL_NAME, settings.FORMAT_MODEL_NAME, CONVERTER_VERSION,
+        f"{settings.IMAGE_MAX_SIZE}-{settings.IMAGE_MIN_SIZE}-{settings.IMAGE_MIN_ENTROPY}",
+    ])
 
 
 def convert_pdf_to_clean_markdown(path: str):
-  md_text = pymupdf4llm.to_markdown(path, embed_images=True)
-  
-  # Replace first four lines
-  md_text = re.sub(r'^(.*?\n){4}', '', md_text)
-
-  # Replace page numbers
-  md_text = re.sub(r'\n\d+\n', '\n', md_text)
-
-  # Remove image links with OCR descriptions
-  while "![]" in md_text:
-      data = re.search(r'!\[\]\((.*?)\n\)', md_text)
-      message = {
-          "role": "user",
-          "content": [
-              {
-                  "type": "text",
-                  "text": "Accurately describe the image in detail so a blind person can understand it perfectly:",
-              },
-              {
-                  "type": "image_url",
-                  "image_url": { "url": data.group(1) },
-              },
-          ],
-      }
-      response = image_model.invoke([message])
-      description = "<<< OCR IMAGE DESCRIPTION START >>>\n" + response.content + "\n<<< OCR IMAGE DESCRIPTION END >>>\n"
-      md_text = md_text.replace(data.group(0), description)
-
-  # Fix formatting
-  result = format_model.invoke(
-      [
-          { "role": "system", "content": "Fix the line breaks and formatting in the following markdown text. Keep the OCR IMAGE DESCRIPTION intact." },
-          { "role": "user", "content": md_text }
-      ],
-      prediction={"type": "content", "content": md_text },
-  )
-  return result.content
\ No newline at end of file
+    """
+    Convert the PDF at path to clean markdown with OCR image descriptions.
+
+    Conversions are cached by the PDF's content hash and the converter configuration, so uploading the
+    same PDF again skips the conversion entirely.
+    """
+    key = _conversion_cache_key(path)
+    md_text = conversion_cache.get(key)
+    if md_text is None:
+        md_text = _convert_pdf_to_clean_markdown(path)
+        conversion_cache.set(key, md_text)
+    logger.info(f"Conversion cache: {conversion_cache.stats()}")
+    return md_text
+
+
+def get_format_model():
+    """
+    Return the format model, which returns edits of the numbered lines instead of rewriting the whole text.
+
+    It is built on first use, so converting PDFs whose pages need no formatting works with models without
+    structured output.
+    """
+    global format_model
+    if format_model is None:
+        format_model = get_chat_model(settings.FORMAT_MODEL_NAME).with_structured_output(
+            convert_to_openai_tool(MarkdownEditList)["function"]
+        ).with_config(callbacks=callbacks)
+    return format_model
+
+
+def _format_chunk(chunk: str, config):
+    result = get_format_model().invoke(
+        [
+            {"role": "system", "content": FORMAT_INSTRUCTIONS},
+            {"role": "user", "content": number_lines(chunk)}
+        ],
+        config,
+    )
+    edits = MarkdownEditList.model_validate(result).edits
+    formatted, skipped = apply_edits(chunk, edits)
+    if skipped:
+        logger.warning(f"Skipped {skipped} of {len(edits)} invalid or overlapping edits of the format model")
+    return formatted
+
+
+def _format_pages(pages, page_numbers):
+    """Format the given pages with the format model, in chunks formatted concurrently."""
+    pages_chunks = {
+        number: split_into_chunks(pages[number - 1], settings.FORMAT_CHUNK_LINES) for number in page_numbers
+    }
+    editable = [
+        (number, index)
+        for number, chunks in pages_chunks.items()
+        for index, (_, is_editable) in enumerate(chunks)
+        if is_editable
+    ]
+    results = RunnableLambda(_format_chunk).batch(
+        [pages_chunks[number][index][0] for number, index in editable],
+        config={"max_concurrency": settings.PAGE_CLEANUP_CONCURRENCY},
+        return_exceptions=True,
+    )
+    for (number, index), result in zip(editable, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Failed to format a chunk of page {number}, keeping it as is: {result}")
+        else:
+            pages_chunks[number][index] = (result, True)
+
+    # Chunks never split OCR image descriptions, which are not editable, so stitching keeps them intact
+    for number, chunks in pages_chunks.items():
+        # Clean up again to continue paragraphs split at chunk boundaries
+        pages[number - 1] = clean_page("\n\n".join(chunk for chunk, _ in chunks))
+    return pages
+
+
+def _convert_pdf_to_clean_markdown(path: str):
+    # Spill images to a temporary directory instead of embedding them as base64 in the markdown
+    with tempfile.TemporaryDirectory() as image_dir, pymupdf.open(path) as document:
+        chunks = pymupdf4llm.to_markdown(
+            document, write_images=True, image_path=image_dir, dpi=IMAGE_DPI, page_chunks=True
+        )
+        if not chunks:
+            return ""
+        pages = [chunk["text"] for chunk in chunks]
+
+        # List figures and tables from the PDF layout, reusing the tables pymupdf4llm detected
+        start = time.perf_counter()
+        inventory = build_figure_inventory(document, [chunk["tables"] for chunk in chunks])
+        logger.info(f"Found {len(inventory.items)} figures and tables in {time.perf_counter() - start:.2f}s")
+
+        # Replace first four lines
+        pages[0] = re.sub(r'^(.*?\n){4}', '', pages[0])
+
+        # Remove page numbers and running headers and footers
+        pages = remove_headers_and_footers(pages)
+
+        # Replace image links with OCR descriptions, describing the images of all pages at once
+        pages_segments = []
+        image_paths = []
+        # Logos, icons and other decoration are dropped without a vision call
+        decorative = set()
+        for number, (page, chunk) in enumerate(zip(pages, chunks), start=1):
+            segments, page_image_paths = split_image_links(page)
+            pages_segments.append([
+                segment if isinstance(segment, str) else segment + len(image_paths) for segment in segments
+            ])
+            image_paths.extend(page_image_paths)
+            decorative_rects = _decorative_rects(chunk, number, inventory)
+            decorative.update(path for path in page_image_paths if _is_decorative(path, decorative_rects))
+        if decorative:
+            logger.info(f"Skipping {len(decorative)} decorative images")
+        # Drop blank and tiny images, describe repeated images once and send the others downscaled
+        preparation = prepare_images(
+            [image_path for image_path in image_paths if image_path not in decorative],
+            max_size=settings.IMAGE_MAX_SIZE,
+            min_size=settings.IMAGE_MIN_SIZE,
+            min_entropy=settings.IMAGE_MIN_ENTROPY,
+        )
+        logger.info(f"Prepared images: {preparation.summary()}")
+        prepared_paths = {image_path: preparation.images.get(image_path) for image_path in image_paths}
+        descriptions = describe_images([path for path in dict.fromkeys(prepared_paths.values()) if path is not None])
+        pages = [
+            "".join(
+                segment if isinstance(segment, str)
+                else "" if prepared_paths[image_paths[segment]] is None
+                else _ocr_description_block(descriptions[prepared_paths[image_paths[segment]]])
+                for segment in segments
+            )
+            for segments in pages_segments
+        ]
+
+    # Fix formatting locally and fall back to the format model if still broken. The cleanup is pure Python and
+    # takes milliseconds per page, threads would only contend for the GIL.
+    start = time.perf_counter()
+    pages = [clean_page(page) for page in pages]
+    broken = []
+    for number, page in enumerate(pages, start=1):
+        problems = quality_problems(page)
+        if problems:
+            # Only pages the local cleanup cannot repair go to the format model
+            logger.info(f"Formatting page {number} with the format model: {', '.join(problems)}")
+            broken.append(number)
+    if broken:
+        pages = _format_pages(pages, broken)
+    md_text = normalize_heading_levels(join_pages(pages))
+    # The figures reviewer gets the inventory, it is split off the markdown before the review
+    md_text = append_figure_inventory(md_text, inventory)
+    logger.info(f"Cleaned up {len(pages)} pages in {time.perf_counter() - start:.2f}s")
+    return md_text
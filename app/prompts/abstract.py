@@ -1,4 +1,4 @@
-from app.prompts.utils import get_prompt
+from app.prompts.registry import get_prompt
 
 get_abstract_prompt = get_prompt(
   key="abstract",
@@ -1,29 +1,28 @@
-from app.prompts.utils import get_prompt
+from app.prompts.registry import get_prompt
 
 get_bibliography_prompt = get_prompt(
   key="bibliography",
   fallback="""\
-Analyze my thesis proposal's bibliography and provide feedback on the following aspects:
+Analyze my thesis proposal's bibliography and provide feedback on the following aspects. You receive the outline of \
+the proposal, an automatic analysis of its citations and its reference list instead of the full proposal:
 
 1. Quality: Does it include only scientific and peer-reviewed publications (conference papers, journal articles, scientific books)?
 
-2. Quantity: Does it contain at least 6-8 citations as required?
+2. Relevance: Are all cited sources relevant to the topic of the proposal and contribute meaningfully to its argument \
+or background?
 
-3. Relevance: Are all cited sources relevant and contribute meaningfully to the proposal's argument or background?
+3. Internet sources: Are internet sources excluded from the bibliography and included as footnotes instead (if used at \
+all)?
 
-4. Citation style: Is a consistent citation style used throughout the proposal (ideally alpha style with [ABC12])?
+4. Citation quality: Are references properly formatted (not simply copied and pasted from Google Scholar entries)?
 
-5. Internet sources: Are internet sources excluded from the bibliography and included as footnotes instead (if used at all)?
+5. Distribution: Are citations appropriately distributed throughout the proposal rather than clustered in one section?
 
-6. Citation quality: Are citations properly formatted (not simply copied and pasted from Google Scholar entries)?
+6. Formatting: Are entries clean, consistent and free from duplicate or incorrect information (e.g., location details \
+for ACM conferences)?
 
-7. Citation placement: Are in-text citations placed before periods rather than after them?
-
-8. Cross-referencing: Do all citations in the text appear in the bibliography and vice versa?
-
-9. Distribution: Are citations appropriately distributed throughout the proposal rather than clustered in one section?
-
-10. Formatting: Are entries clean and free from duplicate or incorrect information (e.g., location details for ACM conferences)?
+The number of references, the citation keys, citations missing from the bibliography and references that are never \
+cited were checked automatically, the findings of the analysis are already reported. Do not report them again.
 
 The bibliography should demonstrate your familiarity with relevant scientific literature and provide a solid foundation for your research. Quality and relevance of sources are more important than quantity beyond the minimum requirement.
 
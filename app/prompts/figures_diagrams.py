@@ -1,4 +1,4 @@
-from app.prompts.utils import get_prompt
+from app.prompts.registry import get_prompt
 
 get_figures_diagrams_prompt = get_prompt(
   key="figures-diagrams",
@@ -34,6 +34,11 @@ Review my thesis proposal's figures, diagrams, and tables and provide feedback o
 
 13. Content appropriateness: Do figures and diagrams enhance understanding of the problem and objectives rather than focusing on implementation details?
 
+If an inventory of the figures and tables detected in the layout of the PDF follows the proposal, rely on it for the \
+number of figures, whether they are vector or raster graphics, their resolution, their captions and whether the text \
+references them, instead of inferring this from the image descriptions. Decorative images such as logos are left out \
+of the inventory and the proposal.
+
 Figures and diagrams are crucial for enhancing readability and helping readers understand complex concepts. They should be professional, clear, and directly support the proposal's narrative. Quality visual elements demonstrate attention to detail and improve the overall presentation of your research.
 
 Keep the issues small, you can have multiple sub-aspects per aspect to touch on, as many as needed. Be complete! Be really concise and prioritize extremely well to not overwhelm me. I want to have specific and easy to implement action items! Go above and beyond and reflect deeply. Do not be ambiguous and be very explicit, you are a very critical expert researcher and software engineer!
@@ -0,0 +1,148 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from logging import getLogger
+from langfuse import Langfuse
+from app.prompts.utils import _build_prompt
+from app.settings import settings
+
+logger = getLogger(__name__)
+
+
+class PromptEntry:
+    """A built prompt with the Langfuse version it was built from, None for the local fallback."""
+
+    def __init__(self, prompt, version=None):
+        self.prompt = prompt
+        self.version = version
+        # When Langfuse was last asked for a newer version, successful or not
+        self.checked_at = time.time()
+
+
+class PromptRegistry:
+    """
+    Serves the reviewer prompts from memory.
+
+    All registered prompts are fetched from Langfuse concurrently by prefetch. Afterwards, get never waits
+    for Langfuse: once a prompt is older than PROMPT_REFRESH_SECONDS it is still served while a background
+    thread fetches the latest version (stale-while-revalidate). If Langfuse is slow or unreachable, the last
+    fetched version or the local fallback keeps being served.
+
+    The prompts carry their key, version and fetch time in their metadata, see prompt_info.
+    """
+
+    def __init__(self):
+        self._fallbacks = {}
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._langfuse = None
+        # Enough threads to fetch the prompts of all reviewers at once
+        self._executor = ThreadPoolExecutor(max_workers=10, thread_name_prefix="prompt-refresh")
+
+    def register(self, key, fallback):
+        """Register a prompt, serving the fallback until the prompt has been fetched from Langfuse."""
+        with self._lock:
+            self._fallbacks[key] = fallback
+            self._entries[key] = self._build_entry(key, fallback)
+
+    def get(self, key):
+        """Return the current prompt for key, refreshing it in the background if it is stale."""
+        with self._lock:
+            entry = self._entries[key]
+            stale = time.time() - entry.checked_at >= settings.PROMPT_REFRESH_SECONDS
+            if settings.langfuse_enabled and stale and key not in self._refreshing:
+                self._refreshing.add(key)
+                self._executor.submit(self._refresh, key)
+        return entry.prompt
+
+    def prefetch(self, timeout=None):
+        """Fetch all registered prompts from Langfuse concurrently, waiting at most timeout seconds."""
+        if not settings.langfuse_enabled:
+            return
+        start = time.perf_counter()
+        with self._lock:
+            keys = [key for key in self._fallbacks if key not in self._refreshing]
+            self._refreshing.update(keys)
+        futures = [self._executor.submit(self._refresh, key, True) for key in keys]
+        _, not_done = wait(futures, timeout=timeout)
+        if not_done:
+            logger.warning(f"{len(not_done)} prompts are still being fetched from Langfuse, serving local ones for now")
+        logger.info(f"Prefetched {len(keys) - len(not_done)} prompts in {time.perf_counter() - start:.2f}s")
+
+    def _get_langfuse(self):
+        if self._langfuse is None:
+            self._langfuse = Langfuse()
+        return self._langfuse
+
+    def _build_entry(self, key, template, langfuse_prompt=None):
+        version = langfuse_prompt.version if langfuse_prompt is not None else None
+        metadata = {"prompt_key": key, "prompt_version": version, "fetched_at": time.time()}
+        if langfuse_prompt is not None:
+            metadata["langfuse_prompt"] = langfuse_prompt
+        return PromptEntry(_build_prompt(template, metadata=metadata), version)
+
+    def _fetch(self, key, create_missing):
+        langfuse = self._get_langfuse()
+        try:
+            # Caching happens here, the Langfuse client should always fetch
+            return langfuse.get_prompt(key, cache_ttl_seconds=0)
+        except Exception as e:
+            logger.warning(f"Failed to fetch prompt '{key}' from Langfuse: {e}")
+        if not create_missing:
+            return None
+
+        # Create missing prompts from the local fallback so they can be edited in Langfuse
+        try:
+            langfuse.create_prompt(
+                name=key,
+                prompt=self._fallbacks[key],
+                labels=["production"],
+            )
+        except Exception as create_error:
+            logger.warning(f"Failed to create prompt '{key}' in Langfuse: {create_error}")
+        return None
+
+    def _refresh(self, key, create_missing=False):
+        try:
+            langfuse_prompt = self._fetch(key, create_missing)
+            with self._lock:
+                current = self._entries[key]
+            if langfuse_prompt is None:
+                # Keep serving the current prompt, its age keeps growing, and retry once it is stale again
+                current.checked_at = time.time()
+                return
+            if langfuse_prompt.version == current.version:
+                current.checked_at = time.time()
+                current.prompt.metadata["fetched_at"] = current.checked_at
+                return
+            entry = self._build_entry(key, langfuse_prompt.prompt, langfuse_prompt)
+            with self._lock:
+                self._entries[key] = entry
+            logger.info(f"Serving version {entry.version} of prompt '{key}'")
+        except Exception:
+            logger.exception(f"Failed to refresh prompt '{key}'")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+def prompt_info(prompt):
+    """Return the key, Langfuse version (None for local prompts) and age in seconds of a registry prompt."""
+    metadata = prompt.metadata or {}
+    fetched_at = metadata.get("fetched_at")
+    age = time.time() - fetched_at if fetched_at is not None else None
+    return metadata.get("prompt_key"), metadata.get("prompt_version"), age
+
+
+prompt_registry = PromptRegistry()
+
+
+def get_prompt(key, fallback):
+    """Register the prompt with the registry and return a getter serving its current version."""
+    prompt_registry.register(key, fallback)
+
+    def get_current_prompt():
+        return prompt_registry.get(key)
+
+    return get_current_prompt
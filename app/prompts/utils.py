@@ -1,53 +1,39 @@
-from langfuse import Langfuse
-from langchain_core.prompts import PromptTemplate
+import re
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from app.settings import settings
-from logging import getLogger
 
-logger = getLogger(__name__)
+# Same conversion of mustache-style {{variable}} to {variable} as Langfuse's get_langchain_prompt
+VARIABLE_PATTERN = re.compile(r"{{\s*(\w+)\s*}}")
+PROPOSAL_VARIABLE_PATTERN = re.compile(r"{{\s*proposal\s*}}")
 
+# Leading system message shared by all reviewers in the shared prefix layout
+SHARED_INSTRUCTIONS = """\
+You are a very critical expert researcher and software engineer reviewing a thesis proposal. \
+The proposal follows in the next message, the aspects to review follow after it. \
+Report each finding as a small, specific and easy to implement issue, quote the proposal where applicable \
+and prioritize extremely well."""
 
-def get_prompt(key, fallback):
-  # Only initialize Langfuse if credentials are properly configured
-  if not settings.langfuse_enabled:
-    # Return a simple prompt template if Langfuse is not enabled
-    def get_fallback_prompt():
-      return PromptTemplate.from_template(fallback)
-    return get_fallback_prompt
 
-  langfuse = Langfuse()
+def _build_prompt(template, metadata=None):
+    """
+    Build the prompt for a mustache-style template containing {{proposal}} according to PROMPT_LAYOUT.
 
-  try:
-    langfuse.get_prompt(key)
-  except Exception as e:
-    logger.warning(f"Failed to fetch prompt '{key}' from Langfuse: {e}")
-    try:
-      langfuse.create_prompt(
-        name=key,
-        prompt=fallback,
-        labels=["production"],
-      )
-    except Exception as create_error:
-      logger.warning(f"Failed to create prompt '{key}' in Langfuse: {create_error}")
-      # Fall back to local prompt if Langfuse is unavailable
-      def get_fallback_prompt():
-        return PromptTemplate.from_template(fallback)
-      return get_fallback_prompt
+    "rubric_first" sends the template as a single message with the proposal where the template puts it.
+    "shared_prefix" sends the shared instructions and the proposal first and the reviewer-specific rubric
+    last, so all reviewers share an identical prefix that providers can serve from their prompt cache.
+    """
+    if settings.PROMPT_LAYOUT == "rubric_first":
+        return PromptTemplate.from_template(VARIABLE_PATTERN.sub(r"{\g<1>}", template), metadata=metadata)
 
-  def get_fresh_prompt():
-    try:
-      langfuse_prompt = langfuse.get_prompt(
-        key,
-        fallback=fallback,
-        cache_ttl_seconds=30
-      )
+    if settings.PROMPT_LAYOUT == "shared_prefix":
+        rubric = PROPOSAL_VARIABLE_PATTERN.sub("", template).strip()
+        prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=SHARED_INSTRUCTIONS),
+            ("human", "{proposal}"),
+            HumanMessage(content=rubric),
+        ])
+        prompt.metadata = metadata
+        return prompt
 
-      return PromptTemplate.from_template(
-        langfuse_prompt.get_langchain_prompt(),
-        metadata={"langfuse_prompt": langfuse_prompt},
-      )
-    except Exception as e:
-      logger.warning(f"Failed to fetch fresh prompt '{key}' from Langfuse: {e}")
-      # Fall back to local prompt
-      return PromptTemplate.from_template(fallback)
-  
-  return get_fresh_prompt
\ No newline at end of file
+    raise ValueError(f"Unknown prompt layout '{settings.PROMPT_LAYOUT}', use 'rubric_first' or 'shared_prefix'")
@@ -0,0 +1,315 @@
+import html
+import json
+import os
+import threading
+from collections import OrderedDict
+
+PRIORITY_ORDER = ['Very High', 'High', 'Medium', 'Low', 'Very Low']
+
+# Status of the issues of a previous review when a revision is reviewed
+CARRIED_OVER = 'carried_over'
+RESOLVED = 'resolved'
+
+PRIORITY_EMOJIS = {'Very High': '🔴', 'High': '🟠', 'Medium': '🟡', 'Low': '🔵', 'Very Low': '⚪'}
+PRIORITY_SYMBOLS = {'Very High': '!!!', 'High': '!!', 'Medium': '!', 'Low': '-', 'Very Low': '.'}
+
+NO_ISSUES = "No issues found in the proposal. Great work!"
+# File name of exported reports, without the extension of the format
+EXPORT_NAME = "proposal-feedback"
+
+
+class Report:
+    """
+    Feedback issues grouped by section and priority, built once per review and rendered in several formats.
+
+    Issues can be added one at a time while they are streamed. Sections keep the order of their first issue,
+    priorities the order of PRIORITY_ORDER. Each format is rendered at most once until the next issue is
+    added. Once a format is rendered again, its formatted issues are kept, so later renders only format the
+    new issues and join them under their headings. A report rendered once is not slowed down by keeping them.
+    """
+
+    def __init__(self, issues=()):
+        self.issues = []
+        # section -> priority -> indices into issues
+        self.sections = {}
+        # Indices of the issues of the previous review resolved by a revision
+        self.resolved = []
+        # issue formatter -> index -> formatted issue, for the formatters that have been used before
+        self._formatted = {}
+        # format name -> rendered report
+        self._rendered = {}
+        self.extend(issues)
+
+    def add(self, issue):
+        self.extend((issue,))
+
+    def extend(self, issues):
+        if issues:
+            self._rendered.clear()
+        for issue in issues:
+            index = len(self.issues)
+            self.issues.append(issue)
+            if issue.get('status') == RESOLVED:
+                self.resolved.append(index)
+                continue
+            section = issue.get('section', 'General')
+            section_issues = self.sections.get(section)
+            if section_issues is None:
+                section_issues = self.sections[section] = {priority: [] for priority in PRIORITY_ORDER}
+            group = section_issues.get(issue.get('priority', 'Medium'))
+            if group is None:
+                group = section_issues['Medium']
+            group.append(index)
+
+    @property
+    def total(self):
+        """Number of issues, without the resolved issues of the previous review."""
+        return len(self.issues) - len(self.resolved)
+
+    def groups(self):
+        """Yield the section, priority and issue indices of each non-empty group in report order."""
+        for section, section_issues in self.sections.items():
+            for priority in PRIORITY_ORDER:
+                if section_issues[priority]:
+                    yield section, priority, section_issues[priority]
+
+    def formatted(self, formatter, indices):
+        """Return the issues at indices formatted by formatter(number, issue), numbered from 1."""
+        issues = self.issues
+        cache = self._formatted.get(formatter)
+        if cache is None:
+            # Only remember the formatter was used, a report rendered once does not need the issues again
+            self._formatted[formatter] = {}
+            return [formatter(number, issues[index]) for number, index in enumerate(indices, 1)]
+
+        parts = []
+        for number, index in enumerate(indices, 1):
+            formatted = cache.get(index)
+            if formatted is None:
+                # Issues are only appended to their group, so the number of an issue never changes
+                formatted = cache[index] = formatter(number, issues[index])
+            parts.append(formatted)
+        return parts
+
+    def render(self, format_name='Markdown'):
+        """Render the report in one of REPORT_FORMATS."""
+        if format_name not in self._rendered:
+            renderer, _ = REPORT_FORMATS[format_name]
+            self._rendered[format_name] = renderer(self)
+        return self._rendered[format_name]
+
+
+def _format_markdown_issue(number, issue):
+    text = f"**{number}. {issue['category']}**\n\n"
+    if issue.get('status') == CARRIED_OVER:
+        text += "*Unchanged since the previous review*\n\n"
+    if issue.get('quote'):
+        text += f"> *\"{issue['quote']}\"*\n\n"
+    text += f"**📋 Issue:** {issue['issue']}\n\n**💡 Suggestion:** {issue['suggestion']}\n\n"
+    if issue.get('rule'):
+        text += f"**📖 Rule:** {issue['rule']}\n\n"
+    return text + "---\n\n"
+
+
+def render_markdown(report):
+    """Render the report as markdown for display in Gradio."""
+    if not report.sections and not report.resolved:
+        return NO_ISSUES
+
+    parts = ["# 📝 Proposal Feedback Report\n\n"]
+    current_section = None
+    for section, priority, indices in report.groups():
+        if section != current_section:
+            current_section = section
+            parts.append(f"## 📂 {section}\n\n")
+        parts.append(f"### {PRIORITY_EMOJIS[priority]} {priority} Priority\n\n")
+        parts.extend(report.formatted(_format_markdown_issue, indices))
+
+    if report.resolved:
+        parts.append("## ✅ Resolved Since the Previous Review\n\n")
+        for index in report.resolved:
+            issue = report.issues[index]
+            quote = f" *\"{issue['quote']}\"*" if issue.get('quote') else ""
+            parts.append(f"- **{issue.get('section', 'General')}, {issue['category']}:** {issue['issue']}{quote}\n")
+    return "".join(parts)
+
+
+TEXT_ISSUE_SEPARATOR = "   " + "-" * 60 + "\n\n"
+
+
+def _format_text_issue(number, issue):
+    category = issue['category']
+    text = f"{number}. {category.upper()}\n   {'=' * len(category)}\n\n"
+    if issue.get('status') == CARRIED_OVER:
+        text += "   (unchanged since the previous review)\n\n"
+    if issue.get('quote'):
+        text += f"   QUOTE:\n   \"{issue['quote']}\"\n\n"
+    text += f"   ISSUE:\n   {issue['issue']}\n\n   SUGGESTION:\n   {issue['suggestion']}\n\n"
+    if issue.get('rule'):
+        text += f"   WRITING RULE:\n   {issue['rule']}\n\n"
+    return text + TEXT_ISSUE_SEPARATOR
+
+
+def render_text(report):
+    """Render the report as human-readable plain text."""
+    parts = ["PROPOSAL FEEDBACK REPORT\n", "=" * 50 + "\n\n"]
+    if not report.issues:
+        parts.append(NO_ISSUES)
+        return "".join(parts)
+
+    parts.append(f"Total Issues Found: {report.total}\n\n")
+    current_section = None
+    for section, priority, indices in report.groups():
+        if section != current_section:
+            if current_section is not None:
+                parts.append("\n")
+            current_section = section
+            parts.append(f"SECTION: {section.upper()}\n")
+            parts.append("-" * (len(section) + 9) + "\n\n")
+        parts.append(f"{PRIORITY_SYMBOLS[priority]} {priority.upper()} PRIORITY\n\n")
+        parts.extend(report.formatted(_format_text_issue, indices))
+        parts.append("\n")
+    if current_section is not None:
+        parts.append("\n")
+
+    if report.resolved:
+        parts.append("RESOLVED SINCE THE PREVIOUS REVIEW\n")
+        parts.append("-" * 34 + "\n\n")
+        for index in report.resolved:
+            issue = report.issues[index]
+            parts.append(f"- {issue.get('section', 'General')}, {issue['category']}: {issue['issue']}\n")
+        parts.append("\n")
+    return "".join(parts)
+
+
+def render_json(report):
+    """Render the issues as a JSON list in the order they were reported."""
+    return json.dumps(report.issues, indent=2)
+
+
+HTML_STYLE = (
+    "body{font-family:system-ui,sans-serif;max-width:50rem;margin:2rem auto;padding:0 1rem;line-height:1.5}"
+    "blockquote{margin:0 0 1rem;padding-left:1rem;border-left:3px solid #ccc;font-style:italic}"
+    ".issue{border-bottom:1px solid #ddd;margin-bottom:1rem}.carried{color:#666;font-style:italic}"
+)
+
+
+def _format_html_issue(number, issue):
+    text = f"<article class=\"issue\">\n<h4>{number}. {html.escape(issue['category'])}</h4>\n"
+    if issue.get('status') == CARRIED_OVER:
+        text += "<p class=\"carried\">Unchanged since the previous review</p>\n"
+    if issue.get('quote'):
+        text += f"<blockquote>&quot;{html.escape(issue['quote'])}&quot;</blockquote>\n"
+    text += (
+        f"<p><strong>Issue:</strong> {html.escape(issue['issue'])}</p>\n"
+        f"<p><strong>Suggestion:</strong> {html.escape(issue['suggestion'])}</p>\n"
+    )
+    if issue.get('rule'):
+        text += f"<p><strong>Rule:</strong> {html.escape(issue['rule'])}</p>\n"
+    return text + "</article>\n"
+
+
+def render_html(report):
+    """Render the report as a standalone HTML page."""
+    parts = [
+        "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"utf-8\">\n",
+        f"<title>Proposal Feedback Report</title>\n<style>{HTML_STYLE}</style>\n</head>\n<body>\n",
+        "<h1>Proposal Feedback Report</h1>\n",
+    ]
+    if not report.sections and not report.resolved:
+        parts.append(f"<p>{NO_ISSUES}</p>\n")
+    else:
+        parts.append(f"<p>Total issues found: {report.total}</p>\n")
+    current_section = None
+    for section, priority, indices in report.groups():
+        if section != current_section:
+            current_section = section
+            parts.append(f"<h2>{html.escape(section)}</h2>\n")
+        parts.append(f"<h3>{PRIORITY_EMOJIS[priority]} {priority} Priority</h3>\n")
+        parts.extend(report.formatted(_format_html_issue, indices))
+
+    if report.resolved:
+        parts.append("<h2>Resolved Since the Previous Review</h2>\n<ul>\n")
+        for index in report.resolved:
+            issue = report.issues[index]
+            parts.append(
+                f"<li><strong>{html.escape(issue.get('section', 'General'))}, "
+                f"{html.escape(issue['category'])}:</strong> {html.escape(issue['issue'])}</li>\n"
+            )
+        parts.append("</ul>\n")
+    parts.append("</body>\n</html>\n")
+    return "".join(parts)
+
+
+# Format name -> (renderer, file extension of the export)
+REPORT_FORMATS = {
+    'Markdown': (render_markdown, '.md'),
+    'Text': (render_text, '.txt'),
+    'JSON': (render_json, '.json'),
+    'HTML': (render_html, '.html'),
+}
+
+
+class ReportCache:
+    """
+    Reports of the most recent reviews, kept up to date with the issues streamed by their job.
+
+    Exports are written on demand into the directory of the review in the artifact store and reused until new
+    issues arrive. Only the max_reviews most recently used reports are kept in memory, their files are left to
+    the janitor of the artifact store.
+    """
+
+    def __init__(self, artifacts, max_reviews):
+        self.artifacts = artifacts
+        self.max_reviews = max_reviews
+        # review ID -> report
+        self._reports = OrderedDict()
+        # (review ID, format name) -> (number of issues, path)
+        self._exports = {}
+        self._lock = threading.Lock()
+
+    def _report(self, review_id, issues):
+        report = self._reports.get(review_id)
+        if report is None or len(issues) < len(report.issues):
+            report = self._reports[review_id] = Report()
+        self._reports.move_to_end(review_id)
+        # Issues of a job are only appended
+        report.extend(issues[len(report.issues):])
+        while len(self._reports) > self.max_reviews:
+            evicted, _ = self._reports.popitem(last=False)
+            for format_name in REPORT_FORMATS:
+                self._exports.pop((evicted, format_name), None)
+        return report
+
+    def render(self, review_id, issues, format_name='Markdown'):
+        """Render the report of the review with the given issues so far."""
+        with self._lock:
+            return self._report(review_id, issues).render(format_name)
+
+    def export(self, review_id, issues, format_name):
+        """Return the path of the report file of the review in the format, written if it is outdated."""
+        with self._lock:
+            report = self._report(review_id, issues)
+            export = self._exports.get((review_id, format_name))
+            if export is not None and export[0] == len(report.issues) and os.path.exists(export[1]):
+                return export[1]
+
+            _, extension = REPORT_FORMATS[format_name]
+            path = self.artifacts.write(review_id, f"{EXPORT_NAME}{extension}", report.render(format_name))
+            self._exports[(review_id, format_name)] = (len(report.issues), path)
+            return path
+
+
+def format_feedback_for_display(issues):
+    """Format the feedback issues for nice display in Gradio."""
+    return Report(issues).render('Markdown')
+
+
+def format_feedback_for_text(issues):
+    """Format the feedback issues for human-readable text download."""
+    return Report(issues).render('Text')
+
+
+def collect_issues(result):
+    """Flatten the reviewer results of the review chain into a list of issue dicts."""
+    return [feedback.model_dump() for feedback_list in result.values() for feedback in feedback_list.issues]
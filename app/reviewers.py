@@ -0,0 +1,444 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from operator import itemgetter
+from logging import getLogger
+from typing import List, Optional, Sequence
+from langfuse.callback import CallbackHandler
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.prompts import BasePromptTemplate
+from langchain_core.runnables import RunnableConfig, RunnableLambda, RunnableParallel
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from app.prompts.abstract import get_abstract_prompt
+from app.prompts.introduction import get_introduction_prompt
+from app.prompts.problem import get_problem_prompt
+from app.prompts.motivation import get_motivation_prompt
+from app.prompts.objectives import get_objectives_prompt
+from app.prompts.bibliography import get_bibliography_prompt
+from app.prompts.schedule import get_schedule_prompt
+from app.prompts.transparency import get_transparency_prompt
+from app.prompts.general_writing import get_general_writing_prompt
+from app.prompts.figures_diagrams import get_figures_diagrams_prompt
+from app.prompts.registry import prompt_info, prompt_registry
+
+from app.cache import CacheBackend, LRUCache, SQLiteCache
+from app.citations import format_bibliography_review_input, lint_citations
+from app.feedback import FeedbackIssue, FeedbackIssueChunk, FeedbackIssueList, merge_feedback_issues
+from app.figure_inventory import split_figure_inventory
+from app.models import get_chat_model
+from app.models.tokens import get_context_window, get_token_estimator
+from app.sections import (
+    ProposalSection,
+    format_excerpts,
+    format_outline,
+    route_proposal,
+    segment_proposal,
+    split_markdown,
+)
+from app.settings import settings
+from app.writing_linter import lint_proposal
+
+logger = getLogger(__name__)
+
+callbacks = []
+if settings.langfuse_enabled:
+    langfuse_handler = CallbackHandler()
+    langfuse_handler.auth_check()
+    callbacks.append(langfuse_handler)
+
+
+# Passing the function schema instead of the pydantic model makes the output parser emit partial dicts while
+# streaming, the OpenAI models reject the wrapping tool format
+issue_model = get_chat_model(settings.MODEL_NAME).with_structured_output(
+    convert_to_openai_tool(FeedbackIssueList)["function"]
+)
+
+# Prompts are estimated locally before each call, the schema of the structured output is sent with every call
+review_token_estimator = get_token_estimator(settings.MODEL_NAME)
+REVIEW_SCHEMA_TOKENS = review_token_estimator.count(json.dumps(convert_to_openai_tool(FeedbackIssueList)))
+# Chunks of an input over the budget need room for at least this many tokens of the proposal
+MIN_CHUNK_TOKENS = 500
+CHUNK_HEADER = (
+    "Part {part} of {parts} of the text to review. The parts are reviewed separately, only report the issues "
+    "of this part.\n\n"
+)
+
+
+# Reviewer name -> prompt getter, each reviewer runs as one branch of the review chain
+REVIEWERS = {
+    "general_writing": get_general_writing_prompt,
+    "figures_diagrams": get_figures_diagrams_prompt,
+    "abstract": get_abstract_prompt,
+    "introduction": get_introduction_prompt,
+    "problem": get_problem_prompt,
+    "motivation": get_motivation_prompt,
+    "objectives": get_objectives_prompt,
+    "bibliography": get_bibliography_prompt,
+    "schedule": get_schedule_prompt,
+    "transparency": get_transparency_prompt,
+}
+
+# Reviewer name -> check of the full proposal that runs locally without a model, its issues are streamed
+# right away while the model reviewers are still running
+LOCAL_REVIEWERS = {
+    "writing_linter": lint_proposal,
+    "citation_analyzer": lint_citations,
+}
+
+# All reviewers of the review chain
+REVIEWER_NAMES = [*LOCAL_REVIEWERS, *REVIEWERS]
+
+# Fetch all reviewer prompts from Langfuse at once instead of on the first reviews
+prompt_registry.prefetch(timeout=settings.PROMPT_PREFETCH_TIMEOUT)
+
+# Reviewer name -> proposal sections the reviewer receives, None for the full proposal
+REVIEWER_SECTIONS = {
+    "general_writing": None,
+    "figures_diagrams": None,
+    "abstract": ["abstract"],
+    "introduction": ["introduction"],
+    "problem": ["problem"],
+    "motivation": ["motivation"],
+    "objectives": ["objectives"],
+    "bibliography": ["bibliography"],
+    # The schedule should reference the goals from the objectives
+    "schedule": ["objectives", "schedule"],
+    "transparency": ["transparency"],
+}
+
+# Reviewer name -> builds the reviewer input from the full proposal instead of routing sections, returns None
+# to fall back to REVIEWER_SECTIONS. Inputs are this small in both prompt layouts, no shared prefix is needed.
+REVIEWER_INPUTS = {
+    # The findings of the citation analysis and the reference list, the analysis already covers the rest
+    "bibliography": format_bibliography_review_input,
+}
+
+# Reviewers receiving the figure inventory of the converted PDF after their input, so the proposal stays the
+# shared prefix of their prompt
+FIGURE_INVENTORY_REVIEWERS = ["figures_diagrams"]
+
+# Reviewers of the full proposal whose issues only concern the text they quote, when a revision is reviewed
+# they only review the sections that changed
+SECTION_SCOPED_REVIEWERS = ["general_writing"]
+
+
+def _create_review_cache() -> Optional[CacheBackend]:
+    backend = settings.REVIEW_CACHE_BACKEND
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return LRUCache(max_entries=settings.REVIEW_CACHE_MAX_ENTRIES)
+    if backend == "sqlite":
+        return SQLiteCache(
+            os.path.join(settings.CACHE_DIR, "reviews.sqlite3"),
+            max_entries=settings.REVIEW_CACHE_MAX_ENTRIES,
+        )
+    raise ValueError(f"Unknown review cache backend '{backend}', use 'memory', 'sqlite' or 'none'")
+
+
+review_cache = _create_review_cache()
+
+
+def review_cache_key(name: str, prompt: BasePromptTemplate, inputs: dict) -> str:
+    # Langfuse prompts are identified by their version and layout, local prompts by their template text
+    langfuse_prompt = (prompt.metadata or {}).get("langfuse_prompt")
+    if langfuse_prompt is not None:
+        prompt_version = f"langfuse-v{langfuse_prompt.version}-{settings.PROMPT_LAYOUT}"
+    else:
+        prompt_version = hashlib.sha256(prompt.pretty_repr().encode()).hexdigest()
+    input_hash = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+    return ":".join([name, prompt_version, settings.MODEL_NAME, input_hash])
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """Sums up the token usage reported by chat models, including prompt tokens read from the provider cache."""
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.output_tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.input_tokens += usage.get("input_tokens", 0)
+                self.cached_input_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+                self.output_tokens += usage.get("output_tokens", 0)
+
+
+# Reviewer name -> accumulated token usage of its model calls since startup
+token_usage = {}
+token_usage_lock = threading.Lock()
+
+
+def _record_token_usage(name: str, handler: TokenUsageHandler):
+    with token_usage_lock:
+        usage = token_usage.setdefault(
+            name, {"calls": 0, "input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0}
+        )
+        usage["calls"] += 1
+        usage["input_tokens"] += handler.input_tokens
+        usage["cached_input_tokens"] += handler.cached_input_tokens
+        usage["output_tokens"] += handler.output_tokens
+    logger.info(
+        f"Reviewer '{name}' used {handler.input_tokens} input tokens ({handler.cached_input_tokens} cached) "
+        f"and {handler.output_tokens} output tokens"
+    )
+
+
+def review_token_budget() -> int:
+    """Maximum prompt tokens of a reviewer call, the context window without the answer or REVIEW_MAX_INPUT_TOKENS."""
+    budget = get_context_window(settings.MODEL_NAME) - settings.REVIEW_OUTPUT_TOKENS
+    if settings.REVIEW_MAX_INPUT_TOKENS:
+        budget = min(budget, settings.REVIEW_MAX_INPUT_TOKENS)
+    return budget
+
+
+def estimate_prompt_tokens(prompt: BasePromptTemplate, inputs: dict) -> int:
+    """Estimate the prompt tokens of a reviewer call, including the schema of the structured output."""
+    return REVIEW_SCHEMA_TOKENS + review_token_estimator.count(prompt.invoke(inputs).to_string())
+
+
+def _chunk_header(part: int, parts: int, outline: str) -> str:
+    header = CHUNK_HEADER.format(part=part, parts=parts)
+    return header + (f"Outline of the full text:\n{outline}\n\n" if outline else "")
+
+
+def review_in_chunks(name: str, reviewer_chain, prompt: BasePromptTemplate, inputs: dict, budget: int, config):
+    """
+    Review an input over the token budget in chunks within the budget, REVIEW_CHUNK_CONCURRENCY at a time.
+
+    Each chunk gets the outline of the whole input. Yields the issues of each chunk as soon as it is reviewed,
+    None for a chunk whose output could not be parsed.
+
+    Raises:
+        ValueError: If the prompt without the input already takes up nearly all of the budget.
+    """
+    text = inputs["proposal"]
+    outline = format_outline(segment_proposal(text))
+    if review_token_estimator.count(outline) > budget // 4:
+        outline = ""
+    header_tokens = estimate_prompt_tokens(prompt, {**inputs, "proposal": _chunk_header(99, 99, outline)})
+    chunk_tokens = budget - header_tokens
+    if chunk_tokens < MIN_CHUNK_TOKENS:
+        raise ValueError(
+            f"The prompt of reviewer '{name}' leaves only {chunk_tokens} of {budget} tokens for the proposal, "
+            f"increase MODEL_CONTEXT_WINDOW, OLLAMA_CONTEXT_WINDOW or REVIEW_MAX_INPUT_TOKENS"
+        )
+
+    chunks = split_markdown(text, chunk_tokens, review_token_estimator.count)
+    logger.info(
+        f"Reviewer '{name}' exceeds its budget of {budget} tokens, "
+        f"reviewing {len(chunks)} chunks of at most {chunk_tokens} tokens"
+    )
+    chunk_inputs = [
+        {**inputs, "proposal": _chunk_header(part, len(chunks), outline) + chunk}
+        for part, chunk in enumerate(chunks, 1)
+    ]
+    outputs = reviewer_chain.batch_as_completed(
+        chunk_inputs, {**config, "max_concurrency": settings.REVIEW_CHUNK_CONCURRENCY}
+    )
+    for _, output in outputs:
+        yield _parsed_issues(output)
+
+
+def _parsed_issues(output) -> Optional[List[FeedbackIssue]]:
+    """Return the valid issues of a complete {"issues": [...]} output, None if the output has no issue list."""
+    if not isinstance(output, dict) or not isinstance(output.get("issues"), list):
+        return None
+    issues = [_validate_issue(data) for data in output["issues"]]
+    return [issue for issue in issues if issue is not None]
+
+
+def stream_feedback_issues(partial_outputs):
+    """
+    Yield each FeedbackIssue from a stream of partial {"issues": [...]} dicts as soon as it is complete.
+
+    An issue is complete once the next issue has started or the stream has ended. Issues that fail
+    validation are skipped.
+    """
+    emitted = 0
+    issues = []
+    for partial_output in partial_outputs:
+        issues = (partial_output or {}).get("issues") or []
+        while emitted < len(issues) - 1:
+            issue = _validate_issue(issues[emitted])
+            emitted += 1
+            if issue is not None:
+                yield issue
+
+    while emitted < len(issues):
+        issue = _validate_issue(issues[emitted])
+        emitted += 1
+        if issue is not None:
+            yield issue
+
+
+def _validate_issue(data) -> Optional[FeedbackIssue]:
+    try:
+        return FeedbackIssue.model_validate(data)
+    except ValueError as e:
+        logger.warning(f"Skipping malformed feedback issue {data}: {e}")
+        return None
+
+
+def _remember_last(outputs, remembered: list):
+    """Pass the outputs through, keeping the last one in remembered."""
+    for output in outputs:
+        remembered[:] = [output]
+        yield output
+
+
+def _make_reviewer(name: str, get_prompt):
+    def review(inputs: dict, config: RunnableConfig):
+        prompt = get_prompt()
+        cache_key = review_cache_key(name, prompt, inputs) if review_cache is not None else None
+
+        cached = review_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            logger.info(f"Using cached result for reviewer '{name}'")
+            yield FeedbackIssueChunk(issues=FeedbackIssueList.model_validate_json(cached).issues, final=True)
+            return
+
+        # Report which prompt the review used, the version is None for local prompts
+        prompt_key, prompt_version, prompt_age = prompt_info(prompt)
+        logger.info(
+            f"Reviewer '{name}' uses prompt '{prompt_key}' version {prompt_version or 'local'}"
+            + (f", fetched {prompt_age:.0f}s ago" if prompt_age is not None else "")
+        )
+
+        issues = []
+        usage_handler = TokenUsageHandler()
+        reviewer_chain = (prompt | issue_model).with_config(
+            callbacks=[usage_handler],
+            metadata={"prompt_key": prompt_key, "prompt_version": prompt_version, "prompt_age_seconds": prompt_age},
+        )
+        budget = review_token_budget()
+        prompt_tokens = estimate_prompt_tokens(prompt, inputs)
+        logger.info(f"Reviewer '{name}' prompt is about {prompt_tokens} tokens, its budget is {budget} tokens")
+        # Only results parsed from complete responses are cached
+        complete = True
+        if prompt_tokens <= budget:
+            partial_outputs = []
+            for issue in stream_feedback_issues(_remember_last(reviewer_chain.stream(inputs, config), partial_outputs)):
+                issues.append(issue)
+                yield FeedbackIssueChunk(issues=[issue])
+            if _parsed_issues(partial_outputs[-1] if partial_outputs else None) is None:
+                # Models that do not stream tool calls produce no partial outputs
+                logger.warning(f"Reviewer '{name}' streamed no parsed output, invoking it without streaming")
+                invoked_issues = _parsed_issues(reviewer_chain.invoke(inputs, config))
+                if invoked_issues is None:
+                    logger.error(f"Reviewer '{name}' returned no parsable issue list, its result is not cached")
+                    complete = False
+                for issue in invoked_issues or []:
+                    issues.append(issue)
+                    yield FeedbackIssueChunk(issues=[issue])
+        else:
+            # Chunks overlap in what they report about the whole text, i.e. missing transitions
+            for chunk_issues in review_in_chunks(name, reviewer_chain, prompt, inputs, budget, config):
+                if chunk_issues is None:
+                    logger.error(f"A chunk of reviewer '{name}' returned no parsable issue list, not caching")
+                    complete = False
+                    continue
+                merged = merge_feedback_issues(issues, chunk_issues)
+                if merged:
+                    yield FeedbackIssueChunk(issues=merged)
+        _record_token_usage(name, usage_handler)
+
+        if cache_key is not None and complete:
+            review_cache.set(cache_key, FeedbackIssueList(issues=issues).model_dump_json())
+        yield FeedbackIssueChunk(issues=[], final=True)
+
+    return RunnableLambda(review, name=name)
+
+
+def _make_local_reviewer(name: str, check):
+    def review(inputs: dict) -> FeedbackIssueChunk:
+        start = time.perf_counter()
+        issues = check(inputs["proposal"])
+        logger.info(f"Reviewer '{name}' found {len(issues)} issues in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return FeedbackIssueChunk(issues=issues, final=True)
+
+    return RunnableLambda(review, name=name)
+
+
+def run_local_reviewers(proposal: str) -> dict:
+    """Run the local reviewers outside of the review chain, returning reviewer name -> FeedbackIssueChunk."""
+    proposal, _ = split_figure_inventory(proposal)
+    return {
+        name: _make_local_reviewer(name, check).invoke({"proposal": proposal})
+        for name, check in LOCAL_REVIEWERS.items()
+    }
+
+
+def route_proposal_to_reviewers(inputs: dict) -> dict:
+    """
+    Segment the proposal once and build the input of every reviewer from its sections.
+
+    inputs may map reviewer names to the [start, end] spans of the proposal under "excerpts", these reviewers
+    only review the excerpts, i.e. the sections revised since an earlier review.
+    """
+    proposal, figure_inventory = split_figure_inventory(inputs["proposal"])
+    excerpts = inputs.get("excerpts") or {}
+    sections = segment_proposal(proposal)
+    # Excerpts differ per reviewer and would break the shared prompt prefix, so all reviewers get the full text
+    shared_prefix = settings.PROMPT_LAYOUT == "shared_prefix"
+    routed = {}
+    for name in REVIEWERS:
+        if name in excerpts:
+            reviewer_input = format_excerpts(
+                proposal, sections,
+                [ProposalSection(title="", level=1, start=start, end=end) for start, end in excerpts[name]],
+                "Excerpt of the proposal containing the sections revised since the previous review",
+            )
+        else:
+            reviewer_input = REVIEWER_INPUTS[name](proposal) if name in REVIEWER_INPUTS else None
+        if reviewer_input is None:
+            section_names = None if shared_prefix else REVIEWER_SECTIONS[name]
+            reviewer_input = route_proposal(proposal, sections, section_names)
+        if figure_inventory is not None and name in FIGURE_INVENTORY_REVIEWERS:
+            reviewer_input += (
+                "\n\nInventory of the figures and tables detected in the layout of the PDF:\n" + figure_inventory + "\n"
+            )
+        routed[name] = {"proposal": reviewer_input}
+        logger.info(f"Reviewer '{name}' receives {len(routed[name]['proposal'])} of {len(proposal)} characters")
+    for name in LOCAL_REVIEWERS:
+        routed[name] = {"proposal": proposal}
+    return routed
+
+
+def build_review_chain(names: Optional[Sequence[str]] = None):
+    """
+    Build the chain running the reviewers in names, or all reviewers, in parallel on {"proposal": ...}.
+
+    The proposal is split into sections first and each reviewer only receives the sections it reviews
+    plus an outline, or the full proposal if its sections cannot be located. The local reviewers check
+    the full proposal without a model and finish first.
+
+    Invoking the chain returns a FeedbackIssueChunk with all issues per reviewer. Streaming it yields
+    each issue as soon as it is complete, followed by an empty chunk marked final once a reviewer is done.
+
+    Results are memoized per reviewer by prompt version, model and input, so only reviewers whose
+    prompt or input changed call the model again.
+    """
+    return (
+        RunnableLambda(route_proposal_to_reviewers)
+        | RunnableParallel({
+            **{
+                name: itemgetter(name) | _make_local_reviewer(name, check)
+                for name, check in LOCAL_REVIEWERS.items() if names is None or name in names
+            },
+            **{
+                name: itemgetter(name) | _make_reviewer(name, get_prompt)
+                for name, get_prompt in REVIEWERS.items() if names is None or name in names
+            },
+        })
+    ).with_config(callbacks=callbacks)
+
+
+# Built once, the chain holds no per-review state and is shared by all reviews
+review_chain = build_review_chain()
@@ -0,0 +1,301 @@
+"""
+Incremental review of revised proposals.
+
+Every finished review is stored with its proposal and the issues of each reviewer. When a revision of a
+proposal is uploaded, the earlier review is found by its ID or by the similarity of the text. The two proposals
+are compared section by section and only the reviewers whose sections changed run again. The issues of the
+other reviewers are carried over, issues whose quote was in the proposal but no longer appears in the revision are
+reported as resolved.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from logging import getLogger
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from app.feedback import FeedbackIssue, FeedbackIssueChunk
+from app.figure_inventory import split_figure_inventory
+from app.report import CARRIED_OVER, RESOLVED
+from app.reviewers import (
+    FIGURE_INVENTORY_REVIEWERS,
+    LOCAL_REVIEWERS,
+    REVIEWER_NAMES,
+    REVIEWER_SECTIONS,
+    REVIEWERS,
+    SECTION_SCOPED_REVIEWERS,
+    build_review_chain,
+)
+from app.sections import ProposalSection, segment_proposal
+
+logger = getLogger(__name__)
+
+# Words per shingle and number of shingle hashes kept in the signature of a proposal
+SHINGLE_SIZE = 3
+SIGNATURE_SIZE = 128
+# Number of most recent reviews an upload is compared to when no previous review is given
+MATCH_CANDIDATES = 500
+
+MARKUP_PATTERN = re.compile(r'[*_`#>|]')
+# Models shorten long quotes with an ellipsis
+ELLIPSIS_PATTERN = re.compile(r'\.\.\.|…')
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _normalize_quote(text: str) -> str:
+    # Quotes are compared without markup, whitespace and case, models rarely reproduce them exactly
+    return " ".join(MARKUP_PATTERN.sub(" ", text).split()).casefold()
+
+
+def _quote_in(quote: str, normalized_text: str) -> bool:
+    parts = [_normalize_quote(part) for part in ELLIPSIS_PATTERN.split(quote)]
+    return all(part in normalized_text for part in parts if part)
+
+
+def text_signature(markdown: str) -> List[int]:
+    """Return the smallest hashes of the word shingles of the text, a bottom-k sketch of its shingle set."""
+    words = _normalize_quote(markdown).split()
+    hashes = {
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + SHINGLE_SIZE]).encode(), digest_size=8).digest(), "big")
+        for i in range(max(1, len(words) - SHINGLE_SIZE + 1))
+    }
+    return sorted(hashes)[:SIGNATURE_SIZE]
+
+
+def estimate_similarity(signature: List[int], other: List[int]) -> float:
+    """Estimate the Jaccard similarity of the shingle sets of two texts from their signatures."""
+    if not signature or not other:
+        return 0.0
+    common = set(signature) & set(other)
+    union = sorted(set(signature) | set(other))[:SIGNATURE_SIZE]
+    return sum(1 for value in union if value in common) / len(union)
+
+
+class StoredReview(BaseModel):
+    id: str
+    created_at: float
+    proposal: str
+    issues: Dict[str, List[FeedbackIssue]]
+
+
+class RevisionStore:
+    """
+    SQLite store of finished reviews with their proposal, the issues per reviewer and the signature of the text.
+
+    Only the max_entries most recent reviews are kept.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS reviews (id TEXT PRIMARY KEY, created_at REAL NOT NULL, "
+                "proposal TEXT NOT NULL, issues TEXT NOT NULL, signature TEXT NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS reviews_created_at ON reviews (created_at)")
+
+    def save(self, review_id: str, proposal: str, issues: Dict[str, List[FeedbackIssue]]):
+        serialized = json.dumps({name: [issue.model_dump() for issue in items] for name, items in issues.items()})
+        signature = json.dumps(text_signature(split_figure_inventory(proposal)[0]))
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO reviews (id, created_at, proposal, issues, signature) VALUES (?, ?, ?, ?, ?)",
+                (review_id, time.time(), proposal, serialized, signature),
+            )
+            self._connection.execute(
+                "DELETE FROM reviews WHERE id NOT IN (SELECT id FROM reviews ORDER BY created_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def get(self, review_id: str) -> Optional[StoredReview]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, created_at, proposal, issues FROM reviews WHERE id = ?", (review_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return StoredReview(id=row[0], created_at=row[1], proposal=row[2], issues=json.loads(row[3]))
+
+    def find_similar(self, proposal: str, threshold: float) -> Optional[Tuple[StoredReview, float]]:
+        """Return the most similar recent review with a similarity of at least threshold, if any."""
+        signature = text_signature(split_figure_inventory(proposal)[0])
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, signature FROM reviews ORDER BY created_at DESC LIMIT ?", (MATCH_CANDIDATES,)
+            ).fetchall()
+        best_id, best_similarity = None, 0.0
+        for review_id, other in rows:
+            similarity = estimate_similarity(signature, json.loads(other))
+            if similarity > best_similarity:
+                best_id, best_similarity = review_id, similarity
+        if best_id is None or best_similarity < threshold:
+            return None
+        review = self.get(best_id)
+        return (review, best_similarity) if review is not None else None
+
+    def find_previous(self, proposal: str, previous_id: Optional[str], threshold: float) -> Optional[StoredReview]:
+        """
+        Return the review given by previous_id or else the most similar recent review, if any.
+
+        The review given by previous_id must be as similar as any other match, an unrelated proposal uploaded
+        while an earlier review is shown is no revision of it.
+        """
+        if previous_id:
+            review = self.get(previous_id)
+            if review is not None:
+                similarity = estimate_similarity(
+                    text_signature(split_figure_inventory(proposal)[0]),
+                    text_signature(split_figure_inventory(review.proposal)[0]),
+                )
+                if similarity >= threshold:
+                    logger.info(f"Reviewing a revision of review {previous_id}, similarity {similarity:.2f}")
+                    return review
+                logger.info(f"Not a revision of review {previous_id}, similarity {similarity:.2f} below {threshold}")
+        match = self.find_similar(proposal, threshold)
+        if match is None:
+            return None
+        review, similarity = match
+        logger.info(f"Reviewing a revision of review {review.id}, found by a similarity of {similarity:.2f}")
+        return review
+
+
+class RevisionPlan(BaseModel):
+    """
+    The reviewers of a revision: rerun on their usual input, rerun only on the revised spans of the proposal
+    in excerpts, or carried over because their sections did not change. Local reviewers always run again.
+    """
+    changed_sections: List[str]
+    rerun: List[str]
+    excerpts: Dict[str, List[Tuple[int, int]]]
+    carried_over: List[str]
+
+
+def _units(markdown: str) -> List[ProposalSection]:
+    """Split the markdown at every heading, each unit spans from its heading to the next heading."""
+    sections = segment_proposal(markdown)
+    units = []
+    if not sections or sections[0].start > 0:
+        units.append(ProposalSection(
+            title="Beginning", level=1, start=0, end=sections[0].start if sections else len(markdown)
+        ))
+    for index, section in enumerate(sections):
+        end = sections[index + 1].start if index + 1 < len(sections) else len(markdown)
+        units.append(ProposalSection(title=section.title, level=section.level, start=section.start, end=end))
+    return units
+
+
+def _unit_texts(markdown: str, units: List[ProposalSection]) -> Dict[Tuple[str, int], str]:
+    # Units are identified by their title and its occurrence, since numbered headings repeat titles
+    texts = {}
+    occurrences = {}
+    for unit in units:
+        title = _normalize(unit.title)
+        occurrences[title] = occurrences.get(title, 0) + 1
+        texts[(title, occurrences[title])] = _normalize(markdown[unit.start:unit.end])
+    return texts
+
+
+def _section_texts(markdown: str, names: List[str]) -> Optional[List[str]]:
+    sections = {section.name: section for section in segment_proposal(markdown) if section.name is not None}
+    if any(name not in sections for name in names):
+        return None
+    return [_normalize(markdown[sections[name].start:sections[name].end]) for name in names]
+
+
+def plan_revision(previous_proposal: str, proposal: str) -> RevisionPlan:
+    """Compare a revision to the previously reviewed proposal section by section and plan its review."""
+    previous_text, previous_inventory = split_figure_inventory(previous_proposal)
+    text, inventory = split_figure_inventory(proposal)
+    units = _units(text)
+    previous_texts = _unit_texts(previous_text, _units(previous_text))
+    texts = _unit_texts(text, units)
+    changed = [unit for unit, (key, unit_text) in zip(units, texts.items()) if previous_texts.get(key) != unit_text]
+    proposal_changed = bool(changed) or texts.keys() != previous_texts.keys()
+
+    plan = RevisionPlan(changed_sections=[unit.title for unit in changed], rerun=[], excerpts={}, carried_over=[])
+    for name in REVIEWERS:
+        names = REVIEWER_SECTIONS[name]
+        section_texts = _section_texts(text, names) if names is not None else None
+        previous_section_texts = _section_texts(previous_text, names) if names is not None else None
+        if section_texts is not None and previous_section_texts is not None:
+            reviewer_changed = section_texts != previous_section_texts
+        else:
+            reviewer_changed = proposal_changed or (
+                name in FIGURE_INVENTORY_REVIEWERS and inventory != previous_inventory
+            )
+
+        if not reviewer_changed:
+            plan.carried_over.append(name)
+        elif name in SECTION_SCOPED_REVIEWERS and names is None and len(changed) < len(units):
+            # Only removed sections leave nothing to review, their issues are resolved
+            if changed:
+                plan.excerpts[name] = [(unit.start, unit.end) for unit in changed]
+            else:
+                plan.carried_over.append(name)
+        else:
+            plan.rerun.append(name)
+    return plan
+
+
+def review_revision(proposal: str, previous: StoredReview) -> Iterator[Dict[str, FeedbackIssueChunk]]:
+    """
+    Review a revision of the previously reviewed proposal, streaming chunks per reviewer like the review chain.
+
+    Issues of the previous review whose quote appeared in the previous proposal but no longer appears in the
+    revision are streamed first as resolved. Reviewers whose sections did not change finish right away with
+    their issues carried over. Reviewers scoped to the text they quote keep the issues outside the revised
+    sections and review only those, all other reviewers run again.
+    """
+    start = time.perf_counter()
+    plan = plan_revision(previous.proposal, proposal)
+    logger.info(
+        f"Revision of review {previous.id}: {len(plan.changed_sections)} sections changed, "
+        f"{len(plan.rerun)} of {len(REVIEWERS)} reviewers run again, {len(plan.excerpts)} on the changed sections "
+        f"only, {len(plan.carried_over)} carried over, planned in {(time.perf_counter() - start) * 1000:.0f}ms"
+    )
+
+    text, _ = split_figure_inventory(proposal)
+    normalized = _normalize_quote(text)
+    previous_normalized = _normalize_quote(split_figure_inventory(previous.proposal)[0])
+    for name in REVIEWER_NAMES:
+        issues = previous.issues.get(name, [])
+        # Quotes the model paraphrased were never in the proposal, their absence says nothing about a fix
+        resolved = [
+            issue for issue in issues
+            if issue.quote
+            and _quote_in(issue.quote, previous_normalized)
+            and not _quote_in(issue.quote, normalized)
+        ]
+        found = [issue for issue in issues if issue not in resolved]
+        if name in plan.carried_over:
+            carried_over = found
+        elif name in plan.excerpts:
+            revised = [_normalize_quote(text[span[0]:span[1]]) for span in plan.excerpts[name]]
+            carried_over = [
+                issue for issue in found
+                if issue.quote and not any(_quote_in(issue.quote, excerpt) for excerpt in revised)
+            ]
+        else:
+            carried_over = []
+
+        final = name in plan.carried_over
+        if resolved:
+            yield {name: FeedbackIssueChunk(issues=resolved, status=RESOLVED)}
+        if carried_over or final:
+            yield {name: FeedbackIssueChunk(issues=carried_over, final=final, status=CARRIED_OVER)}
+
+    names = [*LOCAL_REVIEWERS, *plan.rerun, *plan.excerpts]
+    yield from build_review_chain(names).stream({"proposal": proposal, "excerpts": plan.excerpts})
@@ -0,0 +1,191 @@
+import re
+from typing import Callable, List, Optional, Sequence
+from pydantic import BaseModel
+
+
+# Canonical section name -> keywords identifying its heading, checked in order
+SECTION_KEYWORDS = {
+    "abstract": ["abstract"],
+    "introduction": ["introduction"],
+    "problem": ["problem"],
+    "motivation": ["motivation"],
+    "objectives": ["objective", "goal"],
+    "schedule": ["schedule", "timeline", "time plan", "work plan"],
+    "bibliography": ["bibliography", "references"],
+    "transparency": ["transparency", "use of ai", "ai usage", "ai tools"],
+}
+# Canonical section name -> whole titles identifying its heading. An exact title wins over a keyword in an
+# earlier heading, so "Related Work and References" does not take the name of the "References" section.
+SECTION_TITLES = {
+    "bibliography": ["bibliography", "references", "literature", "list of references", "literature list"],
+}
+
+# Markdown headings ("## 1 Introduction") and lines that are bold only ("**1 Introduction**")
+HEADING_PATTERN = re.compile(r'^(?:(#{1,6})[ \t]+(.+?)[ \t#]*|\*\*([^*\n]{1,100})\*\*[ \t]*)$', re.MULTILINE)
+NUMBERING_PATTERN = re.compile(r'^(?:chapter\s+)?(\d+(?:\.\d+)*|[IVX]+)\.?\s+', re.IGNORECASE)
+
+
+class ProposalSection(BaseModel):
+    """A heading of the proposal with the span of markdown it covers, including its subsections."""
+    title: str
+    level: int
+    start: int
+    end: int
+    name: Optional[str] = None
+
+
+def _normalize_title(title: str) -> str:
+    return NUMBERING_PATTERN.sub("", title.replace("*", "").replace("_", "").strip()).lower()
+
+
+def _canonical_name(title: str) -> Optional[str]:
+    title = _normalize_title(title)
+    # Long headings are more likely sentences than section titles
+    if len(title.split()) > 5:
+        return None
+    for name, titles in SECTION_TITLES.items():
+        if title in titles:
+            return name
+    for name, keywords in SECTION_KEYWORDS.items():
+        if any(keyword in title for keyword in keywords):
+            return name
+    return None
+
+
+def _is_exact_title(title: str, name: str) -> bool:
+    return _normalize_title(title) in SECTION_TITLES.get(name, ())
+
+
+def segment_proposal(markdown: str) -> List[ProposalSection]:
+    """
+    Split the markdown of a proposal into sections based on its headings.
+
+    The level of a heading is its markdown level, or the depth of its numbering for bold headings. A
+    section ends at the next heading of the same or a higher level, or at the next recognized proposal
+    section, so a recognized section such as "Objectives" includes its subsections.
+    """
+    headings = []
+    # Canonical name -> index of the heading of the proposal section
+    named = {}
+    for match in HEADING_PATTERN.finditer(markdown):
+        hashes, title, bold_title = match.groups()
+        title = (title or bold_title).strip()
+        if hashes:
+            level = len(hashes)
+        else:
+            numbering = NUMBERING_PATTERN.match(title)
+            level = numbering.group(1).count(".") + 1 if numbering else 1
+
+        # Only the first heading of a proposal section counts, later ones are usually subsections, unless the
+        # later one is the exact title of the section and the first one only contains a keyword
+        name = _canonical_name(title)
+        if name is not None and (name not in named or (
+                _is_exact_title(title, name) and not _is_exact_title(headings[named[name]][2], name))):
+            named[name] = len(headings)
+        headings.append((match.start(), level, title, name))
+    headings = [
+        (start, level, title, name if name is not None and named[name] == index else None)
+        for index, (start, level, title, name) in enumerate(headings)
+    ]
+
+    sections = []
+    for index, (start, level, title, name) in enumerate(headings):
+        end = len(markdown)
+        for next_start, next_level, _, next_name in headings[index + 1:]:
+            if next_level <= level or next_name is not None:
+                end = next_start
+                break
+        sections.append(ProposalSection(title=title, level=level, start=start, end=end, name=name))
+    return sections
+
+
+def format_outline(sections: Sequence[ProposalSection]) -> str:
+    """Format the headings of the proposal as an indented list."""
+    if not sections:
+        return ""
+    min_level = min(section.level for section in sections)
+    return "\n".join(f"{'  ' * (section.level - min_level)}- {section.title}" for section in sections)
+
+
+def route_proposal(markdown: str, sections: Sequence[ProposalSection], names: Optional[Sequence[str]]) -> str:
+    """
+    Build the input for a reviewer that only needs the proposal sections in names.
+
+    Returns the outline of the proposal followed by the requested sections. Falls back to the full
+    markdown if names is None or any requested section cannot be located.
+    """
+    if names is None:
+        return markdown
+
+    sections_by_name = {section.name: section for section in sections if section.name is not None}
+    if any(name not in sections_by_name for name in names):
+        return markdown
+
+    return format_excerpts(
+        markdown, sections, [sections_by_name[name] for name in names],
+        "Excerpt of the proposal containing the sections relevant for this review",
+    )
+
+
+def format_excerpts(
+    markdown: str, sections: Sequence[ProposalSection], excerpts: Sequence[ProposalSection], description: str
+) -> str:
+    """Format the outline of the proposal followed by the given sections in document order."""
+    return (
+        "Outline of the full proposal:\n"
+        + format_outline(sections)
+        + f"\n\n{description}:\n\n"
+        + "\n\n".join(
+            markdown[section.start:section.end].strip() for section in sorted(excerpts, key=lambda s: s.start)
+        )
+        + "\n"
+    )
+
+
+def _split_block(block: str, max_tokens: int, count_tokens: Callable[[str], int]) -> List[str]:
+    """Split a block longer than max_tokens at line breaks, and lines still too long at spaces."""
+    if count_tokens(block) <= max_tokens:
+        return [block]
+    separator = "\n" if "\n" in block else " "
+    parts = block.split(separator)
+    if len(parts) == 1:
+        # A single word longer than a chunk, i.e. base64 data, is split by characters
+        middle = len(block) // 2
+        return (
+            _split_block(block[:middle], max_tokens, count_tokens)
+            + _split_block(block[middle:], max_tokens, count_tokens)
+        )
+    middle = len(parts) // 2
+    return (
+        _split_block(separator.join(parts[:middle]), max_tokens, count_tokens)
+        + _split_block(separator.join(parts[middle:]), max_tokens, count_tokens)
+    )
+
+
+def split_markdown(markdown: str, max_tokens: int, count_tokens: Callable[[str], int]) -> List[str]:
+    """
+    Split the markdown into chunks of at most max_tokens tokens as counted by count_tokens.
+
+    Chunks end at paragraphs and start at a heading once they are half full, so sections stay together where
+    possible. Paragraphs longer than a chunk are split at line breaks and, as a last resort, within lines.
+    """
+    blocks = []
+    for block in re.split(r'\n[ \t]*\n', markdown):
+        if block.strip():
+            blocks.extend((part, count_tokens(part)) for part in _split_block(block, max_tokens, count_tokens))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for block, tokens in blocks:
+        # The blank line between two blocks is about one token
+        full = current_tokens + tokens + 1 > max_tokens
+        at_heading = HEADING_PATTERN.match(block) is not None and current_tokens * 2 >= max_tokens
+        if current and (full or at_heading):
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(block)
+        current_tokens += tokens + 1
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
@@ -16,18 +16,101 @@ class Settings(BaseSettings):
     IMAGE_MODEL_NAME: str = ""
     FORMAT_MODEL_NAME: str = ""
 
+    # Context window of MODEL_NAME in tokens, 0 to derive it from the model name. Reviewer prompts are checked
+    # against the context window minus REVIEW_OUTPUT_TOKENS for the answer and against REVIEW_MAX_INPUT_TOKENS,
+    # if set, to bound the cost of a call. Longer inputs are reviewed in chunks, REVIEW_CHUNK_CONCURRENCY at a time.
+    MODEL_CONTEXT_WINDOW: int = 0
+    REVIEW_OUTPUT_TOKENS: int = 4096
+    REVIEW_MAX_INPUT_TOKENS: int = 0
+    REVIEW_CHUNK_CONCURRENCY: int = 4
+
+    # Seconds the model lists of the providers are cached on disk
+    MODEL_CATALOG_TTL: int = 24 * 60 * 60
+
+    # Maximum number of images described in parallel by the image model
+    IMAGE_DESCRIPTION_CONCURRENCY: int = 8
+
+    # Images are downscaled to IMAGE_MAX_SIZE pixels on their longer edge before they are described, images
+    # with a longer edge below IMAGE_MIN_SIZE pixels or a gray level entropy below IMAGE_MIN_ENTROPY bits
+    # are dropped
+    IMAGE_MAX_SIZE: int = 1024
+    IMAGE_MIN_SIZE: int = 48
+    IMAGE_MIN_ENTROPY: float = 0.5
+
+    # Maximum number of chunks formatted by the format model in parallel, pages failing the quality checks of
+    # the local cleanup are sent to the format model in chunks of at most FORMAT_CHUNK_LINES lines
+    PAGE_CLEANUP_CONCURRENCY: int = 8
+    FORMAT_CHUNK_LINES: int = 60
+
+    # Directory for persistent caches, i.e. image descriptions and converted PDFs
+    CACHE_DIR: str = ".cache"
+    CONVERSION_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # Reviewer result cache backend: "sqlite" (persistent), "memory" (in-process LRU) or "none"
+    REVIEW_CACHE_BACKEND: str = "sqlite"
+    REVIEW_CACHE_MAX_ENTRIES: int = 10000
+
+    # Reviewer prompt layout: "rubric_first" (rubric, then proposal excerpt) or "shared_prefix"
+    # (shared instructions and full proposal first, rubric last) to benefit from provider prompt caching
+    PROMPT_LAYOUT: str = "rubric_first"
+
+    # Seconds after which a Langfuse prompt is refreshed in the background, and how long startup waits
+    # for the initial fetch of all prompts before serving the local prompts
+    PROMPT_REFRESH_SECONDS: int = 30
+    PROMPT_PREFETCH_TIMEOUT: float = 10
+
+    # Optional base URL of an OpenAI-compatible Batch API, i.e. a local stand-in server for testing
+    BATCH_API_BASE_URL: str = ""
+
+    # Review job queue of the web interface: directory of the job database and uploads, number of
+    # reviews processed at the same time, and number of waiting jobs after which uploads are rejected
+    JOB_DIR: str = ".jobs"
+    JOB_WORKERS: int = 2
+    JOB_QUEUE_MAX_DEPTH: int = 20
+
+    # Uploads whose text is at least this similar to an earlier review are reviewed as its revision, only the
+    # reviewers of changed sections run again. The REVISION_STORE_MAX_ENTRIES most recent reviews are kept.
+    REVISION_MATCH_THRESHOLD: float = 0.5
+    REVISION_STORE_MAX_ENTRIES: int = 1000
+
+    # Files of each review in JOB_DIR, i.e. the upload, the converted markdown and exported reports, are removed
+    # ARTIFACT_TTL seconds after their last change or, least recently changed first, once all of them exceed
+    # ARTIFACT_MAX_BYTES. The janitor runs every ARTIFACT_CLEANUP_INTERVAL seconds. Exported reports of at most
+    # DOWNLOAD_INLINE_MAX_BYTES are sent to the browser from memory instead of as a file.
+    ARTIFACT_MAX_BYTES: int = 1024 * 1024 * 1024
+    ARTIFACT_TTL: int = 7 * 24 * 60 * 60
+    ARTIFACT_CLEANUP_INTERVAL: int = 600
+    DOWNLOAD_INLINE_MAX_BYTES: int = 1024 * 1024
+
+    # HTTP connection pool shared by all models and timeouts of model calls in seconds
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 60
+    HTTP_TIMEOUT: float = 300
+    HTTP_CONNECT_TIMEOUT: float = 10
+
+    # Rate limits per provider are shared by all models of the provider, 0 means unlimited
+
     # Non-Azure OpenAI
     OPENAI_API_KEY: str = ""
+    OPENAI_REQUESTS_PER_MINUTE: int = 0
+    OPENAI_TOKENS_PER_MINUTE: int = 0
 
     # Azure OpenAI
     OPENAI_API_VERSION: str = ""
     AZURE_OPENAI_ENDPOINT: str = ""
     AZURE_OPENAI_API_KEY: str = ""
+    AZURE_OPENAI_REQUESTS_PER_MINUTE: int = 0
+    AZURE_OPENAI_TOKENS_PER_MINUTE: int = 0
 
     # Ollama settings
     OLLAMA_BASIC_AUTH_USERNAME: str = ""
     OLLAMA_BASIC_AUTH_PASSWORD: str = ""
     OLLAMA_HOST: str = ""
+    # Context window Ollama models are run with, Ollama's own default is a few thousand tokens
+    OLLAMA_CONTEXT_WINDOW: int = 8192
+    OLLAMA_REQUESTS_PER_MINUTE: int = 0
+    OLLAMA_TOKENS_PER_MINUTE: int = 0
 
     LANGFUSE_PUBLIC_KEY: str = ""
     LANGFUSE_SECRET_KEY: str = ""
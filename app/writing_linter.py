@@ -0,0 +1,304 @@
+import re
+from bisect import bisect_right
+from logging import getLogger
+from typing import Iterator, List, Optional, Sequence
+from pydantic import BaseModel
+
+from app.feedback import FeedbackIssue
+from app.markdown_cleanup import OCR_BLOCK_PATTERN
+from app.sections import NUMBERING_PATTERN, ProposalSection, segment_proposal
+
+logger = getLogger(__name__)
+
+# Rules quoted from how-to-scientific-writing.md
+FILLER_RULE = "Avoid filler words (e.g., “actually”, “clearly”, “obviously”)."
+TRANSITION_RULE = (
+    "Limit the use of filler words such as “additional,” “furthermore,” “moreover,” and “also”; "
+    "only use them when necessary."
+)
+SUPERLATIVE_RULE = "Avoid strong statements and superlatives (e.g., “very”, “wide”, “optimal”)."
+CONTRACTION_RULE = "Avoid contractions (e.g., use “do not” instead of “don’t” and “it is” instead of “it’s”)."
+SENTENCE_START_RULE = "Do not start sentences with “As…”, “Since…”, “To…”, “In order to…”, or “Because…”."
+PRONOUN_RULE = (
+    "Use active formulations, avoid passive voice, “one,” “I,” and “our.” "
+    "Use “we” sparingly, only when referring to the thesis’ approach."
+)
+CITATION_RULE = (
+    "The citation should be placed before the full stop (e.g., some example text [AB12].) "
+    "and not after the full stop."
+)
+PARAGRAPH_RULE = "Paragraphs should have a balanced length, approximately 5-10 lines."
+
+FILLER_PATTERN = re.compile(r'\b(actually|clearly|obviously|basically|really|simply)\b', re.IGNORECASE)
+# Only transitions opening a sentence, "also" inside a sentence is too common to report every time
+TRANSITION_PATTERN = re.compile(r'^(Furthermore|Moreover|Additionally|Also|In addition)\b')
+SUPERLATIVE_PATTERN = re.compile(
+    r'\b(very|extremely|wide|widely|optimal|optimally|best|perfect|perfectly|huge|enormous)\b', re.IGNORECASE
+)
+CONTRACTION_PATTERN = re.compile(
+    r"\b(\w+n['’]t|(?:it|that|there|what|let|here|who)['’]s|\w+['’](?:re|ve|ll|d|m))\b", re.IGNORECASE
+)
+SENTENCE_START_PATTERN = re.compile(r'^[*_]*(As|Since|To|In order to|Because)\b')
+PRONOUN_PATTERN = re.compile(
+    r'\b(I(?!/)|[Oo]ur|[Oo]ne (?:can|could|may|might|must|should|would|needs|has to|will))\b'
+)
+# "I" as a roman numeral, i.e. "Phase I"
+NUMERAL_CONTEXT_PATTERN = re.compile(r'\b(?:Phase|Part|Type|Level|Stage|Chapter|Appendix|Section|Step|Class)\s+$')
+# A citation after the full stop, alpha style ("[ABC12]") or numeric ("[3, 4]"), but not a markdown link
+CITATION_AFTER_PERIOD_PATTERN = re.compile(
+    r'\.[ \t]*(\[(?:[A-Z][A-Za-z+]{0,5}\d{2}[a-z]?|\d{1,3})(?:[,;][ \t]*(?:[A-Z][A-Za-z+]{0,5}\d{2}[a-z]?|\d{1,3}))*\])'
+    r'(?!\()'
+)
+
+# Abbreviations whose period does not end a sentence
+ABBREVIATIONS = ("e.g.", "i.e.", "et al.", "etc.", "vs.", "cf.", "Fig.", "Tab.", "Sec.", "Eq.", "approx.", "resp.")
+SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?])(?:[ \t]*\[[^\]\n]{1,40}\])?\s+(?=[*_“"(\[]*[A-Z0-9])')
+PARAGRAPH_SPLIT_PATTERN = re.compile(r'\n[ \t]*\n')
+STRUCTURE_LINE_PATTERN = re.compile(r'^\s*(#{1,6}\s|\||```|~~~|!\[|[-*+]\s|\d{1,3}[.)]\s)')
+CODE_FENCE_PATTERN = re.compile(r'^\s*(```|~~~)', re.MULTILINE)
+
+# Approximate characters per printed line, used to estimate the length of paragraphs in lines
+CHARACTERS_PER_LINE = 90
+MIN_PARAGRAPH_LINES = 5
+MAX_PARAGRAPH_LINES = 10
+# Most occurrences per rule, the report should point out the pattern, not list every instance
+MAX_ISSUES_PER_RULE = 10
+MAX_QUOTE_LENGTH = 300
+
+
+class Sentence(BaseModel):
+    """A sentence of the proposal with its offset in the markdown."""
+    text: str
+    start: int
+
+
+class Paragraph(BaseModel):
+    """A prose paragraph of the proposal with its sentences and its offset in the markdown."""
+    text: str
+    start: int
+    sentences: List[Sentence]
+
+
+class TextIndex:
+    """
+    Paragraphs and sentences of the proposal prose, with the section each belongs to.
+
+    Headings, lists, tables, code, images and OCR image descriptions are not prose and are left out, as are
+    the bibliography and any text before the first heading, i.e. the title page.
+    """
+
+    def __init__(self, markdown: str):
+        self.sections = segment_proposal(markdown)
+        self._section_starts = [section.start for section in self.sections]
+        self.paragraphs = [
+            paragraph for paragraph in self._paragraphs(markdown)
+            if (section := self.section_at(paragraph.start)) is not None and section.name != "bibliography"
+        ]
+
+    def section_at(self, offset: int) -> Optional[ProposalSection]:
+        """Return the innermost section containing offset, None before the first heading."""
+        index = bisect_right(self._section_starts, offset) - 1
+        while index >= 0:
+            section = self.sections[index]
+            if section.end > offset:
+                # Text of a recognized section belongs to it, even inside its subsections
+                for outer in reversed(self.sections[:index + 1]):
+                    if outer.name is not None and outer.start <= offset < outer.end:
+                        return outer
+                return section
+            index -= 1
+        return None
+
+    def section_title(self, offset: int) -> str:
+        section = self.section_at(offset)
+        if section is None:
+            return "General"
+        return NUMBERING_PATTERN.sub("", section.title.replace("*", "")).strip() or section.title
+
+    @staticmethod
+    def _paragraphs(markdown: str) -> Iterator[Paragraph]:
+        # Blank out OCR image descriptions so offsets stay valid
+        markdown = OCR_BLOCK_PATTERN.sub(lambda match: re.sub(r'[^\n]', " ", match.group(0)), markdown)
+        position = 0
+        for block in PARAGRAPH_SPLIT_PATTERN.split(markdown):
+            start = markdown.index(block, position)
+            position = start + len(block)
+            if CODE_FENCE_PATTERN.search(block):
+                continue
+            # Prose directly below a heading or a list, without a blank line, is a paragraph of its own.
+            # Indented lines after a structure line continue it, i.e. wrapped list items.
+            prose_start = line_start = start
+            in_structure = False
+            for line in block.split("\n"):
+                if STRUCTURE_LINE_PATTERN.match(line) or (in_structure and line[:1].isspace()):
+                    yield from _paragraph(markdown, prose_start, line_start)
+                    prose_start = line_start + len(line) + 1
+                    in_structure = True
+                else:
+                    in_structure = False
+                line_start += len(line) + 1
+            yield from _paragraph(markdown, prose_start, position)
+
+
+def _paragraph(markdown: str, start: int, end: int) -> Iterator[Paragraph]:
+    """Yield the prose between start and end as a paragraph, unless it is blank."""
+    block = markdown[start:end]
+    text = block.strip()
+    if text:
+        start += block.index(text)
+        yield Paragraph(text=text, start=start, sentences=list(_split_sentences(text, start)))
+
+
+def _split_sentences(text: str, offset: int) -> Iterator[Sentence]:
+    start = 0
+    for match in SENTENCE_END_PATTERN.finditer(text):
+        candidate = text[start:match.start()]
+        if candidate.endswith(ABBREVIATIONS):
+            continue
+        yield Sentence(text=candidate.strip(), start=offset + start)
+        start = match.end()
+    if text[start:].strip():
+        yield Sentence(text=text[start:].strip(), start=offset + start)
+
+
+def _quote(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= MAX_QUOTE_LENGTH else text[:MAX_QUOTE_LENGTH - 1] + "…"
+
+
+def _matched_words(pattern: re.Pattern, text: str) -> List[str]:
+    words = []
+    for match in pattern.finditer(text):
+        word = match.group(1)
+        # "I" in "Phase I" is a numeral, not a pronoun
+        if word == "I" and NUMERAL_CONTEXT_PATTERN.search(text[:match.start()]):
+            continue
+        if word not in words:
+            words.append(word)
+    return words
+
+
+def _quoted(words: Sequence[str]) -> str:
+    return ", ".join(f"“{word}”" for word in words)
+
+
+def _sentence_issues(index: TextIndex) -> Iterator[FeedbackIssue]:
+    # One issue per sentence and rule, naming all offending words of the sentence
+    for paragraph in index.paragraphs:
+        for sentence in paragraph.sentences:
+            section = index.section_title(sentence.start)
+            text = sentence.text
+
+            fillers = _matched_words(FILLER_PATTERN, text)
+            if fillers:
+                yield FeedbackIssue(
+                    section=section, category="Word Choice", priority="Low", quote=_quote(text),
+                    issue=f"The filler words {_quoted(fillers)} add no information."
+                    if len(fillers) > 1 else f"The filler word {_quoted(fillers)} adds no information.",
+                    suggestion=f"Remove {_quoted(fillers)} or replace it with a concrete statement.",
+                    rule=FILLER_RULE,
+                )
+            transition = TRANSITION_PATTERN.match(text)
+            if transition:
+                yield FeedbackIssue(
+                    section=section, category="Word Choice", priority="Very Low", quote=_quote(text),
+                    issue=f"The sentence starts with the filler word “{transition.group(1)}”.",
+                    suggestion="Remove the transition word if the sentence connects to the previous one without it.",
+                    rule=TRANSITION_RULE,
+                )
+            superlatives = _matched_words(SUPERLATIVE_PATTERN, text)
+            if superlatives:
+                yield FeedbackIssue(
+                    section=section, category="Word Choice", priority="Low", quote=_quote(text),
+                    issue=f"{_quoted(superlatives)} make the statement too strong."
+                    if len(superlatives) > 1 else f"{_quoted(superlatives)} makes the statement too strong.",
+                    suggestion=f"Remove {_quoted(superlatives)} or back the claim with a measurable fact or a "
+                    "citation.",
+                    rule=SUPERLATIVE_RULE,
+                )
+            contractions = _matched_words(CONTRACTION_PATTERN, text)
+            if contractions:
+                yield FeedbackIssue(
+                    section=section, category="Grammar", priority="Low", quote=_quote(text),
+                    issue=f"The sentence uses the contractions {_quoted(contractions)}."
+                    if len(contractions) > 1 else f"The sentence uses the contraction {_quoted(contractions)}.",
+                    suggestion=f"Write {_quoted(contractions)} out in full.",
+                    rule=CONTRACTION_RULE,
+                )
+            start = SENTENCE_START_PATTERN.match(text)
+            if start:
+                yield FeedbackIssue(
+                    section=section, category="Sentence Structure", priority="Low", quote=_quote(text),
+                    issue=f"The sentence starts with “{start.group(1)}”.",
+                    suggestion="Start with the subject performing the action and move the subordinate clause "
+                    "to the end.",
+                    rule=SENTENCE_START_RULE,
+                )
+            # "one can" and "one should" both name "one"
+            pronouns = list(dict.fromkeys(words.split()[0] for words in _matched_words(PRONOUN_PATTERN, text)))
+            if pronouns:
+                yield FeedbackIssue(
+                    section=section, category="Pronoun Usage", priority="Medium", quote=_quote(text),
+                    issue=f"The sentence uses {_quoted(pronouns)}, which scientific writing avoids.",
+                    suggestion="Use an active formulation with a concrete actor, or “we” for the approach of "
+                    "the thesis.",
+                    rule=PRONOUN_RULE,
+                )
+
+        for match in CITATION_AFTER_PERIOD_PATTERN.finditer(paragraph.text):
+            context_start = paragraph.text.rfind(" ", 0, max(match.start() - 40, 0)) + 1
+            yield FeedbackIssue(
+                section=index.section_title(paragraph.start + match.start()),
+                category="Citations", priority="Low",
+                quote=_quote(paragraph.text[context_start:match.end()]),
+                issue=f"The citation {match.group(1)} is placed after the full stop.",
+                suggestion=f"Move {match.group(1)} before the full stop, i.e. “… text {match.group(1)}.”",
+                rule=CITATION_RULE,
+            )
+
+
+def _paragraph_issues(index: TextIndex) -> Iterator[FeedbackIssue]:
+    for paragraph in index.paragraphs:
+        lines = len(paragraph.text) / CHARACTERS_PER_LINE
+        if MIN_PARAGRAPH_LINES <= lines <= MAX_PARAGRAPH_LINES:
+            continue
+        too_short = lines < MIN_PARAGRAPH_LINES
+        # Single short sentences are usually captions or lead-ins to a list
+        if too_short and len(paragraph.sentences) < 2:
+            continue
+        yield FeedbackIssue(
+            section=index.section_title(paragraph.start),
+            category="Paragraph Structure",
+            priority="Low",
+            quote=_quote(paragraph.sentences[0].text),
+            issue=f"The paragraph starting here is shorter than {MIN_PARAGRAPH_LINES} lines."
+            if too_short else f"The paragraph starting here is about {round(lines)} lines long.",
+            suggestion="Merge it with an adjacent paragraph or develop its point further."
+            if too_short else "Split the paragraph at a change of topic.",
+            rule=PARAGRAPH_RULE,
+        )
+
+
+def _limit_per_rule(issues: Sequence[FeedbackIssue]) -> List[FeedbackIssue]:
+    counts = {}
+    limited = []
+    for issue in issues:
+        counts[issue.rule] = counts.get(issue.rule, 0) + 1
+        if counts[issue.rule] <= MAX_ISSUES_PER_RULE:
+            limited.append(issue)
+    for rule, count in counts.items():
+        if count > MAX_ISSUES_PER_RULE:
+            logger.info(f"Reporting {MAX_ISSUES_PER_RULE} of {count} occurrences of the rule “{rule}”")
+    return limited
+
+
+def lint_proposal(markdown: str) -> List[FeedbackIssue]:
+    """
+    Check the proposal against the mechanical rules of the writing guide without calling a model.
+
+    Reports filler words, superlatives, contractions, sentences starting with "As", "Since", "To",
+    "In order to" or "Because", the pronouns "I", "one" and "our", citations after the full stop, and
+    paragraphs that are too short or too long. At most MAX_ISSUES_PER_RULE issues are reported per rule.
+    """
+    index = TextIndex(markdown)
+    return _limit_per_rule([*_sentence_issues(index), *_paragraph_issues(index)])
@@ -0,0 +1,112 @@
+"""
+Benchmark the image placeholder rewriting of the PDF converter.
+
+Compares the previous approach (embedding base64 images into the markdown and replacing them one at a time
+with re.search/str.replace) against the single-pass rewrite in app.pdf_converter. The image and format
+models are replaced by the fake provider, so only local CPU time and memory are measured.
+
+Usage:
+    poetry run python benchmarks/pdf_image_rewrite.py [path/to/proposal.pdf]
+
+Without a path, a 60-page figure-heavy PDF is generated.
+"""
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.update({
+    "MODEL_NAME": "fake:benchmark",
+    "IMAGE_MODEL_NAME": "fake:benchmark",
+    "FORMAT_MODEL_NAME": "fake:benchmark",
+    "LANGFUSE_PUBLIC_KEY": "",
+})
+
+PAGES = 60
+FIGURES_PER_PAGE = 3
+
+
+def generate_pdf(path: str):
+    import pymupdf
+
+    doc = pymupdf.open()
+    for page_number in range(PAGES):
+        page = doc.new_page()
+        page.insert_text((72, 60), f"Section {page_number}\n" + "Lorem ipsum dolor sit amet. " * 3, fontsize=10)
+        for figure in range(FIGURES_PER_PAGE):
+            # Noise does not compress, which approximates photos and screenshots in real proposals
+            pixmap = pymupdf.Pixmap(pymupdf.csRGB, 400, 200, os.urandom(400 * 200 * 3), False)
+            top = 120 + figure * 220
+            page.insert_image(pymupdf.Rect(72, top, 372, top + 150), pixmap=pixmap)
+        page.insert_text((300, 820), str(page_number + 1))
+    doc.save(path)
+
+
+def run_legacy(path: str):
+    import pymupdf4llm
+
+    md_text = pymupdf4llm.to_markdown(path, embed_images=True)
+    md_text = re.sub(r'^(.*?\n){4}', '', md_text)
+    md_text = re.sub(r'\n\d+\n', '\n', md_text)
+    while "![]" in md_text:
+        data = re.search(r'!\[\]\((.*?)\n\)', md_text)
+        description = "<<< OCR IMAGE DESCRIPTION START >>>\nfake response\n<<< OCR IMAGE DESCRIPTION END >>>\n"
+        md_text = md_text.replace(data.group(0), description)
+    return md_text
+
+
+def run_single_pass(path: str):
+    from app.pdf_converter import convert_pdf_to_clean_markdown
+
+    return convert_pdf_to_clean_markdown(path)
+
+
+def measure(mode: str, path: str):
+    """Run one mode in this process and print its CPU time and peak RSS."""
+    # Import everything up front so the measured delta only covers the conversion itself
+    import pymupdf4llm  # noqa: F401
+    if mode == "single-pass":
+        # Keep the image description cache out of the measurement
+        os.environ["CACHE_DIR"] = tempfile.mkdtemp()
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import app.pdf_converter
+
+        # The fake provider has no structured output, pages the local cleanup cannot fix are kept as they are
+        app.pdf_converter._format_chunk = lambda chunk, config: chunk
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_cpu = time.process_time()
+    start_wall = time.perf_counter()
+    if mode == "legacy":
+        run_legacy(path)
+    else:
+        run_single_pass(path)
+    cpu = time.process_time() - start_cpu
+    wall = time.perf_counter() - start_wall
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{mode:<12} cpu={cpu:7.2f}s wall={wall:7.2f}s peak_rss={peak_rss / 1024:8.1f}MiB "
+          f"(+{(peak_rss - baseline_rss) / 1024:.1f}MiB)")
+
+
+def main():
+    if len(sys.argv) == 3:
+        measure(sys.argv[1], sys.argv[2])
+        return
+
+    if len(sys.argv) == 2:
+        path = sys.argv[1]
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "figure-heavy.pdf")
+        generate_pdf(path)
+        print(f"Generated {PAGES}-page PDF with {PAGES * FIGURES_PER_PAGE} figures: {path}")
+
+    # Each mode runs in a fresh interpreter so peak RSS is not shared between runs
+    for mode in ("legacy", "single-pass"):
+        subprocess.run([sys.executable, __file__, mode, path], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark the rendering and export of feedback reports.
+
+Compares the previous approach, which regrouped the issues for the text report with repeated string
+concatenation and wrote the JSON and text downloads to disk whenever a reviewer finished, against the
+report model of app.report, which groups the issues once, renders each format into a list buffer and writes
+exports only when they are downloaded. Reports of synthetic issues are measured, no models are called.
+
+Usage:
+    poetry run python benchmarks/report_rendering.py [number of issues ...]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.artifacts import ArtifactStore  # noqa: E402
+from app.report import PRIORITY_ORDER, REPORT_FORMATS, Report, ReportCache  # noqa: E402
+
+ISSUE_COUNTS = [int(count) for count in sys.argv[1:]] or [1000, 5000]
+REVIEWERS = 10
+SECTIONS = ["Abstract", "Introduction", "Problem", "Motivation", "Objectives", "Schedule", "Bibliography", "General"]
+RUNS = 5
+
+
+def generate_issues(count: int):
+    rng = random.Random(count)
+    return [
+        {
+            "section": rng.choice(SECTIONS),
+            "category": rng.choice(["Clarity", "Structure", "Citations", "Figures", "Grammar"]),
+            "priority": rng.choice(PRIORITY_ORDER),
+            "quote": " ".join(rng.choice(["the", "system", "proposal", "we", "show", "results"]) for _ in range(20)),
+            "issue": "The sentence is vague and does not say what exactly is improved. " * 2,
+            "suggestion": "Name the component and quantify the improvement with the results of the evaluation.",
+            "rule": "Be precise: avoid vague words such as 'very', 'better' or 'some'.",
+        }
+        for _ in range(count)
+    ]
+
+
+def legacy_text(issues):
+    """The text report before the report model, regrouping the issues and concatenating strings."""
+    sections = {}
+    for issue in issues:
+        section = issue.get('section', 'General')
+        if section not in sections:
+            sections[section] = {priority: [] for priority in PRIORITY_ORDER}
+        sections[section][issue.get('priority', 'Medium')].append(issue)
+
+    priority_symbols = {'Very High': '!!!', 'High': '!!', 'Medium': '!', 'Low': '-', 'Very Low': '.'}
+    text_output = "PROPOSAL FEEDBACK REPORT\n"
+    text_output += "=" * 50 + "\n\n"
+    text_output += f"Total Issues Found: {len(issues)}\n\n"
+    for section, section_issues in sections.items():
+        text_output += f"SECTION: {section.upper()}\n"
+        text_output += "-" * (len(section) + 9) + "\n\n"
+        for priority in PRIORITY_ORDER:
+            if section_issues[priority]:
+                text_output += f"{priority_symbols[priority]} {priority.upper()} PRIORITY\n\n"
+                for i, issue in enumerate(section_issues[priority], 1):
+                    text_output += f"{i}. {issue['category'].upper()}\n"
+                    text_output += "   " + "=" * len(issue['category']) + "\n\n"
+                    if issue.get('quote'):
+                        text_output += "   QUOTE:\n"
+                        text_output += f'   "{issue["quote"]}"\n\n'
+                    text_output += "   ISSUE:\n"
+                    text_output += f"   {issue['issue']}\n\n"
+                    text_output += "   SUGGESTION:\n"
+                    text_output += f"   {issue['suggestion']}\n\n"
+                    if issue.get('rule'):
+                        text_output += "   WRITING RULE:\n"
+                        text_output += f"   {issue['rule']}\n\n"
+                    text_output += "   " + "-" * 60 + "\n\n"
+                text_output += "\n"
+        text_output += "\n"
+    return text_output
+
+
+def legacy_downloads(issues, directory: str):
+    """Write both downloads once per finished reviewer, as the interface did for every upload."""
+    per_reviewer = len(issues) // REVIEWERS
+    for finished in range(1, REVIEWERS + 1):
+        shown = issues[:finished * per_reviewer]
+        with open(os.path.join(directory, "report.json"), "w") as json_file:
+            json_file.write(json.dumps(shown, indent=2))
+        with open(os.path.join(directory, "report.txt"), "w") as text_file:
+            text_file.write(legacy_text(shown))
+
+
+def report_downloads(issues, directory: str, downloads: int):
+    """Follow the review like the interface and export the finished report in each format downloads times."""
+    cache = ReportCache(ArtifactStore(directory, max_bytes=2 ** 40, ttl=3600), max_reviews=1)
+    per_reviewer = len(issues) // REVIEWERS
+    for finished in range(1, REVIEWERS + 1):
+        cache.render("review", issues[:finished * per_reviewer])
+    for _ in range(downloads):
+        for format_name in REPORT_FORMATS:
+            cache.export("review", issues, format_name)
+
+
+def best_time(function, *args):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    for count in ISSUE_COUNTS:
+        issues = generate_issues(count)
+        print(f"{count} issues")
+
+        assert legacy_text(issues) == Report(issues).render("Text")
+        legacy = best_time(legacy_text, issues)
+        report = best_time(lambda: Report(issues).render("Text"))
+        print(f"  text report       legacy={legacy * 1000:8.1f}ms report={report * 1000:8.1f}ms")
+
+        built = Report(issues)
+        for format_name in REPORT_FORMATS:
+            first = best_time(lambda: Report(issues).render(format_name))
+            cached = best_time(built.render, format_name)
+            size = len(built.render(format_name).encode())
+            print(f"  {format_name:<8} render={first * 1000:8.1f}ms cached={cached * 1000:8.3f}ms "
+                  f"size={size / 1024:8.0f}KiB")
+
+        with tempfile.TemporaryDirectory() as directory:
+            legacy = best_time(legacy_downloads, issues, directory)
+            not_downloaded = best_time(report_downloads, issues, directory, 0)
+            downloaded = best_time(report_downloads, issues, directory, 3)
+        print(f"  review downloads  legacy={legacy * 1000:8.1f}ms report={not_downloaded * 1000:8.1f}ms "
+              f"(never downloaded), {downloaded * 1000:8.1f}ms (every format downloaded 3 times)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark the per-request overhead of the review pipeline outside of the model calls themselves.
+
+Compares the previous behavior with the shared components:
+- Review chain: built for every request vs. built once at import
+- Reviewer prompts: all ten templates parsed on every request vs. built once per template
+- HTTP: the main, image and format models with one connection pool each, or a new model instance per
+  request, vs. a single shared keep-alive pool
+
+The model calls go to a local OpenAI-compatible server that answers immediately, so only client-side
+overhead and connection setup are measured.
+
+Usage:
+    poetry run python benchmarks/request_overhead.py [requests]
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+# Calls per review request: one image description, one formatting pass and ten reviewers in parallel
+REVIEWER_CALLS = 10
+connections = 0
+connections_lock = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, Nagle's algorithm would delay every response
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        global connections
+        super().setup()
+        with connections_lock:
+            connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        model = {"id": "benchmark", "object": "model", "created": 0, "owned_by": "benchmark"}
+        self._send_json({"object": "list", "data": [model]})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._send_json({
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "benchmark",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+os.environ.update({
+    "MODEL_NAME": "openai:benchmark",
+    "IMAGE_MODEL_NAME": "openai:benchmark",
+    "FORMAT_MODEL_NAME": "openai:benchmark",
+    "OPENAI_API_KEY": "benchmark",
+    "OPENAI_BASE_URL": base_url,
+    "OPENAI_API_BASE": base_url,
+    "REVIEW_CACHE_BACKEND": "none",
+    "CACHE_DIR": tempfile.mkdtemp(),
+    "LANGFUSE_PUBLIC_KEY": "",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_openai import ChatOpenAI  # noqa: E402
+
+from app.models import get_chat_model  # noqa: E402
+from app.prompts.utils import _build_prompt  # noqa: E402
+from app.reviewers import REVIEWERS, build_review_chain, review_chain  # noqa: E402
+
+TEMPLATES = [get_prompt().template for get_prompt in REVIEWERS.values()]
+
+
+def measure(function, repeat: int = REQUESTS) -> float:
+    """Mean milliseconds per call."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def review_request(main_model, image_model, format_model, executor):
+    image_model.invoke("describe")
+    format_model.invoke("format")
+    list(executor.map(lambda _: main_model.invoke("review"), range(REVIEWER_CALLS)))
+
+
+def measure_http(name: str, get_models):
+    global connections
+    with connections_lock:
+        connections = 0
+    latencies = []
+    with ThreadPoolExecutor(max_workers=REVIEWER_CALLS) as executor:
+        for _ in range(REQUESTS):
+            models = get_models()
+            start = time.perf_counter()
+            review_request(*models, executor)
+            latencies.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{name:<40} {statistics.mean(latencies):8.2f} ms/request "
+        f"(p95 {sorted(latencies)[int(len(latencies) * 0.95) - 1]:.2f} ms), {connections} connections"
+    )
+
+
+def main():
+    print(f"{REQUESTS} requests, {REVIEWER_CALLS + 2} model calls each\n")
+
+    print(f"{'Review chain: build per request':<40} {measure(build_review_chain):8.3f} ms/request")
+    print(f"{'Review chain: shared':<40} {measure(lambda: review_chain):8.3f} ms/request")
+    print(
+        f"{'Prompts: build per request':<40} "
+        f"{measure(lambda: [_build_prompt(template) for template in TEMPLATES]):8.3f} ms/request"
+    )
+    print(
+        f"{'Prompts: shared':<40} "
+        f"{measure(lambda: [get_prompt() for get_prompt in REVIEWERS.values()]):8.3f} ms/request\n"
+    )
+
+    legacy_models = (ChatOpenAI(model="benchmark"), ChatOpenAI(model="benchmark"), ChatOpenAI(model="benchmark"))
+    # Warm up all pools so only the steady state is compared
+    with ThreadPoolExecutor(max_workers=REVIEWER_CALLS) as executor:
+        review_request(*legacy_models, executor)
+        review_request(*(get_chat_model("openai:benchmark"),) * 3, executor)
+
+    measure_http("HTTP: new model instances per request", lambda: (ChatOpenAI(model="benchmark"),) * 3)
+    measure_http("HTTP: one pool per model", lambda: legacy_models)
+    measure_http("HTTP: shared pool", lambda: (get_chat_model("openai:benchmark"),) * 3)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark the startup time of the web interface, i.e. importing app.main.
+
+The OpenAI provider is pointed to a local server that answers the model list after a delay, simulating
+a slow provider. Startup is measured with an empty and with a filled model catalog, and with the server
+down. Each measurement runs in a fresh process.
+
+Usage:
+    poetry run python benchmarks/startup.py [delay seconds]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DELAY = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 3
+
+# Prints the import time and whether the libraries of unused providers were loaded
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import app.main
+print(time.perf_counter() - start, "langchain_ollama" in sys.modules)
+"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(DELAY)
+        model = {"id": "benchmark", "object": "model", "created": 0, "owned_by": "benchmark"}
+        body = json.dumps({"object": "list", "data": [model]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def measure(name: str, base_url: str, cache_dir: str):
+    env = {
+        **os.environ,
+        "MODEL_NAME": "openai:benchmark",
+        "IMAGE_MODEL_NAME": "openai:benchmark",
+        "FORMAT_MODEL_NAME": "openai:benchmark",
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_BASE": base_url,
+        "CACHE_DIR": cache_dir,
+        "JOB_DIR": os.path.join(cache_dir, "jobs"),
+        "LANGFUSE_PUBLIC_KEY": "",
+    }
+    times = []
+    for _ in range(RUNS):
+        result = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            print(f"{name:<32} failed: {result.stderr.strip().splitlines()[-1]}")
+            return
+        seconds, ollama_loaded = result.stdout.split()[-2:]
+        times.append(float(seconds))
+    print(f"{name:<32} {min(times):6.2f}s (best of {RUNS}), ollama libraries loaded: {ollama_loaded}")
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    print(f"Model list delay: {DELAY}s\n")
+
+    cache_dir = tempfile.mkdtemp()
+    measure("Provider reachable", base_url, cache_dir)
+    # Fill the model catalog the way the web interface does in the background after startup
+    subprocess.run(
+        [sys.executable, "-c", "from app.models import validate_models; validate_models(['openai:benchmark'])"],
+        cwd=ROOT,
+        env={**os.environ, "OPENAI_API_KEY": "benchmark", "OPENAI_BASE_URL": base_url, "CACHE_DIR": cache_dir},
+        capture_output=True,
+    )
+    measure("Provider reachable, catalog", base_url, cache_dir)
+    server.shutdown()
+    server.server_close()
+    measure("Provider down", base_url, tempfile.mkdtemp())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Local stand-in for the OpenAI Files and Batch API endpoints used by `review-batch --batch-api`.
+
+Batches complete immediately and every request is answered with a single placeholder issue, so the
+batch mode can be exercised without network access or costs.
+
+Usage:
+    python scripts/batch_api_stand_in.py --port 8900
+    BATCH_API_BASE_URL=http://localhost:8900/v1 poetry run review-batch proposals/ --batch-api --poll-interval 1
+"""
+import argparse
+import itertools
+import json
+import re
+import time
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+files = {}
+batches = {}
+ids = itertools.count(1)
+
+
+def _file_object(file_id, filename, purpose, content):
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(content),
+        "created_at": int(time.time()),
+        "filename": filename,
+        "purpose": purpose,
+        "status": "processed",
+    }
+
+
+def _answer(request):
+    issue = {
+        "section": "Stand-in",
+        "category": "Placeholder",
+        "priority": "Very Low",
+        "issue": f"Placeholder answer for {request['custom_id']}",
+        "suggestion": "Run against a real Batch API for actual feedback.",
+    }
+    completion = {
+        "id": f"chatcmpl-{next(ids)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request["body"]["model"],
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": json.dumps({"issues": [issue]})},
+            "finish_reason": "stop",
+        }],
+    }
+    return {
+        "id": f"batch_req_{next(ids)}",
+        "custom_id": request["custom_id"],
+        "response": {"status_code": 200, "request_id": f"req_{next(ids)}", "body": completion},
+        "error": None,
+    }
+
+
+def _run_batch(batch):
+    lines = files[batch["input_file_id"]]["content"].decode().splitlines()
+    requests = [json.loads(line) for line in lines if line.strip()]
+    output = "".join(json.dumps(_answer(request)) + "\n" for request in requests).encode()
+    output_file_id = f"file-{next(ids)}"
+    files[output_file_id] = {
+        "object": _file_object(output_file_id, "output.jsonl", "batch_output", output),
+        "content": output,
+    }
+    batch.update({
+        "status": "completed",
+        "output_file_id": output_file_id,
+        "completed_at": int(time.time()),
+        "request_counts": {"total": len(requests), "completed": len(requests), "failed": 0},
+    })
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        if self.path.endswith("/files"):
+            # Parse the multipart upload with the email parser, the cgi module is gone since Python 3.13
+            header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+            message = BytesParser(policy=default_policy).parsebytes(header + self._read_body())
+            fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+            content = fields["file"].get_payload(decode=True)
+            purpose = fields["purpose"].get_content().strip()
+            file_id = f"file-{next(ids)}"
+            file_object = _file_object(file_id, fields["file"].get_filename(), purpose, content)
+            files[file_id] = {"object": file_object, "content": content}
+            self._send_json(file_object)
+        elif self.path.endswith("/batches"):
+            data = json.loads(self._read_body())
+            batch_id = f"batch_{next(ids)}"
+            batch = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": data["endpoint"],
+                "input_file_id": data["input_file_id"],
+                "completion_window": data["completion_window"],
+                "status": "in_progress",
+                "created_at": int(time.time()),
+                "metadata": data.get("metadata"),
+            }
+            batches[batch_id] = batch
+            _run_batch(batch)
+            self._send_json(batch)
+        else:
+            self._send_json({"error": {"message": "Not found"}}, 404)
+
+    def do_GET(self):
+        content_match = re.search(r"/files/([^/]+)/content$", self.path)
+        batch_match = re.search(r"/batches/([^/]+)$", self.path)
+        if content_match and content_match.group(1) in files:
+            content = files[content_match.group(1)]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        elif batch_match and batch_match.group(1) in batches:
+            self._send_json(batches[batch_match.group(1)])
+        else:
+            self._send_json({"error": {"message": "Not found"}}, 404)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI Batch API.")
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    print(f"Batch API stand-in listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import unittest
+
+from app.markdown_cleanup import clean_page
+
+
+class MergeParagraphsTest(unittest.TestCase):
+    """Paragraphs split by the blank lines pymupdf4llm puts between visual lines are merged again."""
+
+    def test_merges_lowercase_continuation(self):
+        self.assertEqual(clean_page("The system is\n\nfast."), "The system is fast.")
+
+    def test_merges_capitalized_continuation(self):
+        self.assertEqual(
+            clean_page("We measure the latency of\n\nSystem X in production."),
+            "We measure the latency of System X in production.",
+        )
+
+    def test_merges_number_continuation(self):
+        self.assertEqual(clean_page("The results of\n\n2023 were better."), "The results of 2023 were better.")
+
+    def test_merges_citation_continuation(self):
+        self.assertEqual(clean_page("This is very important\n\n[ABC12]."), "This is very important [ABC12].")
+
+    def test_keeps_paragraphs_after_full_stop(self):
+        self.assertEqual(clean_page("The first ends.\n\nThe second starts."), "The first ends.\n\nThe second starts.")
+
+    def test_keeps_heading_separate(self):
+        self.assertEqual(clean_page("## Introduction\n\nThe text starts."), "## Introduction\n\nThe text starts.")
+
+    def test_keeps_bold_heading_separate(self):
+        self.assertEqual(clean_page("**1 Introduction**\n\nThe text starts."), "**1 Introduction**\n\nThe text starts.")
+        self.assertEqual(clean_page("**4.1** Design\n\nThe text starts."), "**4.1** Design\n\nThe text starts.")
+
+    def test_keeps_caption_separate(self):
+        self.assertEqual(
+            clean_page("Figure 1: Overview of the system\n\nThe text starts."),
+            "Figure 1: Overview of the system\n\nThe text starts.",
+        )
+
+    def test_continues_list_item_only_in_lowercase(self):
+        self.assertEqual(clean_page("- the first item of\n\nthe list"), "- the first item of the list")
+        self.assertEqual(clean_page("- an item\n\nThe text starts."), "- an item\n\nThe text starts.")
+
+    def test_keeps_table_separate(self):
+        table = "| a | b |\n|---|---|\n| 1 | 2 |"
+        self.assertEqual(clean_page(f"{table}\n\nThe text starts."), f"{table}\n\nThe text starts.")
+
+
+if __name__ == "__main__":
+    unittest.main()